@@ -0,0 +1,175 @@
+"""
+Benchmark of the greedy PCST loop on a synthetic 50k-edge street network.
+
+Compares the original loop, which ran one shortest path query per remaining
+prize on every iteration, with the ranked pass over a single shortest-path
+tree now used by `gambit.optimizer.greedy_pcst`, and checks both select the
+same tree. The tree-aware strategy (`tree_greedy_pcst`) is timed alongside
+for its speed and fiber km, and the footprint of the networkx graph is set
+against the array-backed `RoadGraph` the optimizer now uses.
+
+    python benchmarks/pcst_shortest_path_tree.py --side 159 --prizes 40
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import networkx as nx
+from shapely.geometry import LineString
+from gambit.optimizer import greedy_pcst, tree_greedy_pcst
+from gambit.roadgraph import RoadGraph
+
+
+def street_grid(side, spacing=100.0, seed=0):
+    """
+    This function generates a jittered square street grid.
+
+    Parameters
+    ----------
+    side : int
+        Number of intersections along each side, 159 gives ~50k edges.
+    spacing : float
+        Block length in metres.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    G : networkx graph
+        Grid keyed by coordinates with segment lengths as weights.
+
+    """
+    rng = np.random.default_rng(seed)
+    jitter = rng.uniform(-0.2, 0.2, size=(side, side, 2)) * spacing
+    G = nx.Graph()
+    for i in range(side):
+        for j in range(side):
+            u = (i * spacing + jitter[i, j, 0], j * spacing + jitter[i, j, 1])
+            for di, dj in ((1, 0), (0, 1)):
+                if i + di < side and j + dj < side:
+                    k, l = i + di, j + dj
+                    v = (k * spacing + jitter[k, l, 0],
+                         l * spacing + jitter[k, l, 1])
+                    dist = float(np.hypot(u[0] - v[0], u[1] - v[1]))
+                    G.add_edge(u, v, weight=dist,
+                               geometry=LineString([u, v]))
+
+    return G
+
+
+def legacy_greedy_pcst(G, prize_nodes, root, prize_weight=1000000):
+    """
+    This function is the original greedy loop, kept as the reference.
+
+    """
+    T = nx.Graph()
+    T.add_node(root)
+    included = {root}
+
+    while True:
+        best_score = float('-inf')
+        best_path = None
+        candidates = 0
+
+        for target in prize_nodes:
+            if target in included:
+                continue
+            if not G.has_node(target):
+                continue
+            try:
+                path = nx.shortest_path(G, source=root, target=target,
+                                        weight='weight')
+                cost = sum(G[u][v]['weight'] for u, v in zip(path[:-1],
+                                                             path[1:]))
+                score = prize_nodes[target] * prize_weight - cost
+                candidates += 1
+                if score > best_score:
+                    best_score = score
+                    best_path = path
+            except nx.NetworkXNoPath:
+                continue
+
+        if candidates == 0 or best_score <= 0 or best_path is None:
+            break
+
+        for u, v in zip(best_path[:-1], best_path[1:]):
+            T.add_edge(u, v, **G.get_edge_data(u, v, default={}))
+            included.add(u)
+            included.add(v)
+
+    return T, included
+
+
+def to_road_graph(G):
+    """
+    This function converts the networkx grid into a RoadGraph.
+
+    """
+    nodes = list(G.nodes)
+    ids = {node: i for i, node in enumerate(nodes)}
+    u, v, weights = zip(*((ids[a], ids[b], w)
+                          for a, b, w in G.edges(data='weight')))
+
+    return RoadGraph.from_edges(np.array(nodes), u, v, weights), ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--side', type=int, default=159)
+    parser.add_argument('--prizes', type=int, default=40)
+    parser.add_argument('--prize-weight', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    G = street_grid(args.side, seed=args.seed)
+    nx_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    graph, ids = to_road_graph(G)
+    nodes = list(G.nodes)
+
+    rng = np.random.default_rng(args.seed)
+    picks = rng.choice(len(nodes), size=args.prizes, replace=False)
+    prize_nodes = {nodes[i]: float(rng.integers(1000, 50000)) for i in picks}
+    prize_ids = {ids[node]: prize for node, prize in prize_nodes.items()}
+    root = max(prize_nodes, key=prize_nodes.get)
+    print('Graph: {} nodes, {} edges, {} prizes'.format(
+        G.number_of_nodes(), G.number_of_edges(), len(prize_nodes)))
+    print('Memory: networkx {:.1f} MB, RoadGraph {:.1f} MB'.format(
+        nx_bytes / 1e6, graph.nbytes / 1e6))
+
+    start = time.perf_counter()
+    selected_new, included_new = greedy_pcst(graph, prize_ids, ids[root],
+                                             args.prize_weight)
+    new_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    T_old, included_old = legacy_greedy_pcst(G, prize_nodes, root,
+                                             args.prize_weight)
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    selected_tree, included_tree = tree_greedy_pcst(graph, prize_ids,
+                                                    ids[root],
+                                                    args.prize_weight)
+    tree_time = time.perf_counter() - start
+
+    same_edges = ({frozenset(map(int, graph.edges[e])) for e in selected_new}
+                  == {frozenset((ids[a], ids[b])) for a, b in T_old.edges})
+    same_nodes = included_new == {ids[node] for node in included_old}
+    print('Legacy loop:        {:8.2f} s'.format(old_time))
+    print('Shortest-path tree: {:8.2f} s'.format(new_time))
+    print('Speedup:            {:8.1f}x'.format(old_time / new_time))
+    print('Selected edges: {} (identical: {})'.format(
+        len(selected_new), same_edges and same_nodes))
+
+    for label, selected, included in (('root', selected_new, included_new),
+                                      ('tree', selected_tree, included_tree)):
+        km = graph.edge_weights[selected].sum() / 1000
+        print("Strategy '{}': {} prizes, {:.1f} fiber km".format(
+            label, len(included & set(prize_ids)), km))
+    print("Strategy 'tree' time: {:.2f} s".format(tree_time))
+
+
+if __name__ == '__main__':
+    main()
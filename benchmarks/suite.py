@@ -0,0 +1,251 @@
+"""
+Benchmark suite of `gambit.optimizer` on synthetic regions.
+
+`run` times `run_pcst_from_shapefiles` phase by phase on grid and random
+planar networks of several sizes, each region in a fresh process so its
+peak memory is its own, then times `batch_pcst_parallel` on a set of equal
+regions across worker counts. Results are stored as JSON. `compare` checks
+a result file against a saved baseline and exits with status 1 when any
+timing or memory figure regressed beyond the threshold.
+
+    PYTHONPATH=src python -m benchmarks.suite run --sizes 1k,10k,100k \\
+        --workers 1,2,4 --output results.json
+    PYTHONPATH=src python -m benchmarks.suite compare baseline.json \\
+        results.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from gambit.optimizer import run_pcst_from_shapefiles, batch_pcst_parallel
+from benchmarks.synthetic import (grid_network, random_planar_network,
+                                  clustered_population, write_region)
+
+NETWORKS = {'grid': grid_network, 'planar': random_planar_network}
+SUFFIXES = {'k': 1000, 'm': 1000000}
+
+
+def parse_size(text):
+    """
+    This function reads a size such as '10k' or '1m'.
+
+    """
+    text = text.strip().lower()
+    if text[-1] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+
+    return int(text)
+
+
+def make_region(folder, file_id, network, num_edges, vertices, seed):
+    """
+    This function writes a synthetic region unless it already exists.
+
+    Returns
+    -------
+    road_shapefile : string
+        Path of the street shapefile.
+    population_shapefile : string
+        Path of the settlement shapefile.
+
+    """
+    paths = tuple(os.path.join(folder, name, file_id + '.shp')
+                  for name in ('roads', 'population'))
+    if all(os.path.exists(path) for path in paths):
+        return paths
+
+    roads = NETWORKS[network](num_edges, vertices=vertices, seed=seed)
+    population = clustered_population(
+        roads, num_points=min(20000, max(50, num_edges // 50)), seed=seed)
+
+    return write_region(folder, file_id, roads, population)
+
+
+def time_region(road_shapefile, population_shapefile, output_folder,
+                file_id, options):
+    """
+    This function solves one region in a fresh worker process.
+
+    Returns
+    -------
+    result : dict
+        Phase timings, their total, wall time, peak memory and size.
+
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        record = executor.submit(run_pcst_from_shapefiles, road_shapefile,
+                                 population_shapefile, output_folder,
+                                 file_id, **options).result()
+    wall_time = time.perf_counter() - start
+    if record['status'] != 'ok':
+        raise RuntimeError("{}: {}".format(file_id, record['error']))
+
+    return {'timings': record['timings'],
+            'total': sum(record['timings'].values()),
+            'wall_time': wall_time,
+            'peak_rss_mb': record['peak_rss_mb'],
+            'graph_nodes': record.get('uncontracted_nodes',
+                                      record['graph_nodes']),
+            'graph_edges': record.get('uncontracted_edges',
+                                      record['graph_edges']),
+            'selected_km': record['selected_km']}
+
+
+def metadata():
+    """
+    This function describes the machine and revision being measured.
+
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='gambit-bench-')
+    inputs = os.path.join(workdir, 'inputs')
+    options = {'engine': args.engine, 'strategy': args.strategy}
+    results = {'meta': metadata(), 'options': options, 'cases': {},
+               'batch': {}}
+
+    for network in args.networks.split(','):
+        for size in args.sizes.split(','):
+            name = '{}-{}'.format(network, size)
+            file_id = 'BEN.{}.{}_1'.format(
+                list(NETWORKS).index(network) + 1, parse_size(size))
+            paths = make_region(inputs, file_id, network, parse_size(size),
+                                args.vertices, args.seed)
+            best = None
+            for _ in range(args.repeat):
+                result = time_region(*paths, os.path.join(workdir, 'out'),
+                                     file_id, options)
+                if best is None or result['total'] < best['total']:
+                    best = result
+            results['cases'][name] = best
+            print('{:<14} {:>9} edges {:8.2f} s {:8.1f} MB'.format(
+                name, best['graph_edges'], best['total'],
+                best['peak_rss_mb'] or 0))
+
+    if args.workers:
+        batch = os.path.join(workdir, 'batch')
+        for k in range(args.batch_regions):
+            make_region(batch, 'BEN.9.{}_1'.format(k + 1), 'grid',
+                        parse_size(args.batch_size), args.vertices,
+                        args.seed + k)
+        for workers in map(int, args.workers.split(',')):
+            start = time.perf_counter()
+            records = batch_pcst_parallel(
+                os.path.join(batch, 'roads'),
+                os.path.join(batch, 'population'),
+                os.path.join(workdir, 'batch_out_{}'.format(workers)),
+                max_workers=workers, **options)
+            results['batch'][str(workers)] = {
+                'wall_time': time.perf_counter() - start,
+                'regions': len(records),
+                'failed': sum(record['status'] == 'error'
+                              for record in records),
+                'peak_rss_mb': max((record.get('peak_rss_mb') or 0
+                                    for record in records), default=0)}
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to {}'.format(args.output))
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = []
+    for name, case in current['cases'].items():
+        reference = baseline['cases'].get(name)
+        if reference is None:
+            continue
+        metrics = dict(case['timings'], total=case['total'])
+        for metric, value in metrics.items():
+            old = (reference['total'] if metric == 'total'
+                   else reference['timings'].get(metric))
+            if old is not None:
+                rows.append((name, metric, old, value, args.min_seconds))
+        if case.get('peak_rss_mb') and reference.get('peak_rss_mb'):
+            rows.append((name, 'peak_rss_mb', reference['peak_rss_mb'],
+                         case['peak_rss_mb'], args.min_mb))
+    for workers, case in current.get('batch', {}).items():
+        reference = baseline.get('batch', {}).get(workers)
+        if reference is not None:
+            rows.append(('batch-{}w'.format(workers), 'wall_time',
+                         reference['wall_time'], case['wall_time'],
+                         args.min_seconds))
+
+    regressions = 0
+    print('{:<14} {:<12} {:>10} {:>10} {:>8}'.format(
+        'case', 'metric', 'baseline', 'current', 'change'))
+    for name, metric, old, new, floor in rows:
+        change = (new - old) / old if old else 0.0
+        regressed = change > args.threshold and new - old > floor
+        regressions += regressed
+        print('{:<14} {:<12} {:>10.3f} {:>10.3f} {:>+7.0%}{}'.format(
+            name, metric, old, new, change, '  REGRESSION' if regressed
+            else ''))
+
+    print('{} regression(s) beyond {:.0%}'.format(regressions,
+                                                  args.threshold))
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--sizes', default='1k,10k,100k')
+    run_parser.add_argument('--networks', default='grid,planar')
+    run_parser.add_argument('--vertices', type=int, default=2,
+                            help='intermediate vertices per street')
+    run_parser.add_argument('--workers', default='1,2,4',
+                            help='worker counts of the batch benchmark, '
+                            'empty to skip it')
+    run_parser.add_argument('--batch-regions', type=int, default=8)
+    run_parser.add_argument('--batch-size', default='10k')
+    run_parser.add_argument('--engine', default='greedy')
+    run_parser.add_argument('--strategy', default='root')
+    run_parser.add_argument('--repeat', type=int, default=1)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--workdir')
+    run_parser.add_argument('--output', default='benchmark_results.json')
+
+    compare_parser = commands.add_parser(
+        'compare', help='flag regressions against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help='relative slowdown flagged')
+    compare_parser.add_argument('--min-seconds', type=float, default=0.05,
+                                help='ignore smaller absolute slowdowns')
+    compare_parser.add_argument('--min-mb', type=float, default=10.0,
+                                help='ignore smaller memory increases')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Synthetic road networks and settlements for benchmarking the optimizer.
+
+Networks are built in EPSG:3857 metres so no reprojection noise enters the
+timings. `grid_network` gives a jittered street grid and
+`random_planar_network` a Delaunay-based planar network thinned to the
+requested edge count; both can carry intermediate vertices on every street
+to mimic OSM geometries. `clustered_population` scatters settlements
+around random town centres with a heavy-tailed population.
+"""
+import os
+import numpy as np
+import geopandas as gpd
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial import Delaunay
+
+CRS = 'EPSG:3857'
+ORIGIN = np.array([-1450000.0, 940000.0])
+
+
+def grid_network(num_edges, spacing=100.0, vertices=0, seed=0):
+    """
+    This function generates a jittered square street grid.
+
+    Parameters
+    ----------
+    num_edges : int
+        Approximate number of streets between intersections.
+    spacing : float
+        Block length in metres.
+    vertices : int
+        Intermediate vertices added along every street.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    roads : geodataframe
+        Street linestrings.
+
+    """
+    rng = np.random.default_rng(seed)
+    side = max(2, int(np.sqrt(num_edges / 2)) + 1)
+    i, j = np.meshgrid(np.arange(side), np.arange(side), indexing='ij')
+    coords = np.column_stack([i.ravel(), j.ravel()]) * spacing
+    coords += rng.uniform(-0.2, 0.2, size=coords.shape) * spacing
+
+    ids = np.arange(side * side).reshape(side, side)
+    u = np.concatenate([ids[:-1, :].ravel(), ids[:, :-1].ravel()])
+    v = np.concatenate([ids[1:, :].ravel(), ids[:, 1:].ravel()])
+
+    return _streets(coords, u, v, vertices, rng)
+
+
+def random_planar_network(num_edges, density=1e-4, vertices=0, seed=0):
+    """
+    This function generates a random planar road network: a Delaunay
+    triangulation of random junctions thinned to its minimum spanning tree
+    plus random extra streets.
+
+    Parameters
+    ----------
+    num_edges : int
+        Number of streets between junctions.
+    density : float
+        Junctions per square metre.
+    vertices : int
+        Intermediate vertices added along every street.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    roads : geodataframe
+        Street linestrings.
+
+    """
+    rng = np.random.default_rng(seed)
+    n = max(4, int(num_edges / 2))
+    size = np.sqrt(n / density)
+    coords = rng.uniform(0, size, size=(n, 2))
+
+    simplices = Delaunay(coords).simplices
+    pairs = np.concatenate([simplices[:, [0, 1]], simplices[:, [1, 2]],
+                            simplices[:, [0, 2]]])
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    lengths = np.hypot(*(coords[pairs[:, 0]] - coords[pairs[:, 1]]).T)
+
+    tree = minimum_spanning_tree(coo_matrix(
+        (lengths, (pairs[:, 0], pairs[:, 1])), shape=(n, n))).tocoo()
+    tree_keys = (np.minimum(tree.row, tree.col).astype(np.int64) * n +
+                 np.maximum(tree.row, tree.col))
+    in_tree = np.isin(pairs[:, 0].astype(np.int64) * n + pairs[:, 1],
+                      tree_keys)
+
+    extra = rng.permutation(np.flatnonzero(~in_tree))
+    extra = extra[:max(0, num_edges - int(in_tree.sum()))]
+    keep = np.concatenate([np.flatnonzero(in_tree), extra])
+
+    return _streets(coords, pairs[keep, 0], pairs[keep, 1], vertices, rng)
+
+
+def _streets(coords, u, v, vertices, rng):
+    """
+    Turn junction pairs into street linestrings, optionally with slightly
+    bent intermediate vertices.
+
+    """
+    coords = coords + ORIGIN
+    start, end = coords[u], coords[v]
+    steps = np.linspace(0, 1, vertices + 2)
+    points = start[:, None, :] + steps[None, :, None] * (end - start)[:, None, :]
+    if vertices:
+        points[:, 1:-1] += rng.normal(0, 2.0, size=points[:, 1:-1].shape)
+    lines = shapely.linestrings(points.reshape(-1, 2),
+                                indices=np.repeat(np.arange(len(u)),
+                                                  vertices + 2))
+
+    return gpd.GeoDataFrame({'street': np.arange(len(u))}, geometry=lines,
+                            crs=CRS)
+
+
+def clustered_population(roads, num_points, num_clusters=20, spread=500.0,
+                         seed=0):
+    """
+    This function scatters settlements around random town centres within
+    the extent of a road network.
+
+    Parameters
+    ----------
+    roads : geodataframe
+        Road network giving the extent.
+    num_points : int
+        Number of settlements.
+    num_clusters : int
+        Number of town centres.
+    spread : float
+        Standard deviation of the distance to the centre in metres.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    population : geodataframe
+        Settlement points with a `population` column.
+
+    """
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = roads.total_bounds
+    centres = rng.uniform([xmin, ymin], [xmax, ymax], size=(num_clusters, 2))
+    points = centres[rng.integers(num_clusters, size=num_points)]
+    points = points + rng.normal(0, spread, size=(num_points, 2))
+    points = np.clip(points, [xmin, ymin], [xmax, ymax])
+    population = np.rint(rng.lognormal(5, 1.2, size=num_points)) + 1
+
+    return gpd.GeoDataFrame({'population': population},
+                            geometry=shapely.points(points), crs=CRS)
+
+
+def write_region(folder, file_id, roads, population):
+    """
+    This function writes a region in the layout `batch_pcst_parallel`
+    expects: `roads/{file_id}.shp` and `population/{file_id}.shp`.
+
+    Returns
+    -------
+    road_shapefile : string
+        Path of the street shapefile.
+    population_shapefile : string
+        Path of the settlement shapefile.
+
+    """
+    paths = []
+    for name, gdf in (('roads', roads), ('population', population)):
+        os.makedirs(os.path.join(folder, name), exist_ok=True)
+        path = os.path.join(folder, name, file_id + '.shp')
+        gdf.to_file(path)
+        paths.append(path)
+
+    return tuple(paths)
@@ -0,0 +1,32 @@
+"""
+Worker of a distributed PCST batch. Queue the regions once with
+`gambit.workqueue.enqueue_regions`, then start this script on every host
+that sees the queue file, e.g. once per core:
+
+    python pcst_worker.py /shared/queue.sqlite --graph-cache /shared/cache
+"""
+import argparse
+from gambit.workqueue import run_worker, queue_report
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('queue', help='queue database on the shared disk')
+    parser.add_argument('--worker', help='worker identifier')
+    parser.add_argument('--graph-cache', help='road graph cache folder')
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--heartbeat', type=float, default=30)
+    parser.add_argument('--stall-timeout', type=float, default=300)
+    parser.add_argument('--report', help='write the queue run report here')
+    args = parser.parse_args()
+
+    records = run_worker(args.queue, worker=args.worker,
+                         graph_cache=args.graph_cache,
+                         batch_size=args.batch_size,
+                         heartbeat_interval=args.heartbeat,
+                         stall_timeout=args.stall_timeout)
+    print("{} regions solved by this worker".format(len(records)))
+
+    if args.report:
+        print(queue_report(args.queue, args.report))
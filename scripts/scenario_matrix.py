@@ -0,0 +1,60 @@
+"""
+Solve a country for every combination of settlement threshold, prize
+weight and cost model, without editing the runner, e.g.
+
+    python scenario_matrix.py SLE --thresholds 0 500 --prize-weights 1e5 1e6 \
+        --cost-model distance= --cost-model roads=cost_config.ini
+"""
+import argparse
+import configparser
+import os
+from gambit.optimizer import scenario_matrix
+
+CONFIG = configparser.ConfigParser()
+CONFIG.read(os.path.join(os.path.dirname(__file__), 'script_config.ini'))
+BASE_PATH = CONFIG['file_locations']['base_path']
+
+DATA_PROCESSED = os.path.join(BASE_PATH, '..', 'results', 'processed')
+DATA_RESULTS = os.path.join(BASE_PATH, '..', 'results', 'final')
+
+# Street and settlement folders of each level, as in runner.py
+LEVELS = {'regions': ('regions', 'regional_nodes'),
+          'sub_regions': ('sub_regions', 'nodes')}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('iso3', help='country to solve')
+    parser.add_argument('--level', choices=LEVELS, default='regions')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0],
+                        help='smallest settlement population solved for')
+    parser.add_argument('--prize-weights', type=float, nargs='+',
+                        default=[1000000])
+    parser.add_argument('--cost-model', action='append', default=[],
+                        metavar='NAME=INI',
+                        help='named cost model, empty INI for distance')
+    parser.add_argument('--strategy', default='root')
+    parser.add_argument('--max-workers', type=int)
+    parser.add_argument('--graph-cache', help='road graph cache folder')
+    args = parser.parse_args()
+
+    cost_models = dict(item.split('=', 1) for item in args.cost_model)
+    cost_models = {name: path or None for name, path in cost_models.items()}
+
+    streets, nodes = LEVELS[args.level]
+    output_folder = os.path.join(DATA_RESULTS, args.iso3, 'scenarios')
+    scenario_matrix(
+        roads_folder=os.path.join(DATA_PROCESSED, args.iso3, 'streets',
+                                  streets),
+        population_folder=os.path.join(DATA_PROCESSED, args.iso3,
+                                       'buffer_routing_zones', nodes),
+        output_folder=output_folder,
+        thresholds=args.thresholds,
+        prize_weights=args.prize_weights,
+        cost_models=cost_models or None,
+        max_workers=args.max_workers,
+        results_path=os.path.join(output_folder, '{}_{}_scenarios.csv'
+                                  .format(args.iso3, args.level)),
+        graph_cache=args.graph_cache,
+        strategy=args.strategy)
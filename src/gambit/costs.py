@@ -0,0 +1,286 @@
+import configparser
+import json
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+# Cost of a metre of fiber along each OSM road class relative to a metre
+# along a minor road: trunk roads mean traffic management and wayleaves,
+# tracks and paths poor access. To be calibrated per country.
+HIGHWAY_COSTS = {
+    'motorway': 1.5,
+    'trunk': 1.4,
+    'primary': 1.25,
+    'secondary': 1.1,
+    'tertiary': 1.0,
+    'unclassified': 1.0,
+    'residential': 0.9,
+    'living_street': 0.9,
+    'service': 1.0,
+    'road': 1.0,
+    'track': 1.2,
+    'path': 1.3,
+    'footway': 1.3,
+}
+
+
+def road_classes(highway):
+    """
+    This function normalises OSM `highway` values: link roads count as the
+    road they join and, of the list osmnx writes for merged ways, the
+    first class is kept.
+
+    Parameters
+    ----------
+    highway : series
+        Raw `highway` values, e.g. "primary_link" or "['residential',
+        'unclassified']".
+
+    Returns
+    -------
+    classes : array
+        Road class of each value, empty where it was missing.
+
+    """
+    highway = pd.Series(highway, dtype=object).fillna('').astype(str)
+    values, inverse = np.unique(highway.to_numpy(), return_inverse=True)
+    classes = [value.strip("[] ").split(',')[0].strip("'\" ")
+               .replace('_link', '') for value in values]
+
+    return np.asarray(classes, dtype=object)[inverse]
+
+
+class CostModel:
+
+    """
+    This class turns street geometries into fiber costs per segment in
+    metre equivalents: the segment length times the multiplier of its road
+    class, the terrain multiplier at its midpoint and the discount of
+    existing ducts within reach. All factors are computed in bulk when the
+    graph is built, so solving costs no more than on plain distance.
+    """
+
+
+    def __init__(self, highway=None, default=1.0, terrain=None,
+                 terrain_default=1.0, ducts=None, duct_distance=50.0,
+                 duct_discount=0.5):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        highway : dict
+            Multiplier of each road class, updating `HIGHWAY_COSTS`.
+        default : float
+            Multiplier of roads of any other or no class.
+        terrain : string
+            Raster of terrain multipliers, e.g. derived from slope, read
+            with rasterio.
+        terrain_default : float
+            Multiplier outside the raster or on its nodata cells.
+        ducts : string
+            Lines of existing ducts or fiber routes, such as
+            `{iso3}_core_edges_existing.shp`.
+        duct_distance : float
+            Segments whose midpoint lies within this many metres of a duct
+            get the discount.
+        duct_discount : float
+            Share of the cost saved along existing ducts.
+        """
+        self.highway = dict(HIGHWAY_COSTS, **(highway or {}))
+        self.default = float(default)
+        self.terrain = terrain
+        self.terrain_default = float(terrain_default)
+        self.ducts = ducts
+        self.duct_distance = float(duct_distance)
+        self.duct_discount = float(duct_discount)
+        self._duct_tree = None
+
+
+    @classmethod
+    def from_config(cls, config_path, iso3):
+        """
+        Read the cost model of a country from an INI file. The [DEFAULT]
+        section applies to every country and a section named after the
+        ISO3 code overrides it. Road classes are set as `highway.<class>`
+        keys; `{iso3}` in file paths is replaced and relative paths start
+        from the INI file's folder.
+
+        """
+        config = configparser.ConfigParser()
+        if not config.read(config_path):
+            raise FileNotFoundError(config_path)
+        section = config[iso3] if config.has_section(iso3) else \
+            config[config.default_section]
+
+        folder = os.path.dirname(os.path.abspath(config_path))
+
+        def path(value):
+            return value and os.path.join(folder, value.format(iso3=iso3))
+
+        return cls(
+            highway={key.split('.', 1)[1]: float(value)
+                     for key, value in section.items()
+                     if key.startswith('highway.')},
+            default=section.getfloat('default', 1.0),
+            terrain=path(section.get('terrain')),
+            terrain_default=section.getfloat('terrain_default', 1.0),
+            ducts=path(section.get('ducts')),
+            duct_distance=section.getfloat('duct_distance', 50.0),
+            duct_discount=section.getfloat('duct_discount', 0.5))
+
+
+    def __getstate__(self):
+        # The duct index is rebuilt in each worker rather than pickled
+        return dict(self.__dict__, _duct_tree=None)
+
+
+    def __repr__(self):
+        return 'CostModel({})'.format(json.dumps(self.fingerprint(),
+                                                 sort_keys=True))
+
+
+    def fingerprint(self):
+        """
+        Settings and input file stamps, part of the graph cache key.
+
+        """
+        def stamp(path):
+            if path is None or not os.path.exists(path):
+                return path
+            return [path, os.path.getsize(path), os.path.getmtime(path)]
+
+        return {'highway': self.highway, 'default': self.default,
+                'terrain': stamp(self.terrain),
+                'terrain_default': self.terrain_default,
+                'ducts': stamp(self.ducts),
+                'duct_distance': self.duct_distance,
+                'duct_discount': self.duct_discount}
+
+
+    def segment_multipliers(self, roads, start, end, source):
+        """
+        Multiplier of every road segment.
+
+        Arguments
+        ---------
+        roads : geodataframe
+            Streets in a projected coordinate system, with a `highway`
+            column if available.
+        start, end : array
+            (k, 2) end points of each segment.
+        source : array
+            Row of `roads` each segment comes from.
+
+        Returns
+        -------
+        multipliers : array
+            Cost per metre of each segment in metre equivalents.
+
+        """
+        if 'highway' in roads.columns:
+            classes = road_classes(roads['highway'])
+            names, inverse = np.unique(classes, return_inverse=True)
+            by_road = np.array([self.highway.get(name, self.default)
+                                for name in names])[inverse]
+            multipliers = by_road[source]
+        else:
+            multipliers = np.full(len(source), self.default)
+
+        midpoints = (start + end) / 2
+        if self.terrain is not None:
+            multipliers = multipliers * self.terrain_multipliers(
+                midpoints, roads.crs)
+        if self.ducts is not None:
+            multipliers = np.where(self.near_ducts(midpoints, roads.crs),
+                                   multipliers * (1 - self.duct_discount),
+                                   multipliers)
+
+        return multipliers
+
+
+    def terrain_multipliers(self, points, crs):
+        """
+        Sample the terrain raster at points in the given coordinate system,
+        reading only the window they cover.
+
+        """
+        if rasterio is None:
+            raise ImportError("rasterio is needed for terrain costs.")
+
+        values = np.full(len(points), self.terrain_default)
+        with rasterio.open(self.terrain) as raster:
+            projected = gpd.GeoSeries(shapely.points(points),
+                                      crs=crs).to_crs(raster.crs)
+            cols, rows = ~raster.transform * (projected.x.to_numpy(),
+                                              projected.y.to_numpy())
+            rows = np.floor(rows).astype(np.int64)
+            cols = np.floor(cols).astype(np.int64)
+            inside = ((rows >= 0) & (rows < raster.height) &
+                      (cols >= 0) & (cols < raster.width))
+            if not inside.any():
+                return values
+
+            row0, col0 = rows[inside].min(), cols[inside].min()
+            window = Window(col0, row0, cols[inside].max() - col0 + 1,
+                            rows[inside].max() - row0 + 1)
+            band = raster.read(1, window=window, masked=True)
+            sample = band[rows[inside] - row0, cols[inside] - col0]
+            values[inside] = np.ma.filled(sample.astype(np.float64),
+                                          self.terrain_default)
+
+        return values
+
+
+    def near_ducts(self, points, crs):
+        """
+        Flag the points in a projected coordinate system lying within the
+        duct distance of an existing duct.
+
+        """
+        if self._duct_tree is None:
+            ducts = gpd.read_file(self.ducts).to_crs(crs)
+            self._duct_tree = shapely.STRtree(ducts.geometry.values)
+
+        near = np.zeros(len(points), dtype=bool)
+        hits, _ = self._duct_tree.query(shapely.points(points),
+                                        predicate='dwithin',
+                                        distance=self.duct_distance)
+        near[hits] = True
+
+        return near
+
+
+def load_cost_model(cost_model, iso3):
+    """
+    This function resolves the `cost_model` option of the optimizer.
+
+    Parameters
+    ----------
+    cost_model : CostModel, dict or string
+        A cost model, the arguments of one, or the path of an INI file
+        read with `CostModel.from_config` for the country.
+    iso3 : string
+        Country code of the region.
+
+    Returns
+    -------
+    cost_model : CostModel
+        The cost model, None for plain distance.
+
+    """
+    if cost_model is None or isinstance(cost_model, CostModel):
+        return cost_model
+    elif isinstance(cost_model, dict):
+        return CostModel(**cost_model)
+    elif isinstance(cost_model, str):
+        return CostModel.from_config(cost_model, iso3)
+
+    raise ValueError("Unknown cost model '{}'.".format(cost_model))
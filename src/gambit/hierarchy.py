@@ -0,0 +1,432 @@
+import heapq
+import os
+import numpy as np
+
+HIERARCHY_ARRAYS = ('rank', 'up_indptr', 'up_indices', 'up_weights',
+                    'up_middle', 'up_edge')
+
+
+def _witness_search(adjacency, source, skip, targets, limit, max_settled):
+    """
+    Bounded Dijkstra search from `source` avoiding `skip`, stopping once
+    every target is settled, the distance exceeds `limit` or `max_settled`
+    nodes were settled. Distances of unsettled nodes are upper bounds,
+    which is all a witness needs.
+
+    """
+    heappush, heappop, inf = heapq.heappush, heapq.heappop, np.inf
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    remaining = set(targets)
+    settled = 0
+    while heap:
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > limit:
+            break
+        remaining.discard(u)
+        settled += 1
+        if not remaining or settled > max_settled:
+            break
+        for w, (weight, _, _) in adjacency[u].items():
+            nd = d + weight
+            if nd < dist.get(w, inf) and w != skip:
+                dist[w] = nd
+                heappush(heap, (nd, w))
+
+    return dist
+
+
+class ContractionHierarchy:
+
+    """
+    This class answers shortest path queries on a road graph with a
+    contraction hierarchy: the nodes are contracted one by one in order of
+    importance, adding shortcut edges wherever a shortest path ran through
+    the contracted node. A query then only searches upwards in rank from
+    both ends, which visits a few hundred nodes however large the graph.
+
+    The upward graph is kept as a CSR adjacency. Arc `k` of node `u` leads
+    to a higher ranked node; it is the road edge `up_edge[k]` or, when
+    that is -1, a shortcut through the lower ranked node `up_middle[k]`.
+
+    Queries start from a node or from several nodes at given offsets, 
+    which places a point between nodes, such as inside a chain removed 
+    by `RoadGraph.contract_chains`.
+    """
+
+
+    def __init__(self, rank, up_indptr, up_indices, up_weights, up_middle,
+                 up_edge):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        rank : array
+            (n,) contraction order of each node.
+        up_indptr, up_indices, up_weights : array
+            CSR adjacency of the upward arcs and their weights.
+        up_middle : array
+            Contracted node of each shortcut arc, -1 for road edges.
+        up_edge : array
+            Road graph edge id of each arc, -1 for shortcuts.
+        """
+        self.rank = rank
+        self.up_indptr = up_indptr
+        self.up_indices = up_indices
+        self.up_weights = up_weights
+        self.up_middle = up_middle
+        self.up_edge = up_edge
+        self._lists = None
+
+
+    @classmethod
+    def build(cls, graph, max_settled=50):
+        """
+        Contract every node of a road graph, least important first.
+
+        Importance is the edge difference, the shortcuts a contraction adds
+        less the edges it removes, plus the number of neighbours already
+        contracted, which spreads contractions evenly over the graph. It is
+        checked again when a node reaches the top of the queue and the node
+        goes back if it is no longer the least important; the shortcuts
+        found by that check are the ones added.
+
+        Arguments
+        ---------
+        graph : RoadGraph
+            The road graph, with non-negative weights.
+        max_settled : int
+            Nodes settled by each witness search before giving up and
+            adding the shortcut, which trades preprocessing time for a few
+            redundant shortcuts.
+
+        Returns
+        -------
+        hierarchy : ContractionHierarchy
+            The hierarchy of the graph.
+
+        """
+        n = graph.num_nodes
+        adjacency = [{} for _ in range(n)]
+        for edge_id, (u, v) in enumerate(graph.edges.tolist()):
+            weight = float(graph.edge_weights[edge_id])
+            adjacency[u][v] = adjacency[v][u] = (weight, -1, edge_id)
+
+        def shortcuts(v):
+            # Shortcuts needed to contract v, by witness searches from each
+            # neighbour to the neighbours after it
+            needed = []
+            neighbours = list(adjacency[v].items())
+            for i, (u, (to_u, _, _)) in enumerate(neighbours[:-1]):
+                targets = {w: to_u + to_w
+                           for w, (to_w, _, _) in neighbours[i + 1:]}
+                dist = _witness_search(adjacency, u, v, targets,
+                                       max(targets.values()), max_settled)
+                needed.extend((u, w, d) for w, d in targets.items()
+                              if dist.get(w, np.inf) > d)
+            return needed
+
+        deleted = [0] * n
+
+        def priority(v, needed):
+            return len(needed) - len(adjacency[v]) + deleted[v]
+
+        heap = [(priority(v, shortcuts(v)), v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = np.zeros(n, dtype=np.int32)
+        upward = [None] * n
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            needed = shortcuts(v)
+            current = priority(v, needed)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            upward[v] = adjacency[v]
+            rank[v] = order
+            order += 1
+            for u in upward[v]:
+                del adjacency[u][v]
+                deleted[u] += 1
+            for u, w, d in needed:
+                if d < adjacency[u].get(w, (np.inf,))[0]:
+                    adjacency[u][w] = adjacency[w][u] = (d, v, -1)
+
+        counts = np.array([len(arcs) for arcs in upward], dtype=np.int64)
+        up_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=up_indptr[1:])
+        arcs = [(w, weight, middle, edge_id) for arcs in upward
+                for w, (weight, middle, edge_id) in arcs.items()]
+        arcs = np.array(arcs, dtype=np.float64).reshape(-1, 4)
+
+        return cls(rank, up_indptr, arcs[:, 0].astype(np.int32),
+                   np.ascontiguousarray(arcs[:, 1]),
+                   arcs[:, 2].astype(np.int32), arcs[:, 3].astype(np.int32))
+
+
+    def save(self, folder):
+        """
+        Write each array of the hierarchy as a .npy file in a folder.
+
+        """
+        os.makedirs(folder, exist_ok=True)
+        for name in HIERARCHY_ARRAYS:
+            np.save(os.path.join(folder, name + '.npy'), getattr(self, name))
+
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """
+        Load a hierarchy written by `save`, memory-mapping its arrays by
+        default.
+
+        """
+        return cls(*[np.load(os.path.join(folder, name + '.npy'),
+                             mmap_mode=mmap_mode)
+                     for name in HIERARCHY_ARRAYS])
+
+
+    @property
+    def num_nodes(self):
+        return len(self.rank)
+
+
+    @property
+    def num_shortcuts(self):
+        return int((self.up_middle >= 0).sum())
+
+
+    def _arrays(self):
+        # Python lists index several times faster than arrays in the
+        # query loops
+        if self._lists is None:
+            self._lists = (self.up_indptr.tolist(), self.up_indices.tolist(),
+                           self.up_weights.tolist())
+        return self._lists
+
+
+    @staticmethod
+    def _starts(node):
+        # A node id, or start nodes keyed to their offset
+        if isinstance(node, dict):
+            return {int(u): float(d) for u, d in node.items()}
+
+        return {int(node): 0.0}
+
+
+    def _search(self, sources, targets):
+        """
+        Bidirectional upward search, returning the distance, the meeting
+        node and the parents of both searches.
+
+        """
+        indptr, indices, weights = self._arrays()
+        dist = [dict(sources), dict(targets)]
+        parent = [dict.fromkeys(sources, (-1, -1)),
+                  dict.fromkeys(targets, (-1, -1))]
+        heaps = [[(d, u) for u, d in sources.items()],
+                 [(d, u) for u, d in targets.items()]]
+        for heap in heaps:
+            heapq.heapify(heap)
+        best, meet = np.inf, -1
+
+        while heaps[0] or heaps[1]:
+            for side in (0, 1):
+                heap = heaps[side]
+                if not heap:
+                    continue
+                d, u = heapq.heappop(heap)
+                if d >= best:
+                    # Nothing left on this side can improve the distance
+                    heap.clear()
+                    continue
+                if d > dist[side][u]:
+                    continue
+                other = dist[1 - side].get(u)
+                if other is not None and d + other < best:
+                    best, meet = d + other, u
+                ownd, ownp = dist[side], parent[side]
+                arcs = range(indptr[u], indptr[u + 1])
+                if any(ownd.get(indices[k], np.inf) + weights[k] < d
+                       for k in arcs):
+                    # Stall on demand: a higher node reached u by a shorter
+                    # way, so nothing found from u can be on the path
+                    continue
+                for k in arcs:
+                    w = indices[k]
+                    nd = d + weights[k]
+                    if nd < ownd.get(w, np.inf):
+                        ownd[w] = nd
+                        ownp[w] = (u, k)
+                        heapq.heappush(heap, (nd, w))
+
+        return best, meet, parent
+
+
+    def distance(self, source, target):
+        """
+        Shortest path distance between two nodes.
+
+        Arguments
+        ---------
+        source, target : int or dict
+            Node ids of the road graph, or start nodes keyed to their 
+            offset.
+
+        Returns
+        -------
+        distance : float
+            Sum of the edge weights along the shortest path, inf when the
+            nodes are not connected.
+
+        """
+        return self._search(self._starts(source), self._starts(target))[0]
+
+
+    def path(self, source, target):
+        """
+        Shortest path between two nodes, with its shortcuts unpacked into
+        road edges.
+
+        Arguments
+        ---------
+        source, target : int or dict
+            Node ids of the road graph, or start nodes keyed to their 
+            offset.
+
+        Returns
+        -------
+        distance : float
+            Sum of the edge weights and offsets, inf when the nodes are not 
+            connected.
+        nodes : array
+            Node ids along the path from the start node of the source to 
+            that of the target, empty when not connected.
+        edge_ids : array
+            Road graph edge ids along the path.
+
+        """
+        best, meet, parent = self._search(self._starts(source), 
+                                          self._starts(target))
+        if meet < 0:
+            return best, np.zeros(0, dtype=np.int64), np.zeros(0,
+                                                               dtype=np.int64)
+
+        # Upward arcs from the source to the meeting node, then down to
+        # the target
+        steps = []
+        node = meet
+        while parent[0][node][0] >= 0:
+            below, k = parent[0][node]
+            steps.append((below, node, k))
+            node = below
+        steps.reverse()
+        start = node
+        node = meet
+        while parent[1][node][0] >= 0:
+            below, k = parent[1][node]
+            steps.append((node, below, k))
+            node = below
+
+        nodes, edge_ids = [start], []
+        for a, b, k in steps:
+            self._unpack(a, b, k, nodes, edge_ids)
+
+        return (best, np.array(nodes, dtype=np.int64),
+                np.array(edge_ids, dtype=np.int64))
+
+
+    def _unpack(self, a, b, k, nodes, edge_ids):
+        """
+        Append the road edges of arc `k` between `a` and `b`, walked from
+        `a`, and the nodes after `a`.
+
+        """
+        stack = [(a, b, k)]
+        while stack:
+            a, b, k = stack.pop()
+            middle = int(self.up_middle[k])
+            if middle < 0:
+                edge_ids.append(int(self.up_edge[k]))
+                nodes.append(b)
+                continue
+            # The middle node ranks below both ends, so it holds both arcs
+            stack.append((middle, b, self._arc(middle, b)))
+            stack.append((a, middle, self._arc(middle, a)))
+
+
+    def _arc(self, u, w):
+        indptr, indices, _ = self._arrays()
+        for k in range(indptr[u], indptr[u + 1]):
+            if indices[k] == w:
+                return k
+        raise KeyError((u, w))
+
+
+    def distances(self, sources, targets):
+        """
+        Distance table between two sets of nodes with the bucket method:
+        one full upward search per target fills buckets on the nodes it
+        reaches, and one per source scans the buckets it meets.
+
+        Arguments
+        ---------
+        sources, targets : list
+            Node ids of the road graph, or start nodes keyed to their 
+            offset.
+
+        Returns
+        -------
+        distances : array
+            (len(sources), len(targets)) shortest path distances, inf
+            between nodes that are not connected.
+
+        """
+        buckets = {}
+        for j, target in enumerate(targets):
+            for node, d in self._upward(target).items():
+                buckets.setdefault(node, []).append((j, d))
+
+        table = np.full((len(sources), len(targets)), np.inf)
+        for i, source in enumerate(sources):
+            row = table[i]
+            for node, d in self._upward(source).items():
+                for j, other in buckets.get(node, ()):
+                    if d + other < row[j]:
+                        row[j] = d + other
+
+        return table
+
+
+    def _upward(self, source):
+        """
+        Distances of the nodes reachable upwards from a source, exact for
+        every node a shortest path can leave the search from.
+
+        """
+        indptr, indices, weights = self._arrays()
+        dist = self._starts(source)
+        heap = [(d, u) for u, d in dist.items()]
+        heapq.heapify(heap)
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            arcs = range(indptr[u], indptr[u + 1])
+            if any(dist.get(indices[k], np.inf) + weights[k] < d
+                   for k in arcs):
+                # Stalled, its distance is only an upper bound
+                continue
+            for k in arcs:
+                w = indices[k]
+                nd = d + weights[k]
+                if nd < dist.get(w, np.inf):
+                    dist[w] = nd
+                    heapq.heappush(heap, (nd, w))
+
+        return dist
@@ -12,6 +12,7 @@ from rasterstats import zonal_stats
 from shapely.ops import transform, unary_union, nearest_points
 from shapely.geometry import (Polygon, MultiPolygon, mapping, shape, 
                               MultiLineString, LineString, Point)
+from gambit.optimizer import nearest_by_road
 
 
 pd.options.mode.chained_assignment = None
@@ -845,7 +846,8 @@ def find_largest_regional_settlement(country):
     return None
 
 
-def get_settlement_routing_paths(country):
+def get_settlement_routing_paths(country, road_shapefile=None, 
+                                 graph_cache=None):
     """
     Create settlement routing paths and export as linestrings.
 
@@ -859,6 +861,13 @@ def get_settlement_routing_paths(country):
     ----------
     country : dict
         Contains all country-specific information for modeling.
+    road_shapefile : string
+        Street shapefile of the country. When given, settlements are 
+        routed to the nearest major settlement along the roads, with one 
+        Dijkstra search from all major settlements, instead of in a 
+        straight line.
+    graph_cache : string
+        Folder keeping the road graph between runs.
 
     """
     iso3 = country['iso3']
@@ -880,30 +889,47 @@ def get_settlement_routing_paths(country):
 
     paths = []
 
-    for idx, regional_node in regional_nodes.iterrows():
+    if road_shapefile is not None:
+
+        regional_nodes = regional_nodes[
+            regional_nodes['population'] >= main_settlement_size]
+        routes = nearest_by_road(road_shapefile, regional_nodes, main_nodes, 
+                                 graph_cache = graph_cache)
+        routes = routes[routes['destination'].notna()].to_crs('epsg:4326')
+        for idx, route in routes.iterrows():
+            paths.append({
+                'type': 'LineString',
+                'geometry': mapping(route['geometry']),
+                'properties': {
+                    'id': idx,
+                    'source': regional_nodes.loc[idx, GID_level],}})
+
+    else:
+
+        for idx, regional_node in regional_nodes.iterrows():
        
-        if regional_node['population'] < main_settlement_size:
+            if regional_node['population'] < main_settlement_size:
             
-            continue
+                continue
         
-        nearest = nearest_points(regional_node.geometry, main_nodes.unary_union
-                                 )[1]
-        geom = LineString([
-                    (
-                        regional_node['geometry'].coords[0][0],
-                        regional_node['geometry'].coords[0][1]
-                    ),
-                    (
-                        nearest.coords[0][0],
-                        nearest.coords[0][1]
-                    ),
-                ])
-        paths.append({
-            'type': 'LineString',
-            'geometry': mapping(geom),
-            'properties': {
-                'id': idx,
-                'source': regional_node[GID_level],}})
+            nearest = nearest_points(regional_node.geometry, main_nodes.unary_union
+                                     )[1]
+            geom = LineString([
+                        (
+                            regional_node['geometry'].coords[0][0],
+                            regional_node['geometry'].coords[0][1]
+                        ),
+                        (
+                            nearest.coords[0][0],
+                            nearest.coords[0][1]
+                        ),
+                    ])
+            paths.append({
+                'type': 'LineString',
+                'geometry': mapping(geom),
+                'properties': {
+                    'id': idx,
+                    'source': regional_node[GID_level],}})
 
     paths = gpd.GeoDataFrame.from_features(
         [{
@@ -1,15 +1,36 @@
 import configparser
+import heapq
+import inspect
+import json
 import os
+import shutil
+import sys
+import tempfile
+import time
 import warnings
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-import networkx as nx
+import shapely
 from glob import glob
 from tqdm import tqdm
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 from scipy.spatial import cKDTree
-from shapely.geometry import Point, LineString
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from gambit.costs import load_cost_model
+from gambit.hierarchy import ContractionHierarchy
+from gambit.pcsf import gw_pcsf, pcst_objective, strong_pruning
+from gambit.roadgraph import (RoadGraph, GraphCache, NodeIndex, SharedGraph, 
+                               file_mtime)
+from gambit.sinks import make_sink, region_level, to_table
+try:
+    import resource
+except ImportError:
+    resource = None
 pd.options.mode.chained_assignment = None
 warnings.filterwarnings('ignore')
 
@@ -20,175 +41,2798 @@ BASE_PATH = CONFIG['file_locations']['base_path']
 
 DATA_PROCESSED = os.path.join(BASE_PATH, '..', 'results', 'processed')
 DATA_RESULTS = os.path.join(BASE_PATH, '..', 'results', 'final')
+GRAPH_CRS = 'EPSG:3857'
+COMPONENT_MODES = ('root', 'split', 'bridge')
+MANIFEST_NAME = 'pcst_manifest.json'
+WORKER_BASE_MB = 150
+MEMORY_PER_INPUT_BYTE = 16
 
 
-def get_nearest_graph_node(coord, node_list):
-    
-    node_array = np.array(node_list)
-    tree = cKDTree(node_array)
-    _, idx = tree.query(coord)
-    
-    return tuple(node_array[idx])
+class PhaseTimer:
 
+    """
+    This class accumulates the wall-clock time spent in named phases.
+    """
+
+
+    def __init__(self):
+        """
+        A class constructor
+
+        """
+        self.timings = {}
+
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (self.timings.get(name, 0.0) + 
+                                  time.perf_counter() - start)
+
+
+class SolveBudget:
+
+    """
+    This class holds the wall-clock and iteration budget of one job. The 
+    greedy solvers ask it before adding each path, so a job out of budget 
+    still returns a valid tree, the best found so far.
+    """
+
+
+    def __init__(self, time_limit=None, max_iterations=None, start=None):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        time_limit : float
+            Seconds the job may take, counted from `start`.
+        max_iterations : int
+            Paths the solver may add.
+        start : float
+            `time.perf_counter()` at the start of the job, now when None.
+        """
+        start = time.perf_counter() if start is None else start
+        self.deadline = None if time_limit is None else start + time_limit
+        self.max_iterations = max_iterations
+        self.iterations = 0
+        self.truncated = False
+
+
+    def allows(self):
+        """
+        Whether another path may be added. The first one always is, so a 
+        tree exists; once refused, the solution is flagged as truncated.
+
+        """
+        if self.iterations and (
+                (self.max_iterations is not None and 
+                 self.iterations >= self.max_iterations) or 
+                (self.deadline is not None and 
+                 time.perf_counter() >= self.deadline)):
+            self.truncated = True
+
+        return not self.truncated
+
+
+def peak_rss_mb():
+    """
+    This function returns the peak resident memory of the current process.
+
+    Returns
+    -------
+    peak : float
+        Peak resident set size in MB, None where it cannot be measured.
+
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    scale = 1e6 if sys.platform == 'darwin' else 1e3
+
+    return peak / scale
+
+
+def load_road_graph(road_shapefile, resolution=0.01, graph_cache=None, 
+                    timer=None, cost_model=None):
+    """
+    This function reads, reprojects and compiles a street shapefile, or 
+    memory-maps its graph from the cache when it was compiled before with 
+    the same content and parameters.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the street shapefile.
+    resolution : float
+        Distance in metres below which vertices are merged.
+    graph_cache : string
+        Folder of the graph cache, None to always rebuild.
+    timer : PhaseTimer
+        Receives the read, reproject and graph build times. Loading from 
+        the cache counts as reading.
+    cost_model : CostModel
+        Edge cost model, plain segment length when None. Its settings are 
+        part of the cache key, so the graphs of several cost models stay 
+        cached side by side.
+
+    Returns
+    -------
+    graph : RoadGraph
+        Road graph in EPSG:3857.
+
+    """
+    timer = timer or PhaseTimer()
+
+    def build():
+        with timer.phase('read'):
+            roads = gpd.read_file(road_shapefile)
+        with timer.phase('reproject'):
+            roads = roads.to_crs(GRAPH_CRS)
+        with timer.phase('graph_build'):
+            return build_road_graph(roads, resolution, cost_model)
+
+    if graph_cache is None:
+        return build()
+
+    cache = GraphCache(graph_cache)
+    params = graph_cache_params(resolution, cost_model)
+    with timer.phase('read'):
+        graph = cache.load(road_shapefile, **params)
+    if graph is None:
+        graph = build()
+        with timer.phase('graph_build'):
+            cache.store(road_shapefile, graph, **params)
+
+    return graph
+
+
+def graph_cache_params(resolution=0.01, cost_model=None):
+    """
+    This function returns the build parameters keying a road graph in the 
+    graph cache.
+
+    """
+    params = {'resolution': resolution, 'crs': GRAPH_CRS}
+    if cost_model is not None:
+        params['costs'] = cost_model.fingerprint()
+
+    return params
+
+
+def load_hierarchy(road_shapefile, resolution=0.01, graph_cache=None, 
+                   timer=None, cost_model=None):
+    """
+    This function loads the road graph of a street shapefile with a 
+    contraction hierarchy of its contracted chains, for repeated distance 
+    and path queries. The hierarchy is stored next to the graph in the 
+    graph cache and built once per road file and parameters, the only way 
+    it pays off, so the cache is required.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the street shapefile.
+    resolution, graph_cache, timer
+        See `load_road_graph`.
+    cost_model : CostModel, dict or string
+        Edge cost model, see `run_pcst_from_shapefiles`.
+
+    Returns
+    -------
+    graph : RoadGraph
+        Road graph in EPSG:3857, neither snapped nor contracted.
+    chains : RoadGraph
+        The graph with its chains of degree-2 nodes contracted, see 
+        `RoadGraph.contract_chains`.
+    hierarchy : ContractionHierarchy
+        Contraction hierarchy of `chains`.
+
+    """
+    if graph_cache is None:
+        raise ValueError("A contraction hierarchy is only worth building "
+                         "when it is kept, pass a graph_cache folder.")
+
+    timer = timer or PhaseTimer()
+    cost_model = load_cost_model(cost_model, 
+                                 os.path.basename(road_shapefile)[:3])
+    graph = load_road_graph(road_shapefile, resolution, graph_cache, timer, 
+                            cost_model)
+
+    folder = GraphCache(graph_cache).path(
+        road_shapefile, **graph_cache_params(resolution, cost_model))
+    path = os.path.join(folder, 'hierarchy')
+    if os.path.isdir(path):
+        with timer.phase('read'):
+            return (graph, RoadGraph.load(os.path.join(path, 'chains')), 
+                    ContractionHierarchy.load(path))
+
+    with timer.phase('hierarchy'):
+        # Most road vertices only continue a chain, and contracting them 
+        # first leaves a fraction of the nodes to order
+        chains, _ = graph.contract_chains()
+        hierarchy = ContractionHierarchy.build(chains)
+        staging = tempfile.mkdtemp(dir=folder, prefix='.tmp-')
+        hierarchy.save(staging)
+        chains.save(os.path.join(staging, 'chains'))
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Another process stored it first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    return graph, chains, hierarchy
+
+
+def nearest_nodes(graph, points):
+    """
+    This function finds the road node nearest to each point without 
+    changing the graph, as distance queries need.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph in EPSG:3857.
+    points : geodataframe
+        Points in any coordinate system.
+
+    Returns
+    -------
+    nodes : array
+        Nearest node of each point.
+    distances : array
+        Straight-line distance from each point to its node in metres.
+
+    """
+    points = points.to_crs(GRAPH_CRS)
+    distances, nodes = cKDTree(graph.coords).query(
+        np.column_stack([points.geometry.x, points.geometry.y]))
+
+    return np.asarray(nodes, dtype=np.int64), np.asarray(distances)
+
+
+def chain_walks(graph, node, keep):
+    """
+    This function walks from a road node along its chain of degree-2 
+    nodes to the nodes kept by `RoadGraph.contract_chains` at both ends.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph, not contracted.
+    node : int
+        Start node.
+    keep : array
+        Whether each node is kept by the contraction.
+
+    Returns
+    -------
+    walks : list
+        Nodes and cumulative distances of each walk from `node` to a kept 
+        node. A kept node only walks to itself, and a ring without kept 
+        nodes gives no walk.
+
+    """
+    node = int(node)
+    if keep[node]:
+        return [([node], [0.0])]
+
+    walks = []
+    for slot in range(graph.indptr[node], graph.indptr[node + 1]):
+        edge = graph.edge_ids[slot]
+        nodes = [node, int(graph.indices[slot])]
+        distances = [0.0, float(graph.weights[slot])]
+        while not keep[nodes[-1]] and nodes[-1] != node:
+            slot = graph.indptr[nodes[-1]]
+            if graph.edge_ids[slot] == edge:
+                slot += 1
+            edge = graph.edge_ids[slot]
+            nodes.append(int(graph.indices[slot]))
+            distances.append(distances[-1] + float(graph.weights[slot]))
+        if nodes[-1] != node:
+            walks.append((nodes, distances))
+
+    return walks
+
+
+def chain_starts(walks, node_map):
+    """
+    This function keeps the shortest of the `chain_walks` reaching each 
+    node of the contracted graph.
+
+    Returns
+    -------
+    starts : dict
+        Distance and nodes of the walk keyed by contracted node id.
+
+    """
+    starts = {}
+    for nodes, distances in walks:
+        end = int(node_map[nodes[-1]])
+        if distances[-1] < starts.get(end, (np.inf,))[0]:
+            starts[end] = (distances[-1], nodes)
+
+    return starts
+
+
+def hierarchy_table(graph, hierarchy, origin_nodes, destination_nodes):
+    """
+    This function computes road distances between two sets of nodes with 
+    the contraction hierarchy of the contracted graph, entering it at the 
+    ends of the chains the nodes lie on.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph, not contracted.
+    hierarchy : ContractionHierarchy
+        Hierarchy of the contracted graph, see `load_hierarchy`.
+    origin_nodes, destination_nodes : array
+        Node ids of the road graph.
+
+    Returns
+    -------
+    table : array
+        (len(origin_nodes), len(destination_nodes)) road distances, inf 
+        between nodes that are not connected and from nodes of a ring 
+        without junctions, which the contraction drops.
+    origin_walks : list
+        `chain_walks` of each origin node.
+
+    """
+    keep = np.diff(graph.indptr) != 2
+    node_map = np.cumsum(keep) - 1
+    origin_walks = [chain_walks(graph, node, keep) for node in origin_nodes]
+
+    def offsets(walks):
+        return {end: distance for end, (distance, _) in 
+                chain_starts(walks, node_map).items()}
+
+    table = hierarchy.distances(
+        [offsets(walks) for walks in origin_walks], 
+        [offsets(chain_walks(graph, node, keep)) 
+         for node in destination_nodes])
+
+    # Nodes on the same chain may be closer along it than through its ends
+    columns = {}
+    for j, node in enumerate(np.asarray(destination_nodes).tolist()):
+        columns.setdefault(node, []).append(j)
+    for i, walks in enumerate(origin_walks):
+        for nodes, distances in walks:
+            for node, distance in zip(nodes, distances):
+                for j in columns.get(node, ()):
+                    table[i, j] = min(table[i, j], distance)
+
+    return table, origin_walks
+
+
+def hierarchy_route(graph, chains, hierarchy, origin_walks, 
+                    destination_node):
+    """
+    This function traces the road path between two nodes, unpacking the 
+    contracted chains the hierarchy route runs along.
+
+    Parameters
+    ----------
+    graph, chains, hierarchy
+        Road graph, contracted graph and hierarchy from `load_hierarchy`.
+    origin_walks : list
+        `chain_walks` of the origin node.
+    destination_node : int
+        Destination node id.
+
+    Returns
+    -------
+    coords : array
+        Coordinates along the path from the origin node to the destination 
+        node, empty when they are not connected.
+
+    """
+    keep = np.diff(graph.indptr) != 2
+    node_map = np.cumsum(keep) - 1
+    origin = chain_starts(origin_walks, node_map)
+    destination = chain_starts(chain_walks(graph, destination_node, keep), 
+                               node_map)
+    distance, nodes, edge_ids = hierarchy.path(
+        {end: d for end, (d, _) in origin.items()}, 
+        {end: d for end, (d, _) in destination.items()})
+
+    # Along the chain when both nodes lie on it and that is shorter
+    along = [(distances[walk.index(destination_node)], 
+              walk[:walk.index(destination_node) + 1]) 
+             for walk, distances in origin_walks if destination_node in walk]
+    if along:
+        along_distance, walk = min(along, key=lambda item: item[0])
+        if along_distance <= distance:
+            return graph.coords[walk]
+    if not len(nodes):
+        return np.zeros((0, 2))
+
+    coords = [graph.coords[origin[nodes[0]][1][:-1]], 
+              chains.coords[nodes[:1]]]
+    for k, edge in enumerate(edge_ids.tolist()):
+        inner = chains.geom_coords[chains.geom_ptr[edge]:
+                                   chains.geom_ptr[edge + 1]]
+        coords.append(inner if chains.edges[edge, 0] == nodes[k] 
+                      else inner[::-1])
+        coords.append(chains.coords[nodes[k + 1:k + 2]])
+    coords.append(graph.coords[destination[nodes[-1]][1][-2::-1]])
+
+    return np.concatenate(coords)
+
+
+def road_distance_matrix(road_shapefile, origins, destinations, 
+                         resolution=0.01, graph_cache=None, 
+                         cost_model=None, hierarchy=False):
+    """
+    This function computes road distances from every origin to every 
+    destination, e.g. from settlements to fiber nodes or regional hubs.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the street shapefile.
+    origins, destinations : geodataframe
+        Points, each linked to its nearest road node by a straight line.
+    resolution, graph_cache, cost_model
+        See `load_hierarchy`.
+    hierarchy : bool
+        Answer from the contraction hierarchy kept in `graph_cache`, built 
+        by the first call, when the same roads are queried again and 
+        again. Otherwise scipy's Dijkstra runs once per distinct node of 
+        the smaller side.
+
+    Returns
+    -------
+    distances : array
+        (len(origins), len(destinations)) distances in metres, or metre 
+        equivalents with a cost model, the straight links included. Points 
+        in different road components are inf apart.
+
+    """
+    if hierarchy:
+        graph, _, index = load_hierarchy(road_shapefile, resolution, 
+                                         graph_cache, cost_model=cost_model)
+    else:
+        graph = load_road_graph(road_shapefile, resolution, graph_cache, 
+                                cost_model=load_cost_model(cost_model, 
+                                    os.path.basename(road_shapefile)[:3]))
+    origin_nodes, origin_links = nearest_nodes(graph, origins)
+    destination_nodes, destination_links = nearest_nodes(graph, destinations)
+
+    if hierarchy:
+        table = hierarchy_table(graph, index, origin_nodes, 
+                                destination_nodes)[0]
+    elif not len(origin_nodes) or not len(destination_nodes):
+        table = np.full((len(origin_nodes), len(destination_nodes)), np.inf)
+    else:
+        # The graph is undirected, so search from the side with fewer nodes
+        flip = len(np.unique(destination_nodes)) < len(np.unique(origin_nodes))
+        sources, targets = ((destination_nodes, origin_nodes) if flip 
+                            else (origin_nodes, destination_nodes))
+        unique, inverse = np.unique(sources, return_inverse=True)
+        table = dijkstra(graph.to_csgraph(), indices=unique)[inverse][
+            :, targets]
+        if flip:
+            table = table.T
+
+    return table + origin_links[:, None] + destination_links[None, :]
+
+
+def nearest_by_road(road_shapefile, origins, destinations, resolution=0.01, 
+                    graph_cache=None, cost_model=None, hierarchy=False):
+    """
+    This function routes every origin to its nearest destination along 
+    the road network.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the street shapefile.
+    origins, destinations : geodataframe
+        Points, each linked to its nearest road node by a straight line.
+    resolution, graph_cache, cost_model
+        See `load_hierarchy`.
+    hierarchy : bool
+        Route with the contraction hierarchy kept in `graph_cache`, see 
+        `road_distance_matrix`. Otherwise one multi-source Dijkstra search 
+        from all destinations routes every origin.
+
+    Returns
+    -------
+    routes : geodataframe
+        One route per origin, indexed like `origins`, with the index label 
+        of its nearest `destination`, the `road_distance` and the route 
+        line in EPSG:3857. Origins without a route have a missing 
+        destination and geometry.
+
+    """
+    if hierarchy:
+        graph, chains, index = load_hierarchy(road_shapefile, resolution, 
+                                              graph_cache, 
+                                              cost_model=cost_model)
+    else:
+        graph = load_road_graph(road_shapefile, resolution, graph_cache, 
+                                cost_model=load_cost_model(cost_model, 
+                                    os.path.basename(road_shapefile)[:3]))
+    origin_nodes, origin_links = nearest_nodes(graph, origins)
+    destination_nodes, destination_links = nearest_nodes(graph, destinations)
+
+    if hierarchy:
+        table, origin_walks = hierarchy_table(graph, index, origin_nodes, 
+                                              destination_nodes)
+        table += origin_links[:, None] + destination_links[None, :]
+        nearest = (np.argmin(table, axis=1) if len(destination_nodes) 
+                   else np.zeros(len(origin_nodes), dtype=np.int64))
+        distances = table.min(axis=1, initial=np.inf)
+    else:
+        # One search from a virtual hub linked to every destination node 
+        # by its straight link reaches each node from its nearest one
+        n = graph.num_nodes
+        csgraph = csr_matrix(
+            (np.concatenate([graph.weights, destination_links]), 
+             np.concatenate([graph.indices, destination_nodes]), 
+             np.append(graph.indptr, len(graph.indices) + 
+                       len(destination_nodes))), shape=(n + 1, n + 1))
+        road, parents = dijkstra(csgraph, indices=n, 
+                                 return_predecessors=True)
+        distances = road[origin_nodes] + origin_links
+        # Destination with the shortest link at each destination node
+        closest = {}
+        for j in np.argsort(-destination_links, kind='stable').tolist():
+            closest[int(destination_nodes[j])] = j
+
+    origin_xy = origins.to_crs(GRAPH_CRS).geometry
+    destination_xy = destinations.to_crs(GRAPH_CRS).geometry
+    labels, lines = [], []
+    for i, distance in enumerate(distances.tolist()):
+        if np.isinf(distance):
+            labels.append(None)
+            lines.append(None)
+            continue
+        if hierarchy:
+            j = int(nearest[i])
+            coords = hierarchy_route(graph, chains, index, origin_walks[i], 
+                                     int(destination_nodes[j]))
+        else:
+            path = [int(origin_nodes[i])]
+            while parents[path[-1]] != n:
+                path.append(int(parents[path[-1]]))
+            j = closest[path[-1]]
+            coords = graph.coords[path]
+        lines.append(shapely.linestrings(np.concatenate([
+            [[origin_xy.iloc[i].x, origin_xy.iloc[i].y]], coords, 
+            [[destination_xy.iloc[j].x, destination_xy.iloc[j].y]]])))
+        labels.append(destinations.index[j])
+
+    return gpd.GeoDataFrame({'destination': labels, 
+                             'road_distance': distances}, 
+                            geometry=lines, index=origins.index, 
+                            crs=GRAPH_CRS)
 
-def run_pcst_from_shapefiles(road_shapefile, population_shapefile, 
-                             output_folder, file_id):
-    
-    try:
-    
-        roads = gpd.read_file(road_shapefile)
-        population_nodes = gpd.read_file(population_shapefile)
 
-        roads = roads.to_crs(epsg=3857)
-        population_nodes = population_nodes.to_crs(epsg=3857)
+def build_road_graph(roads, resolution=0.01, cost_model=None):
+    """
+    This function builds a weighted road graph from street geometries.
 
-        G = nx.Graph()
-        for _, row in roads.iterrows():
-            if not isinstance(row.geometry, LineString):
+    Parameters
+    ----------
+    roads : geodataframe
+        Street lines in a projected coordinate system. Multi-part 
+        geometries are exploded into their parts.
+    resolution : float
+        Distance below which vertices are merged into one node.
+    cost_model : CostModel
+        Turns segment lengths into costs by road class, terrain and 
+        existing ducts.
+
+    Returns
+    -------
+    graph : RoadGraph
+        Graph with one node per distinct vertex and segment lengths, or 
+        their costs in metre equivalents, as weights.
+
+    """
+    if cost_model is not None:
+        def multipliers(start, end, source):
+            return cost_model.segment_multipliers(roads, start, end, source)
+    else:
+        multipliers = None
+
+    return RoadGraph.from_geometries(roads.geometry.values, resolution, 
+                                     multipliers)
+
+
+def edge_lengths(graph, edge_ids):
+    """
+    This function measures edges along their geometry, which stays in 
+    metres whatever cost model set their weights.
+
+    """
+    return shapely.length(graph.edge_geometries(edge_ids))
+
+
+def snap_population_nodes(graph, population_nodes, snap_to='node', 
+                          max_snap_distance=None, resolution=0.01):
+    """
+    This function snaps every population point to the road network in one 
+    bulk query against a single spatial index.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph.
+    population_nodes : geodataframe
+        Population points with a `population` column.
+    snap_to : string
+        'node' links each settlement to its nearest road vertex, 'segment' 
+        to its projection on the nearest road segment.
+    max_snap_distance : float
+        Settlements farther than this from any road are dropped.
+    resolution : float
+        Distance below which a settlement is taken to lie on the road.
+
+    Returns
+    -------
+    graph : RoadGraph
+        Road graph extended with the settlement nodes and their links.
+    prize_nodes : dict
+        Population keyed by node id, summed over settlements sharing a node.
+    settlement_nodes : array
+        Node id of each population row, -1 when it was dropped.
+    snap_report : dict
+        Counts and distances of the snapped and dropped settlements.
+
+    """
+    points = np.column_stack([population_nodes.geometry.x, 
+                              population_nodes.geometry.y])
+    graph, settlement_nodes, distances = graph.snap_points(
+        points, to=snap_to, max_distance=max_snap_distance, 
+        resolution=resolution)
+
+    population = population_nodes['population'].to_numpy(dtype=np.float64)
+    snapped = settlement_nodes >= 0
+
+    prize_nodes = {}
+    for node, value in zip(settlement_nodes[snapped].tolist(), 
+                           population[snapped].tolist()):
+        prize_nodes[node] = prize_nodes.get(node, 0) + value
+
+    snap_report = {
+        'snap_to': snap_to,
+        'settlements': len(points),
+        'snapped': int(snapped.sum()),
+        'dropped': int((~snapped).sum()),
+        'dropped_population': float(population[~snapped].sum()),
+        'mean_snap_distance': float(distances[snapped].mean()) 
+            if snapped.any() else 0.0,
+        'max_snap_distance': float(distances[snapped].max()) 
+            if snapped.any() else 0.0,
+    }
+
+    return graph, prize_nodes, settlement_nodes, snap_report
+
+
+def remap_nodes(prize_nodes, settlement_nodes, node_map):
+    """
+    This function renumbers the prize and settlement nodes after nodes of 
+    the road graph were removed or merged.
+
+    Parameters
+    ----------
+    prize_nodes : dict
+        Population keyed by node id.
+    settlement_nodes : array
+        Node id of each population row, -1 when it was dropped.
+    node_map : array
+        New id of each old node, -1 for removed nodes.
+
+    Returns
+    -------
+    prize_nodes : dict
+        Population keyed by new node id, without removed nodes.
+    settlement_nodes : array
+        New node id of each population row, -1 when it was dropped.
+
+    """
+    prize_nodes = {int(node_map[node]): value 
+                   for node, value in prize_nodes.items() 
+                   if node_map[node] >= 0}
+    settlement_nodes = np.where(settlement_nodes >= 0, 
+                                node_map[np.maximum(settlement_nodes, 0)], -1)
+
+    return prize_nodes, settlement_nodes
+
+
+def prune_components(graph, prize_nodes, settlement_nodes, components='root', 
+                     bridge_factor=1.0):
+    """
+    This function labels the connected components of the road graph once, 
+    drops every component without a prize and, with `components='bridge'`, 
+    links the remaining ones with straight-line edges.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph with the settlements snapped.
+    prize_nodes : dict
+        Population keyed by node id.
+    settlement_nodes : array
+        Node id of each population row, -1 when it was dropped.
+    components : string
+        'root', 'split' or 'bridge', see `run_pcst_from_shapefiles`.
+    bridge_factor : float
+        Cost of a bridging link per metre of straight-line length.
+
+    Returns
+    -------
+    graph : RoadGraph
+        Road graph restricted to the prize-bearing components.
+    prize_nodes : dict
+        Population keyed by new node id.
+    settlement_nodes : array
+        New node id of each population row, -1 when it was dropped.
+    bridges : array
+        (k, 2) end nodes of the bridging links.
+    component_report : dict
+        Component counts, dropped size and the breakdown of every 
+        prize-bearing component.
+
+    """
+    if components not in COMPONENT_MODES:
+        raise ValueError("Unknown component mode '{}'.".format(components))
+
+    count, labels = graph.components()
+    prize_ids = np.fromiter(prize_nodes, dtype=np.int64, 
+                            count=len(prize_nodes))
+    population = np.fromiter(prize_nodes.values(), dtype=np.float64, 
+                             count=len(prize_nodes))
+    component_nodes = np.bincount(labels, minlength=count)
+    component_edges = np.bincount(labels[graph.edges[:, 0]], minlength=count)
+    component_prizes = np.bincount(labels[prize_ids], minlength=count)
+    component_population = np.bincount(labels[prize_ids], weights=population, 
+                                       minlength=count)
+
+    kept = np.flatnonzero(component_prizes > 0)
+    kept = kept[np.argsort(-component_population[kept], kind='stable')]
+    component_report = {
+        'mode': components,
+        'components': int(count),
+        'prize_components': len(kept),
+        'dropped_nodes': int(graph.num_nodes - component_nodes[kept].sum()),
+        'dropped_edges': int(graph.num_edges - component_edges[kept].sum()),
+        'breakdown': [{'nodes': int(component_nodes[c]), 
+                       'edges': int(component_edges[c]), 
+                       'prizes': int(component_prizes[c]), 
+                       'population': float(component_population[c])} 
+                      for c in kept],
+    }
+
+    keep = component_prizes[labels] > 0
+    graph, node_map, _ = graph.subgraph(keep)
+    prize_nodes, settlement_nodes = remap_nodes(prize_nodes, settlement_nodes, 
+                                                node_map)
+
+    bridges = np.zeros((0, 2), dtype=np.int64)
+    if components == 'bridge' and len(kept) > 1:
+        _, labels = np.unique(labels[keep], return_inverse=True)
+        graph, bridges = bridge_components(graph, labels, bridge_factor)
+        lengths = np.hypot(*(graph.coords[bridges[:, 0]] - 
+                             graph.coords[bridges[:, 1]]).T)
+        component_report['bridges'] = len(bridges)
+        component_report['bridge_km'] = float(lengths.sum()) / 1000
+
+    return graph, prize_nodes, settlement_nodes, bridges, component_report
+
+
+def bridge_components(graph, labels, bridge_factor=1.0):
+    """
+    This function joins the components of a graph into one with the 
+    shortest set of straight-line links between their closest nodes.
+
+    The closest pair of nodes of every two components is found by querying 
+    the nodes of the smaller one against a KD-tree of the larger, and a 
+    minimum spanning tree over those pairs picks the links.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph.
+    labels : array
+        Component of each node, numbered from zero.
+    bridge_factor : float
+        Cost of a link per metre of straight-line length.
+
+    Returns
+    -------
+    graph : RoadGraph
+        Road graph extended with the links.
+    bridges : array
+        (k, 2) end nodes of the links.
+
+    """
+    order = np.argsort(labels, kind='stable')
+    groups = np.split(order, np.cumsum(np.bincount(labels))[:-1])
+    trees = [cKDTree(graph.coords[group]) for group in groups]
+
+    pairs = []
+    for i in range(len(groups)):
+        for j in range(i + 1, len(groups)):
+            small, large = (i, j) if len(groups[i]) <= len(groups[j]) else (j, i)
+            distances, nearest = trees[large].query(graph.coords[groups[small]])
+            best = int(np.argmin(distances))
+            pairs.append((float(distances[best]), i, j, groups[small][best], 
+                          groups[large][nearest[best]]))
+
+    # Kruskal over the closest pairs
+    parent = list(range(len(groups)))
+
+    def find(c):
+        while parent[c] != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+        return c
+
+    bridges, weights = [], []
+    for distance, i, j, u, v in sorted(pairs):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_i] = root_j
+            bridges.append((u, v))
+            weights.append(distance * bridge_factor)
+
+    bridges = np.array(bridges, dtype=np.int64).reshape(-1, 2)
+    graph = graph.add_edges(np.zeros((0, 2)), bridges[:, 0], bridges[:, 1], 
+                            np.array(weights))
+
+    return graph, bridges
+
+
+def contract_graph(graph, prize_nodes, settlement_nodes, bridges=None):
+    """
+    This function contracts the degree-2 chains of a snapped road graph, 
+    keeping every prize node and the ends of bridging links, and renumbers 
+    the nodes accordingly.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph with the settlements snapped.
+    prize_nodes : dict
+        Population keyed by node id.
+    settlement_nodes : array
+        Node id of each population row, -1 when it was dropped.
+    bridges : array
+        (k, 2) end nodes of bridging links, kept as they are.
+
+    Returns
+    -------
+    graph : RoadGraph
+        Contracted road graph.
+    prize_nodes : dict
+        Population keyed by contracted node id.
+    settlement_nodes : array
+        Contracted node id of each population row, -1 when it was dropped.
+    bridges : array
+        (k, 2) contracted end nodes of the bridging links.
+
+    """
+    bridges = np.zeros((0, 2), dtype=np.int64) if bridges is None else bridges
+    protected = np.concatenate([np.fromiter(prize_nodes, dtype=np.int64), 
+                                bridges.reshape(-1)])
+    graph, node_map = graph.contract_chains(protected)
+    prize_nodes, settlement_nodes = remap_nodes(prize_nodes, settlement_nodes, 
+                                                node_map)
+
+    return graph, prize_nodes, settlement_nodes, node_map[bridges]
+
+
+def euclidean_ratio(graph):
+    """
+    This function finds the smallest edge weight per metre of straight-line 
+    distance between its end nodes. Path costs are never below this ratio 
+    times the straight-line distance between their ends, whatever cost 
+    model or contraction set the weights.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Weighted road graph in a projected coordinate system.
+
+    Returns
+    -------
+    ratio : float
+        Lower bound on cost per metre, 0 when nothing can be bounded.
+
+    """
+    chords = np.hypot(*(graph.coords[graph.edges[:, 0]] - 
+                        graph.coords[graph.edges[:, 1]]).T)
+    positive = chords > 0
+    if not positive.any():
+        return 0.0
+
+    return max(0.0, float(np.min(graph.edge_weights[positive] / 
+                                 chords[positive])))
+
+
+def prune_prizes(graph, prize_nodes, root, prize_weight=1000000, 
+                 strategy='root', ratio=None):
+    """
+    This function drops the settlements the greedy solver can never connect 
+    with profit, using Euclidean lower bounds before any graph search.
+
+    With the 'root' strategy a settlement is priced by its path from the 
+    root, so it is dropped when the bound from the root reaches its prize. 
+    With the 'tree' strategy every tree node but the root lies on a 
+    profitable path to another settlement, so a settlement out of reach of 
+    the root also needs some other settlement closer than the sum of their 
+    prizes; a KD-tree over the settlement coordinates counts the neighbours 
+    within that reach. Dropped settlements still count when the tree 
+    passes through them.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Weighted road graph in a projected coordinate system.
+    prize_nodes : dict
+        Population of each settlement keyed by its node id.
+    root : int
+        Node the tree is anchored on, always kept.
+    prize_weight : float
+        Multiplier converting population into the same units as path cost.
+    strategy : string
+        Greedy strategy, 'root' or 'tree'.
+    ratio : float
+        `euclidean_ratio` of the graph, computed when None.
+
+    Returns
+    -------
+    prize_nodes : dict
+        The settlements that may still be connected, in the same order.
+    report : dict
+        Prize count, dropped count and the ratio used.
+
+    """
+    ratio = euclidean_ratio(graph) if ratio is None else ratio
+    nodes = np.fromiter(prize_nodes, dtype=np.int64, count=len(prize_nodes))
+    values = np.fromiter(prize_nodes.values(), dtype=np.float64, 
+                         count=len(prize_nodes)) * prize_weight
+    keep = np.ones(len(nodes), dtype=bool)
+
+    if ratio > 0 and len(nodes) > 1:
+        coords = graph.coords[nodes]
+        keep = ratio * np.hypot(*(coords - graph.coords[root]).T) < values
+        if strategy == 'tree':
+            # Neighbours within reach, not counting the settlement itself
+            others = nodes != root
+            reach = (values + values[others].max()) / ratio
+            near = cKDTree(coords[others]).query_ball_point(
+                coords, np.nextafter(reach, 0), return_length=True)
+            keep |= near > others
+        keep |= nodes == root
+
+    report = {'prizes': len(nodes), 'pruned_prizes': int((~keep).sum()), 
+              'euclid_ratio': ratio}
+    if keep.all():
+        return prize_nodes, report
+
+    return {node: prize_nodes[node] for node in nodes[keep].tolist()}, report
+
+
+def shortest_path_tree(graph, root, limit=np.inf):
+    """
+    This function computes the single-source shortest-path tree of the root.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Weighted road graph.
+    root : int
+        Source node of the tree.
+    limit : float
+        Nodes farther than this from the root are left unreached.
+
+    Returns
+    -------
+    dist : array
+        Shortest path distance from the root to every node, inf when 
+        unreachable.
+    pred : array
+        Predecessor of every node on its path from the root, negative for 
+        the root and unreachable nodes.
+
+    """
+    dist, pred = dijkstra(graph.to_csgraph(), indices=root, 
+                          return_predecessors=True, limit=limit)
+
+    return dist, pred
+
+
+def greedy_pcst(graph, prize_nodes, root, prize_weight=1000000, tree=None, 
+                budget=None):
+    """
+    This function grows the greedy prize-collecting tree from the root.
+
+    Root-to-target distances never change while the tree grows, so the 
+    targets are ranked once by their score over a single shortest-path tree 
+    and added in that order, skipping any already covered by earlier paths.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Weighted road graph.
+    prize_nodes : dict
+        Population of each settlement keyed by its node id.
+    root : int
+        Node the tree is anchored on.
+    prize_weight : float
+        Multiplier converting population into the same units as path cost.
+    tree : tuple
+        `shortest_path_tree` of the root to reuse, computed when None.
+    budget : SolveBudget
+        Stops adding paths when spent.
+
+    Returns
+    -------
+    selected : list
+        Ids of the selected road edges.
+    included : set
+        Nodes covered by the selected tree.
+
+    """
+    dist, pred = tree if tree is not None else shortest_path_tree(graph, root)
+
+    # sorted() is stable, so equal scores keep the prize_nodes order
+    ranked = sorted(((prize_nodes[target] * prize_weight - dist[target], 
+                      target) for target in prize_nodes 
+                      if np.isfinite(dist[target])), 
+                    key=lambda item: item[0], reverse=True)
+
+    selected = []
+    included = {root}
+
+    for score, target in ranked:
+        if score <= 0:
+            break
+        if target in included:
+            continue
+        if budget is not None:
+            if not budget.allows():
+                break
+            budget.iterations += 1
+
+        v = target
+        while v not in included:
+            u = int(pred[v])
+            selected.append(graph.edge_id(u, v))
+            included.add(v)
+            v = u
+
+    return selected, included
+
+
+def tree_greedy_pcst(graph, prize_nodes, root, prize_weight=1000000, 
+                     seed_edges=None, skipped=None, budget=None):
+    """
+    This function grows the greedy prize-collecting tree from the whole tree.
+
+    Each remaining target is priced by its distance to the nearest node 
+    already in the tree rather than to the root. The distances come from a 
+    multi-source Dijkstra that is updated incrementally: when a path joins 
+    the tree its nodes become zero-distance sources, and only nodes whose 
+    distance improves are relaxed again. Nodes are not relaxed beyond the 
+    largest prize still unconnected, since no longer path pays. Growth can 
+    start from an existing tree instead of the root alone, as when 
+    repairing a previous solution.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Weighted road graph.
+    prize_nodes : dict
+        Population of each settlement keyed by its node id.
+    root : int
+        Node the tree is anchored on.
+    prize_weight : float
+        Multiplier converting population into the same units as path cost.
+    seed_edges : list
+        Edges of a tree holding the root to grow from.
+    skipped : list
+        Receives the number of relaxations cut by the bound per iteration.
+    budget : SolveBudget
+        Stops adding paths when spent.
+
+    Returns
+    -------
+    selected : list
+        Ids of the selected road edges.
+    included : set
+        Nodes covered by the selected tree.
+
+    """
+    order = {target: i for i, target in enumerate(prize_nodes)}
+    indptr = graph.indptr.tolist()
+    indices, weights, edge_ids = graph.indices, graph.weights, graph.edge_ids
+    dist = [float('inf')] * graph.num_nodes
+    pred_edge = [-1] * graph.num_nodes
+    candidates = []
+
+    selected = list(seed_edges) if seed_edges is not None else []
+    included = {root}
+    included.update(graph.edges[selected].ravel().tolist())
+    for u in included:
+        dist[u] = 0.0
+    frontier = [(0.0, u) for u in sorted(included)]
+    values = sorted(((value * prize_weight, node) 
+                     for node, value in prize_nodes.items()), reverse=True)
+    largest = 0
+
+    while True:
+        while largest < len(values) and values[largest][1] in included:
+            largest += 1
+        limit = values[largest][0] if largest < len(values) else 0.0
+        cut = 0
+        while frontier:
+            d, u = heapq.heappop(frontier)
+            if d > dist[u]:
                 continue
-            coords = list(row.geometry.coords)
-            for i in range(len(coords) - 1):
-                u = coords[i]
-                v = coords[i+1]
-                dist = Point(u).distance(Point(v))
-                G.add_edge(u, v, weight=dist, geometry=LineString([u, v]))
-
-        graph_nodes = list(G.nodes)
-
-        prize_nodes = {}
-        node_coords = {}
-        for _, row in population_nodes.iterrows():
-            point = row.geometry
-            original_coord = (point.x, point.y)
-            nearest_coord = get_nearest_graph_node(original_coord, graph_nodes)
-            population = row['population']
-            prize_nodes[original_coord] = population 
-            node_coords[original_coord] = row
-
-            if original_coord != nearest_coord:
-                dist = Point(original_coord).distance(Point(nearest_coord))
-                G.add_edge(original_coord, nearest_coord, weight=dist, geometry=LineString([original_coord, nearest_coord]))
-                graph_nodes.append(original_coord)
-
-        if not prize_nodes:
-            raise ValueError("No population nodes matched to the road network.")
-
-        root = max(prize_nodes, key=prize_nodes.get)
-
-        T = nx.Graph()
-        T.add_node(root)
-        included = {root}
-
-        while True:
-            best_score = float('-inf')
-            best_path = None
-            best_target = None
-            candidates = 0
-
-            for target in prize_nodes:
-                if target in included:
+            start, end = indptr[u], indptr[u + 1]
+            for v, w, e in zip(indices[start:end].tolist(), 
+                               weights[start:end].tolist(), 
+                               edge_ids[start:end].tolist()):
+                d_v = d + w
+                if d_v >= dist[v]:
                     continue
-                if not G.has_node(target):
-                    continue
-                try:
-                    path = nx.shortest_path(G, source=root, target=target, weight='weight')
-                    cost = sum(G[u][v]['weight'] for u, v in zip(path[:-1], path[1:]))
-                    score = prize_nodes[target] * 1000000 - cost
-                    candidates += 1
-                    if score > best_score:
-                        best_score = score
-                        best_path = path
-                        best_target = target
-                except nx.NetworkXNoPath:
+                if d_v >= limit:
+                    cut += 1
                     continue
+                dist[v] = d_v
+                pred_edge[v] = e
+                heapq.heappush(frontier, (d_v, v))
+                if v in order and v not in included:
+                    score = prize_nodes[v] * prize_weight - d_v
+                    heapq.heappush(candidates, (-score, order[v], d_v, v))
+        if skipped is not None:
+            skipped.append(cut)
+
+        target = None
+        while candidates:
+            neg_score, _, d, v = heapq.heappop(candidates)
+            if v in included or d != dist[v]:
+                continue
+            if -neg_score > 0:
+                target = v
+            break
 
-            if candidates == 0 or best_score <= 0 or best_path is None:
+        if target is None:
+            break
+        if budget is not None:
+            if not budget.allows():
                 break
+            budget.iterations += 1
 
-            for u, v in zip(best_path[:-1], best_path[1:]):
-                edge_data = G.get_edge_data(u, v, default={})
-                if 'geometry' in edge_data:
-                    T.add_edge(u, v, **edge_data)
-                included.add(u)
-                included.add(v)
+        v = target
+        while v not in included:
+            e = pred_edge[v]
+            a, b = graph.edges[e]
+            selected.append(e)
+            included.add(v)
+            dist[v] = 0.0
+            heapq.heappush(frontier, (0.0, v))
+            v = int(a if b == v else b)
 
-        selected_edges = []
-        for u, v, data in T.edges(data=True):
-            geom = data.get('geometry')
-            if geom:
-                selected_edges.append({'geometry': geom, 'weight': data.get('weight', 0)})
+    return selected, included
 
-        if not selected_edges:
-            raise ValueError("No road segments with geometry were selected.")
 
-        selected_roads = gpd.GeoDataFrame(selected_edges, geometry='geometry', crs=roads.crs)
+def solve_pcst(graph, prize_nodes, engine='greedy', strategy='root', 
+               prize_weight=1000000, tree_cost=None, tree=None, prune=True, 
+               pruning=None, budget=None):
+    """
+    This function solves the PCST on a road graph with the chosen engine, 
+    rooted at the largest settlement.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph with the settlements snapped.
+    prize_nodes : dict
+        Population keyed by node id.
+    engine : string
+        'greedy' or 'gw', see `run_pcst_from_shapefiles`.
+    strategy : string
+        Greedy growth mode, 'root' or 'tree'.
+    prize_weight : float
+        Multiplier converting population into metres of fiber.
+    tree_cost : float
+        With the 'gw' engine, the cost of each tree of an unrooted forest.
+    tree : tuple
+        Shortest-path tree of the root reused by the greedy 'root' strategy.
+    prune : bool
+        Drop the settlements the greedy solver can never connect with 
+        profit before searching, see `prune_prizes`.
+    pruning : dict
+        Accumulates the greedy pruning counts: prizes, pruned prizes, 
+        the Euclidean ratio, the nodes the bounded shortest-path tree left 
+        unreached with the 'root' strategy and the relaxations skipped by 
+        the bound in each iteration with 'tree'.
+    budget : SolveBudget
+        Time and iteration budget of the greedy engine.
 
-        selected_nodes = []
-        for coord in included:
-            if coord in node_coords:
-                selected_nodes.append(node_coords[coord])
-        selected_population_nodes = gpd.GeoDataFrame(selected_nodes, crs=population_nodes.crs)
+    Returns
+    -------
+    selected : list
+        Ids of the selected edges.
+    included : set
+        Nodes covered by the solution.
+    trees : int
+        Number of trees in the solution.
 
-        road_key = os.path.basename(road_shapefile).lower()
+    """
+    root = max(prize_nodes, key=prize_nodes.get)
+    report = {'prizes': len(prize_nodes), 'pruned_prizes': 0}
+    unreached = None
+    cut = []
 
-        basename = os.path.splitext(os.path.basename(road_shapefile))[0]  # e.g. "SLE.1.1.11_1"
-        region_code = basename.split('_')[0]  # "SLE.1.1.11"
-        dot_count = region_code.count('.')  # Count dots
+    if engine == 'greedy' and prune:
+        prize_nodes, report = prune_prizes(graph, prize_nodes, root, 
+                                           prize_weight, strategy)
 
-        if dot_count == 3:
-            folder_suffix = 'sub_regions'
-        elif dot_count == 2:
-            folder_suffix = 'regions'
+    if engine == 'gw':
+        prizes = np.zeros(graph.num_nodes)
+        prizes[list(prize_nodes)] = list(prize_nodes.values())
+        selected, included, trees = gw_pcsf(
+            graph, prizes * prize_weight, 
+            root=None if tree_cost is not None else root, tree_cost=tree_cost)
+        return selected.tolist(), set(included.tolist()), trees
+    elif engine != 'greedy':
+        raise ValueError("Unknown PCST engine '{}'.".format(engine))
+    elif strategy == 'root':
+        if tree is None:
+            # No path longer than the largest prize but the root's pays
+            limit = max((value for node, value in prize_nodes.items() 
+                         if node != root), default=0) * prize_weight
+            tree = shortest_path_tree(graph, root, limit)
+            unreached = int(np.isinf(tree[0]).sum())
+        selected, included = greedy_pcst(graph, prize_nodes, root, 
+                                         prize_weight, tree, budget)
+    elif strategy == 'tree':
+        selected, included = tree_greedy_pcst(graph, prize_nodes, root, 
+                                              prize_weight, skipped=cut, 
+                                              budget=budget)
+    else:
+        raise ValueError("Unknown PCST strategy '{}'.".format(strategy))
+
+    if pruning is not None:
+        for key in ('prizes', 'pruned_prizes'):
+            pruning[key] = pruning.get(key, 0) + report[key]
+        if 'euclid_ratio' in report:
+            pruning['euclid_ratio'] = min(report['euclid_ratio'], 
+                                          pruning.get('euclid_ratio', np.inf))
+        if unreached is not None:
+            pruning['unreached_nodes'] = (pruning.get('unreached_nodes', 0) 
+                                          + unreached)
+        if cut:
+            pruning.setdefault('cut_per_iteration', []).extend(cut)
+
+    return selected, included, 1
+
+
+def solve_components(graph, prize_nodes, **kwargs):
+    """
+    This function solves every connected component of the road graph 
+    holding a prize independently, each rooted at its largest settlement.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph with the settlements snapped.
+    prize_nodes : dict
+        Population keyed by node id.
+    **kwargs
+        Options of `solve_pcst`.
+
+    Returns
+    -------
+    selected : list
+        Ids of the selected edges.
+    included : set
+        Nodes covered by the solution.
+    trees : int
+        Number of trees in the solution.
+
+    """
+    _, labels = graph.components()
+    prize_ids = np.fromiter(prize_nodes, dtype=np.int64, 
+                            count=len(prize_nodes))
+
+    selected, included, trees = [], set(), 0
+    for component in np.unique(labels[prize_ids]):
+        mask = labels == component
+        subgraph, node_map, edge_ids = graph.subgraph(mask)
+        sub_prizes = {int(node_map[node]): value 
+                      for node, value in prize_nodes.items() 
+                      if mask[node]}
+        sub_selected, sub_included, sub_trees = solve_pcst(
+            subgraph, sub_prizes, **kwargs)
+        nodes = np.flatnonzero(mask)
+        selected.extend(edge_ids[sub_selected].tolist())
+        included.update(nodes[list(sub_included)].tolist())
+        trees += sub_trees
+
+    return selected, included, trees
+
+
+def load_previous_solution(warm_start, road_shapefile, output_folder, 
+                           file_id):
+    """
+    This function reads the solution a region got in an earlier run.
+
+    Parameters
+    ----------
+    warm_start : string or bool
+        True for the shapefiles this run would write, otherwise the path 
+        of a GeoPackage or GeoParquet dataset written by a result sink, or 
+        of an edge file.
+    road_shapefile : string
+        Path to the regional street shapefile.
+    output_folder : string
+        Folder receiving the solution of this run.
+    file_id : string
+        Identifier of the region.
+
+    Returns
+    -------
+    edges : geodataframe
+        Previously selected road edges in EPSG:3857, None when the region 
+        has no earlier solution.
+    nodes : geodataframe
+        Previously selected settlements, None when unavailable.
+
+    """
+    if warm_start is True:
+        paths = solution_paths(road_shapefile, output_folder, file_id)
+        layers = [gpd.read_file(path) if os.path.exists(path) else None 
+                  for path in paths]
+    elif os.path.isdir(warm_start):
+        layers = []
+        for layer in ('edges', 'nodes'):
+            folder = os.path.join(warm_start, layer)
+            layers.append(gpd.read_parquet(
+                folder, filters=[('file_id', '=', file_id)]) 
+                if os.path.exists(folder) else None)
+    elif warm_start.endswith('.gpkg'):
+        level = region_level(road_shapefile)
+        names = (set(gpd.list_layers(warm_start)['name']) 
+                 if os.path.exists(warm_start) else set())
+        # Quotes in the id are doubled to stay inside the SQL literal
+        where = "file_id = '{}'".format(file_id.replace("'", "''"))
+        layers = [gpd.read_file(warm_start, layer='{}_{}'.format(layer, level), 
+                                where=where) 
+                  if '{}_{}'.format(layer, level) in names else None 
+                  for layer in ('edges', 'nodes')]
+    else:
+        layers = [gpd.read_file(warm_start), None]
+
+    for i, layer in enumerate(layers):
+        if layer is not None and 'file_id' in layer.columns:
+            layer = layer[layer['file_id'] == file_id]
+        if layer is not None and len(layer):
+            layers[i] = layer.to_crs(GRAPH_CRS)
         else:
-            folder_suffix = 'other'
+            layers[i] = None
+
+    return tuple(layers)
+
+
+def warm_start_pcst(graph, prize_nodes, previous_edges, previous_nodes=None, 
+                    prize_weight=1000000, resolution=0.01, budget=None):
+    """
+    This function repairs an earlier solution tree for new prizes instead of 
+    solving from scratch.
+
+    The previous edges are matched to the graph by their vertices, so the 
+    match holds whether either graph was contracted. The part of the old 
+    tree around the largest settlement is kept, branches whose settlements 
+    no longer pay for them are pruned, and the tree is grown again with 
+    `tree_greedy_pcst`, seeded with what is left.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Road graph with the settlements snapped.
+    prize_nodes : dict
+        New population keyed by node id.
+    previous_edges : geodataframe
+        Edges of the earlier solution in EPSG:3857.
+    previous_nodes : geodataframe
+        Settlements of the earlier solution, giving the prize delta.
+    prize_weight : float
+        Multiplier converting population into metres of fiber.
+    resolution : float
+        Grid cell size the graph was built with.
+    budget : SolveBudget
+        Stops the regrowth when spent.
+
+    Returns
+    -------
+    selected : list
+        Ids of the selected edges.
+    included : set
+        Nodes covered by the solution.
+    report : dict
+        Matched, pruned, reused and added edges, the reused share of the 
+        new tree and the prize change on the old tree.
+
+    """
+    coords = shapely.get_coordinates(previous_edges.geometry.values)
+    index = NodeIndex.from_coords(coords, resolution)
+
+    # Graph edges lying entirely on the old geometry
+    on_tree = np.zeros(graph.num_nodes, dtype=bool)
+    nodes = graph.nodes_at(coords, resolution)
+    on_tree[nodes[nodes >= 0]] = True
+    candidates = np.flatnonzero(on_tree[graph.edges[:, 0]] & 
+                                on_tree[graph.edges[:, 1]])
+    vertices, owner = shapely.get_coordinates(
+        graph.edge_geometries(candidates), return_index=True)
+    off_tree = np.zeros(len(candidates), dtype=bool)
+    off_tree[owner[index.lookup(vertices) < 0]] = True
+    matched = candidates[~off_tree]
+
+    prizes = np.zeros(graph.num_nodes)
+    prizes[list(prize_nodes)] = list(prize_nodes.values())
+    prizes *= prize_weight
+
+    # Anchor on the largest settlement, or the largest one left on the tree
+    root = max(prize_nodes, key=prize_nodes.get)
+    tree_nodes = np.unique(graph.edges[matched])
+    if len(tree_nodes) and not np.isin(root, tree_nodes):
+        root = int(tree_nodes[np.argmax(prizes[tree_nodes])])
+    kept, _ = strong_pruning(graph.num_nodes, graph.edges[:, 0].tolist(), 
+                             graph.edges[:, 1].tolist(), 
+                             graph.edge_weights.tolist(), prizes.tolist(), 
+                             matched.tolist(), root)
+
+    selected, included = tree_greedy_pcst(graph, prize_nodes, root, 
+                                          prize_weight, seed_edges=kept, 
+                                          budget=budget)
+
+    selected_km = float(edge_lengths(graph, selected).sum()) / 1000
+    reused_km = float(edge_lengths(graph, kept).sum()) / 1000
+    report = {
+        'previous_edges': len(previous_edges),
+        'previous_km': float(previous_edges.length.sum()) / 1000,
+        'matched_edges': len(matched),
+        'pruned_edges': len(matched) - len(kept),
+        'reused_edges': len(kept),
+        'added_edges': len(selected) - len(kept),
+        'reused_km': reused_km,
+        'reused_fraction': reused_km / selected_km if selected_km else 0.0,
+        'tree_prize': float(prizes[tree_nodes].sum() / prize_weight),
+    }
+    if previous_nodes is not None and 'population' in previous_nodes:
+        report['previous_prize'] = float(previous_nodes['population'].sum())
+        report['prize_delta'] = report['tree_prize'] - report['previous_prize']
+
+    return selected, included, report
+
+
+def prepare_region(road_shapefile, population_shapefile, record, timer, 
+                   snap_to='node', max_snap_distance=None, resolution=0.01, 
+                   graph_cache=None, contract=True, components='root', 
+                   bridge_factor=1.0, cost_model=None, shared_graph=None, 
+                   min_population=None):
+    """
+    This function loads the road graph and settlements of a region and 
+    prepares the graph for solving: snapping, component pruning and chain 
+    contraction.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the regional street shapefile.
+    population_shapefile : string
+        Path to the regional population node shapefile.
+    record : dict
+        Run record receiving the graph size, snap and component reports.
+    timer : PhaseTimer
+        Receives the time of each phase.
+    snap_to, max_snap_distance, resolution, graph_cache, contract, 
+    components, bridge_factor, cost_model, shared_graph, min_population
+        See `run_pcst_from_shapefiles`.
+
+    Returns
+    -------
+    graph : RoadGraph
+        Road graph ready to solve.
+    population_nodes : geodataframe
+        Settlements in EPSG:3857, above the threshold if any.
+    prize_nodes : dict
+        Population keyed by node id.
+    settlement_nodes : array
+        Node id of each settlement, -1 when it was dropped.
+    bridges : array
+        (k, 2) end nodes of the bridging links.
+
+    """
+    if shared_graph is not None:
+        with timer.phase('read'):
+            graph = SharedGraph.attach(shared_graph)
+    else:
+        cost_model = load_cost_model(cost_model, 
+                                     os.path.basename(road_shapefile)[:3])
+        graph = load_road_graph(road_shapefile, resolution, graph_cache, 
+                                timer, cost_model)
+    with timer.phase('read'):
+        population_nodes = gpd.read_file(population_shapefile)
+    if min_population:
+        small = population_nodes['population'] < min_population
+        population_nodes = population_nodes[~small]
+        record['below_threshold'] = int(small.sum())
+    with timer.phase('reproject'):
+        population_nodes = population_nodes.to_crs(GRAPH_CRS)
+
+    with timer.phase('snap'):
+        graph, prize_nodes, settlement_nodes, snap_report = \
+            snap_population_nodes(graph, population_nodes, snap_to, 
+                                  max_snap_distance, resolution)
+    record.update(graph.memory_usage())
+    record['prizes'] = len(prize_nodes)
+    record['snap'] = snap_report
+
+    if not prize_nodes:
+        raise ValueError("No population nodes matched to the road network.")
+
+    with timer.phase('components'):
+        (graph, prize_nodes, settlement_nodes, bridges, 
+         record['components']) = prune_components(
+            graph, prize_nodes, settlement_nodes, components, 
+            bridge_factor)
+
+    if contract:
+        with timer.phase('contract'):
+            graph, prize_nodes, settlement_nodes, bridges = \
+                contract_graph(graph, prize_nodes, settlement_nodes, 
+                               bridges)
+        record['uncontracted_nodes'] = record['graph_nodes']
+        record['uncontracted_edges'] = record['graph_edges']
+        record.update(graph.memory_usage())
+
+    return graph, population_nodes, prize_nodes, settlement_nodes, bridges
+
+
+def run_pcst_from_shapefiles(road_shapefile, population_shapefile, 
+                             output_folder, file_id, strategy='root', 
+                             snap_to='node', max_snap_distance=None, 
+                             resolution=0.01, engine='greedy', 
+                             prize_weight=1000000, tree_cost=None, 
+                             graph_cache=None, contract=True, 
+                             components='root', bridge_factor=1.0, 
+                             stream=False, warm_start=None, cost_model=None, 
+                             time_limit=None, max_iterations=None, 
+                             shared_graph=None, min_population=None):
+    """
+    This function solves the PCST for one region and writes the selected 
+    road edges and population nodes as shapefiles.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the regional street shapefile.
+    population_shapefile : string
+        Path to the regional population node shapefile.
+    output_folder : string
+        Folder receiving the `edges` and `nodes` outputs.
+    file_id : string
+        Identifier used to name the output files.
+    strategy : string
+        'root' prices every target by its shortest path from the root, 
+        'tree' by its shortest path from the tree grown so far.
+    snap_to : string
+        'node' or 'segment', see `snap_population_nodes`.
+    max_snap_distance : float
+        Settlements farther than this from any road, in metres, are dropped 
+        before solving.
+    resolution : float
+        Distance in metres below which vertices are merged.
+    engine : string
+        'greedy' grows a tree from the largest settlement with the chosen 
+        `strategy`, 'gw' runs the Goemans-Williamson primal-dual solver.
+    prize_weight : float
+        Multiplier converting population into metres of fiber, or metre 
+        equivalents with a cost model.
+    tree_cost : float
+        With the 'gw' engine, solve a forest in which every tree costs this 
+        many metres instead of one tree rooted at the largest settlement.
+    graph_cache : string
+        Folder where compiled road graphs are kept between runs.
+    contract : bool
+        Contract chains of degree-2 road vertices into single edges after 
+        snapping, keeping the settlement nodes. The solution is the same 
+        up to ties and is expanded back to full geometry on export.
+    components : string
+        Components of the road network without settlements are always 
+        dropped. 'root' then solves one tree in the component of the 
+        largest settlement (or a forest with `tree_cost`), 'split' solves 
+        each remaining component on its own and 'bridge' first joins them 
+        with straight-line links, flagged in a `bridge` column.
+    bridge_factor : float
+        Cost of a bridging link per metre, relative to road fiber.
+    stream : bool
+        Return the selected edges and nodes as WKB and attributes under 
+        the record's `tables` key for a result sink instead of writing 
+        shapefiles.
+    warm_start : string or bool
+        Repair the region's previous solution for the new settlements with 
+        `warm_start_pcst` instead of solving from scratch, see 
+        `load_previous_solution` for the accepted locations. Regions 
+        without one are solved normally. Needs a single tree, so neither 
+        components='split' nor `tree_cost` apply.
+    cost_model : CostModel, dict or string
+        Weigh edges by road class, terrain and existing ducts instead of 
+        length alone: a `gambit.costs.CostModel`, its arguments, or an INI 
+        file with a section per country. Lengths are still reported in km.
+    time_limit : float
+        Seconds the job may take. Loading is never interrupted, but once 
+        the time is up the greedy solver stops adding paths and returns the 
+        tree found so far, flagged as `truncated` in the record.
+    max_iterations : int
+        Paths the greedy solver may add, likewise.
+    shared_graph : dict
+        Spec of the region's road graph published with `SharedGraph`, 
+        attached read-only instead of loading `road_shapefile`. It must 
+        have been built with the same `resolution` and `cost_model`.
+    min_population : float
+        Settlement threshold: smaller settlements are left out before 
+        snapping, as if they were not in the population layer.
+
+    Returns
+    -------
+    record : dict
+        Run record with the per-phase timings, graph size, prize count, 
+        selected fiber km, snap report, objective, peak RSS of the worker, 
+        the warm start and greedy pruning reports and the error message if 
+        the region failed.
+
+    """
+    timer = PhaseTimer()
+    budget = SolveBudget(time_limit, max_iterations)
+    record = {'file_id': file_id, 'road_shapefile': road_shapefile, 
+              'population_shapefile': population_shapefile, 
+              'level': region_level(road_shapefile), 'engine': engine, 
+              'strategy': strategy, 'status': 'ok', 'error': None, 
+              'truncated': False}
+
+    try:
+
+        if warm_start and (components == 'split' or tree_cost is not None):
+            raise ValueError("A warm start repairs a single tree, it does "
+                             "not apply to forests.")
 
-        # ✅ Create output folders
-        edge_folder = os.path.join(output_folder, "edges", folder_suffix)
-        node_folder = os.path.join(output_folder, "nodes", folder_suffix)
-        os.makedirs(edge_folder, exist_ok=True)
-        os.makedirs(node_folder, exist_ok=True)
+        (graph, population_nodes, prize_nodes, settlement_nodes, 
+         bridges) = prepare_region(road_shapefile, population_shapefile, 
+                                   record, timer, snap_to, max_snap_distance, 
+                                   resolution, graph_cache, contract, 
+                                   components, bridge_factor, cost_model, 
+                                   shared_graph, min_population)
 
-        selected_roads.to_file(os.path.join(edge_folder, f'{file_id}_solution.shp'))
-        selected_population_nodes.to_file(os.path.join(node_folder, f'{file_id}_solution_nodes.shp'))
+        previous_edges = previous_nodes = None
+        if warm_start:
+            with timer.phase('read'):
+                previous_edges, previous_nodes = load_previous_solution(
+                    warm_start, road_shapefile, output_folder, file_id)
+            record['warm_start'] = {'previous_edges': 0, 
+                                    'reused_fraction': 0.0}
 
+        with timer.phase('solve'):
+            options = {'engine': engine, 'strategy': strategy, 
+                       'prize_weight': prize_weight, 'tree_cost': tree_cost}
+            if engine == 'greedy':
+                options['pruning'] = record['pruning'] = {}
+                options['budget'] = budget
+            if previous_edges is not None:
+                selected, included, record['warm_start'] = warm_start_pcst(
+                    graph, prize_nodes, previous_edges, previous_nodes, 
+                    prize_weight, resolution, budget)
+                trees = 1
+            elif components == 'split':
+                selected, included, trees = solve_components(
+                    graph, prize_nodes, **options)
+            else:
+                selected, included, trees = solve_pcst(graph, prize_nodes, 
+                                                       **options)
+        record['truncated'] = budget.truncated
+        record['iterations'] = budget.iterations
+
+        prizes = np.zeros(graph.num_nodes)
+        prizes[list(prize_nodes)] = list(prize_nodes.values())
+        prizes *= prize_weight
+        record['objective'] = pcst_objective(
+            graph, prizes, selected, list(included), trees, tree_cost or 0)
+        record['selected_edges'] = len(selected)
+        record['selected_cost'] = float(graph.edge_weights[selected].sum())
+
+        if len(selected) == 0:
+            raise ValueError("No road segments with geometry were selected.")
+
+        with timer.phase('write'):
+            selected_roads = gpd.GeoDataFrame(
+                {'weight': graph.edge_weights[selected]}, 
+                geometry=graph.edge_geometries(selected), crs=GRAPH_CRS)
+            record['selected_km'] = float(selected_roads.length.sum()) / 1000
+            if cost_model is not None:
+                selected_roads['length'] = selected_roads.length
+            if components == 'bridge':
+                bridge_ids = [graph.edge_id(u, v) for u, v in bridges.tolist()]
+                selected_roads['bridge'] = np.isin(selected, bridge_ids)
+
+            selected_population_nodes = population_nodes[
+                np.isin(settlement_nodes, list(included))]
+            record['selected_settlements'] = len(selected_population_nodes)
+
+            if stream:
+                record['tables'] = {
+                    'edges': to_table(selected_roads), 
+                    'nodes': to_table(selected_population_nodes)}
+            else:
+                edge_path, node_path = solution_paths(road_shapefile, 
+                                                      output_folder, file_id)
+                # ✅ Create output folders
+                for path in (edge_path, node_path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                selected_roads.to_file(edge_path)
+                selected_population_nodes.to_file(node_path)
 
     except Exception as e:
 
-        return f"❌ {file_id}: {e}"
+        record['status'] = 'error'
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    record['timings'] = timer.timings
+    record['peak_rss_mb'] = peak_rss_mb()
+
+    return record
+
+
+def sweep_prize_weights(road_shapefile, population_shapefile, output_folder, 
+                        file_id, prize_weights=None, budget_km=None, 
+                        engine='greedy', strategy='root', tree_cost=None, 
+                        time_limit=None, max_iterations=None, max_weights=30, 
+                        tolerance=0.01, **kwargs):
+    """
+    This function solves one region for a family of prize weights and 
+    writes the cost versus connected population curve.
+
+    The graph is loaded, snapped and contracted once for the whole family. 
+    With the greedy 'root' strategy the shortest-path tree of the root is 
+    also shared, so each extra weight only re-ranks the settlements.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the regional street shapefile.
+    population_shapefile : string
+        Path to the regional population node shapefile.
+    output_folder : string
+        Folder receiving the `curves` output.
+    file_id : string
+        Identifier used to name the output file.
+    prize_weights : list
+        Multipliers converting population into metres of fiber.
+    budget_km : float
+        Instead of a list, search by bisection for the largest weight whose 
+        solution stays within this many km of fiber. Every weight tried is 
+        kept in the curve.
+    engine, strategy, tree_cost
+        Solver options, see `run_pcst_from_shapefiles`.
+    time_limit, max_iterations
+        Budget of the greedy solver for each weight, see 
+        `run_pcst_from_shapefiles`. Solutions cut short are flagged as 
+        `truncated` in the curve.
+    max_weights : int
+        Most weights tried by the budget search.
+    tolerance : float
+        Relative gap between the bracketing weights ending the search.
+    **kwargs
+        Graph options of `run_pcst_from_shapefiles`, such as `snap_to`, 
+        `contract` or `components`. Other options are rejected.
+
+    Returns
+    -------
+    curve : dataframe
+        Fiber km, connected settlements and population, the objective and 
+        whether the budget cut the solution short for each prize weight, in 
+        increasing weight order.
+    solutions : dict
+        Selected road edges keyed by prize weight.
+
+    """
+    if (prize_weights is None) == (budget_km is None):
+        raise ValueError("Give either prize_weights or budget_km.")
+    graph_options = set(inspect.signature(prepare_region).parameters) - {
+        'road_shapefile', 'population_shapefile', 'record', 'timer'}
+    unknown = sorted(set(kwargs) - graph_options)
+    if unknown:
+        raise TypeError("sweep_prize_weights does not apply {}, only the "
+                        "graph and solver options of "
+                        "run_pcst_from_shapefiles.".format(', '.join(unknown)))
+
+    components = kwargs.get('components', 'root')
+    record = {}
+    graph, population_nodes, prize_nodes, settlement_nodes, bridges = \
+        prepare_region(road_shapefile, population_shapefile, record, 
+                       PhaseTimer(), **kwargs)
+
+    root = max(prize_nodes, key=prize_nodes.get)
+    tree = None
+    if engine == 'greedy' and strategy == 'root' and components != 'split':
+        tree = shortest_path_tree(graph, root)
+
+    population = np.zeros(graph.num_nodes)
+    population[list(prize_nodes)] = list(prize_nodes.values())
+    total_population = population.sum()
+    rows, solutions = [], {}
+
+    def solve(prize_weight):
+        budget = SolveBudget(time_limit, max_iterations)
+        options = {'engine': engine, 'strategy': strategy, 
+                   'prize_weight': prize_weight, 'tree_cost': tree_cost, 
+                   'budget': budget}
+        if components == 'split':
+            selected, included, trees = solve_components(graph, prize_nodes, 
+                                                         **options)
+        else:
+            selected, included, trees = solve_pcst(graph, prize_nodes, 
+                                                   tree=tree, **options)
+        included = list(included)
+        km = float(edge_lengths(graph, selected).sum()) / 1000
+        connected = float(population[included].sum())
+        objective = pcst_objective(graph, population * prize_weight, 
+                                   selected, included, trees, tree_cost or 0)
+        rows.append({'file_id': file_id, 'prize_weight': prize_weight, 
+                     'selected_km': km, 'selected_edges': len(selected), 
+                     'connected_settlements': int(np.isin(
+                         settlement_nodes, included).sum()), 
+                     'connected_population': connected, 
+                     'population_share': connected / total_population, 
+                     'objective': objective['objective'], 'trees': trees, 
+                     'truncated': budget.truncated})
+        solutions[prize_weight] = gpd.GeoDataFrame(
+            {'weight': graph.edge_weights[selected]}, 
+            geometry=graph.edge_geometries(selected), crs=GRAPH_CRS)
+        return km
+
+    if budget_km is None:
+        for prize_weight in prize_weights:
+            solve(float(prize_weight))
+    else:
+        # Grow the upper weight until the budget is exceeded or everything 
+        # reachable is connected, then bisect on a log scale
+        low, high = 0.0, 1.0
+        for _ in range(max_weights):
+            if solve(high) > budget_km or rows[-1]['population_share'] >= 1:
+                break
+            low, high = high, high * 10
+        while (len(rows) < max_weights and low > 0 and 
+               high - low > tolerance * high):
+            middle = np.sqrt(low * high)
+            if solve(middle) > budget_km:
+                high = middle
+            else:
+                low = middle
+        for row in rows:
+            row['within_budget'] = row['selected_km'] <= budget_km
+
+    curve = pd.DataFrame(rows).sort_values('prize_weight', ignore_index=True)
+    folder = os.path.join(output_folder, 'curves')
+    os.makedirs(folder, exist_ok=True)
+    curve.to_csv(os.path.join(folder, f'{file_id}_prize_curve.csv'), 
+                 index=False)
+
+    return curve, solutions
+
+
+def solution_paths(road_shapefile, output_folder, file_id):
+    """
+    This function returns where the solution of a region is written, under 
+    the level given by `region_level`, without creating any folder, so 
+    outputs can be checked without side effects.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the regional street shapefile.
+    output_folder : string
+        Folder receiving the `edges` and `nodes` outputs.
+    file_id : string
+        Identifier used to name the output files.
+
+    Returns
+    -------
+    edge_path : string
+        Path of the selected edges shapefile.
+    node_path : string
+        Path of the selected population nodes shapefile.
+
+    """
+    folder_suffix = region_level(road_shapefile)
+    edge_folder = os.path.join(output_folder, "edges", folder_suffix)
+    node_folder = os.path.join(output_folder, "nodes", folder_suffix)
+
+    return (os.path.join(edge_folder, f'{file_id}_solution.shp'), 
+            os.path.join(node_folder, f'{file_id}_solution_nodes.shp'))
+
+
+def write_run_report(records, report_path, **metadata):
+    """
+    This function writes the run records of a batch as a JSON or Parquet 
+    run report.
+
+    Parameters
+    ----------
+    records : list
+        Run records returned by `run_pcst_from_shapefiles`.
+    report_path : string
+        Output path, written as Parquet when it ends in `.parquet` and as 
+        JSON otherwise.
+    **metadata
+        Batch-level fields stored with the records in the JSON report.
+
+    """
+    folder = os.path.dirname(report_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    if report_path.endswith('.parquet'):
+        pd.json_normalize(records).to_parquet(report_path, index=False)
+    else:
+        with open(report_path, 'w') as f:
+            json.dump(dict(metadata, jobs=records), f, indent=2, default=str)
+
+
+def estimate_job_cost(road_shapefile, population_shapefile):
+    """
+    This function estimates the relative cost of solving one region before 
+    it is dispatched.
+
+    The size of the street .shp grows with the number of road vertices and 
+    the size of the population .shp with the number of prizes, which 
+    together drive graph building, snapping and solving.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the regional street shapefile.
+    population_shapefile : string
+        Path to the regional population node shapefile.
+
+    Returns
+    -------
+    cost : int
+        Estimated cost in input bytes.
+
+    """
+    return max(1, os.path.getsize(road_shapefile) + 
+               os.path.getsize(population_shapefile))
+
+
+def solver_parameters(**kwargs):
+    """
+    This function resolves the options of `run_pcst_from_shapefiles` that 
+    change its solution, filling in the defaults.
+
+    Parameters
+    ----------
+    **kwargs
+        Options passed to `run_pcst_from_shapefiles`.
+
+    Returns
+    -------
+    params : dict
+        Every solution-changing option with its effective value.
+
+    """
+    ignored = ('road_shapefile', 'population_shapefile', 'output_folder', 
+               'file_id', 'graph_cache', 'stream', 'shared_graph')
+    params = {name: parameter.default for name, parameter in inspect.signature(
+        run_pcst_from_shapefiles).parameters.items() if name not in ignored}
+    params.update((key, value) for key, value in kwargs.items() 
+                  if key not in ignored)
+
+    # Round trip through JSON so it compares equal to the manifest copy
+    return json.loads(json.dumps(params, default=str))
+
+
+def load_manifest(manifest_path):
+    """
+    This function reads the manifest of a batch, empty when it does not 
+    exist yet.
 
+    Parameters
+    ----------
+    manifest_path : string
+        Path to the manifest.
 
-    return selected_roads, selected_population_nodes
+    Returns
+    -------
+    manifest : dict
+        Entry of every region finished so far, keyed by file id.
 
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
 
-def batch_pcst_parallel(roads_folder, population_folder, output_folder, max_workers=None):
+
+def write_manifest(manifest, manifest_path):
+    """
+    This function replaces the manifest of a batch in one atomic rename, so 
+    a run killed mid-write leaves the previous manifest intact.
+
+    Parameters
+    ----------
+    manifest : dict
+        Entry of every region finished so far, keyed by file id.
+    manifest_path : string
+        Path to the manifest.
+
+    """
+    staging = manifest_path + '.tmp'
+    with open(staging, 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(staging, manifest_path)
+
+
+def is_up_to_date(entry, road_shapefile, population_shapefile, outputs, 
+                  params):
+    """
+    This function checks whether the solution of a region can be reused.
+
+    Parameters
+    ----------
+    entry : dict
+        Manifest entry of the region, None when it never finished.
+    road_shapefile : string
+        Path to the regional street shapefile.
+    population_shapefile : string
+        Path to the regional population node shapefile.
+    outputs : list
+        Paths holding the solution of the region.
+    params : dict
+        Solver parameters of the current run, see `solver_parameters`.
+
+    Returns
+    -------
+    up_to_date : bool
+        True when the region was solved in full with the same parameters 
+        and its outputs are newer than both inputs.
+
+    """
+    if not entry or entry.get('status') != 'ok' or entry.get(
+            'params') != params:
+        return False
+    if entry.get('record', {}).get('truncated'):
+        # Solved again in the hope of more time
+        return False
+
+    output_times = [file_mtime(path) for path in outputs]
+    if None in output_times:
+        return False
+    input_times = [file_mtime(road_shapefile), 
+                   file_mtime(population_shapefile)]
+
+    return min(output_times) > max(input_times)
+
+
+def estimate_job_memory(road_shapefile, population_shapefile):
+    """
+    This function estimates the peak memory of a worker solving one region 
+    from the size of its inputs.
+
+    A worker holds about WORKER_BASE_MB of interpreter and libraries, and 
+    the geodataframes, graph arrays and solver state scale with the input 
+    shapefiles, measured at about 13 bytes per input byte on the synthetic 
+    benchmarks and rounded up to MEMORY_PER_INPUT_BYTE.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the regional street shapefile.
+    population_shapefile : string
+        Path to the regional population node shapefile.
+
+    Returns
+    -------
+    memory : float
+        Estimated peak memory in MB.
+
+    """
+    inputs = sum(os.path.getsize(os.path.splitext(path)[0] + part) 
+                 for path in (road_shapefile, population_shapefile) 
+                 for part in ('.shp', '.dbf') 
+                 if os.path.exists(os.path.splitext(path)[0] + part))
+
+    return WORKER_BASE_MB + MEMORY_PER_INPUT_BYTE * inputs / 1e6
+
+
+def available_memory_mb():
+    """
+    This function returns the memory available to new processes.
+
+    Returns
+    -------
+    memory : float
+        Available memory in MB, None where it cannot be read.
+
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def batch_pcst_parallel(roads_folder, population_folder, output_folder, 
+                        max_workers=None, strategy='root', engine='greedy', 
+                        max_in_flight=None, report_path=None, 
+                        incremental=False, sink='shapefile', batch_size=50, 
+                        memory_budget=None, max_retries=2, deadline=None, 
+                        **kwargs):
+    """
+    This function runs the PCST for every region with both a street and a 
+    population shapefile, one process per region.
+
+    Regions are dispatched largest first by their estimated cost, so a big 
+    sub-region does not end up running alone after every other core has 
+    gone idle, and the progress bar ETA is weighted by that cost.
+
+    Parameters
+    ----------
+    roads_folder : string
+        Folder holding the regional street shapefiles.
+    population_folder : string
+        Folder holding the regional population shapefiles.
+    output_folder : string
+        Folder receiving the solutions.
+    max_workers : int
+        Number of worker processes, defaults to the number of cores.
+    strategy : string
+        Greedy growth mode passed to `run_pcst_from_shapefiles`.
+    engine : string
+        Solver engine, 'greedy' or 'gw'.
+    max_in_flight : int
+        Most jobs submitted at once, defaults to twice the workers, which 
+        bounds the memory held by queued jobs and their results.
+    report_path : string
+        Run report path, JSON by default or Parquet when it ends in 
+        `.parquet`. Defaults to `pcst_run_report.json` in `output_folder`.
+    incremental : bool
+        Skip every region whose solution is newer than its inputs and was 
+        solved with the same parameters. Progress is kept in a manifest in 
+        `output_folder`, updated as each region finishes, so an interrupted 
+        batch resumes where it stopped.
+    sink : string or ResultSink
+        'shapefile' writes two shapefiles per region from the workers. 
+        'gpkg' (one GeoPackage with a layer per output and level) and 
+        'parquet' (a GeoParquet dataset partitioned by iso3 and level) 
+        have the workers send WKB back to this process, which writes them, 
+        see `gambit.sinks.make_sink`.
+    batch_size : int
+        Regions buffered by the sink between writes.
+    memory_budget : float
+        Memory in MB the running workers may use together, or 'auto' for 
+        80% of the memory available at the start. A region is only started 
+        when its `estimate_job_memory` fits next to the running ones; the 
+        largest that fits goes first, and a region too big for the budget 
+        runs alone. None starts `max_workers` regions regardless.
+    max_retries : int
+        Times a region is run again after its worker died or ran out of 
+        memory. Each such failure halves the number of workers and doubles 
+        the memory estimate of the regions that were running.
+    deadline : float
+        Seconds the whole batch may take. Each region gets the remaining 
+        time in proportion to its share of the estimated cost of the 
+        regions left, times the number of workers, as its `time_limit`; 
+        regions not started by the deadline fail with DeadlineExceeded.
+    **kwargs
+        Further options of `run_pcst_from_shapefiles`, such as `snap_to`, 
+        `max_snap_distance` or `graph_cache`. With `warm_start=True` the 
+        previous solutions are read back from the sink, which then keeps 
+        its output and replaces each region as it is written again.
+
+    Returns
+    -------
+    records : list
+        Run record of every region, failed and skipped regions included.
+
+    """
     road_files = {os.path.basename(f): f for f in glob(os.path.join(roads_folder, '*.shp'))}
     pop_files = {os.path.basename(f): f for f in glob(os.path.join(population_folder, '*.shp'))}
 
     matching_files = sorted(set(road_files.keys()) & set(pop_files.keys()))
     if not matching_files:
         print("⚠️ No matching shapefiles found.")
-        return
+        return []
 
     # Extract ISO3 from any matching file (assuming consistent naming)
     iso3 = os.path.splitext(matching_files[0])[0][:3] if matching_files else "ISO"
 
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_file = {
-            executor.submit(
-                run_pcst_from_shapefiles,
-                road_files[file_name],
-                pop_files[file_name],
-                output_folder,
-                os.path.splitext(file_name)[0]
-            ): file_name
-            for file_name in matching_files
-        }
-
-        # Show ISO3 in progress bar
-        for future in tqdm(as_completed(future_to_file), total = 
-            len(future_to_file), desc = 
-            f"Finding the PCST least cost path between population {iso3} nodes"):
-            try:
-                future.result()
-            except Exception as e:
-                pass
\ No newline at end of file
+    params = solver_parameters(strategy=strategy, engine=engine, **kwargs)
+    params['sink'] = sink if isinstance(sink, str) else type(sink).__name__
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path) if incremental else {}
+    warm_start = kwargs.get('warm_start')
+    sink = make_sink(sink, output_folder, iso3, batch_size, 
+                     append=incremental or bool(warm_start))
+    if sink and warm_start is True:
+        # Previous solutions are read back from the sink's own output
+        kwargs['warm_start'] = sink.path
+    records = []
+
+    if incremental:
+        os.makedirs(output_folder, exist_ok=True)
+        for file_name in list(matching_files):
+            file_id = os.path.splitext(file_name)[0]
+            entry = manifest.get(file_id)
+            outputs = sink.outputs() if sink else solution_paths(
+                road_files[file_name], output_folder, file_id)
+            if is_up_to_date(entry, road_files[file_name], 
+                             pop_files[file_name], outputs, params):
+                records.append(dict(entry['record'], status='skipped'))
+                matching_files.remove(file_name)
+        if records:
+            print("{} regions are up to date and skipped".format(
+                len(records)))
+    if sink and (incremental or warm_start):
+        # Regions solved again must not appear twice in the output, but 
+        # their old output stays readable until the new one is written
+        sink.mark_stale([os.path.splitext(file_name)[0] 
+                         for file_name in matching_files])
+
+    costs = {file_name: estimate_job_cost(road_files[file_name], 
+                                          pop_files[file_name]) 
+             for file_name in matching_files}
+    pending = deque(sorted(matching_files, key=costs.get, reverse=True))
+
+    max_workers = max_workers or os.cpu_count()
+    max_in_flight = max_in_flight or 2 * max_workers
+    if memory_budget == 'auto':
+        memory_budget = 0.8 * (available_memory_mb() or float('inf'))
+    if memory_budget is not None:
+        # Only running jobs may be in flight, or admission means nothing
+        max_in_flight = max_workers
+    footprints = {file_name: estimate_job_memory(road_files[file_name], 
+                                                 pop_files[file_name]) 
+                  for file_name in matching_files}
+    attempts = dict.fromkeys(matching_files, 0)
+
+    started = time.time()
+    unwritten = {}
+
+    def record_written(file_ids):
+        # Regions enter the manifest once their output is on disk
+        for file_id in file_ids:
+            manifest[file_id] = dict(unwritten.pop(file_id), 
+                                     finished=time.time())
+        if incremental and file_ids:
+            write_manifest(manifest, manifest_path)
+
+    def admit():
+        # Largest pending job fitting next to the running ones
+        in_use = sum(footprints[file_name] for file_name in running.values())
+        for file_name in pending:
+            if (memory_budget is None or not running or 
+                    in_use + footprints[file_name] <= memory_budget):
+                return file_name
+        return None
+
+    def time_limit(file_name):
+        # Share of the time left, None when the deadline has passed
+        remaining = started + deadline - time.time()
+        if remaining <= 0:
+            return None
+        left = costs[file_name] + sum(costs[other] for other in pending)
+        share = min(remaining, remaining * max_workers * 
+                    costs[file_name] / left)
+        return min(share, kwargs.get('time_limit') or share)
+
+    def error_record(file_name, error):
+        return {'file_id': os.path.splitext(file_name)[0], 
+                'road_shapefile': road_files[file_name], 
+                'population_shapefile': pop_files[file_name], 
+                'level': region_level(road_files[file_name]), 
+                'engine': engine, 'strategy': strategy, 
+                'status': 'error', 'error': error}
+
+    def retry(file_name):
+        # Queue a job hit by memory pressure again with a larger estimate
+        if attempts[file_name] >= max_retries:
+            return False
+        attempts[file_name] += 1
+        footprints[file_name] *= 2
+        pending.appendleft(file_name)
+        return True
+
+    # Show ISO3 in progress bar, advancing by estimated cost
+    running = {}
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    with tqdm(total=sum(costs.values()), unit='B', unit_scale=True, desc = 
+            f"Finding the PCST least cost path between population {iso3} nodes"
+            ) as progress:
+        while pending or running:
+            while len(running) < max_in_flight:
+                file_name = admit()
+                if file_name is None:
+                    break
+                pending.remove(file_name)
+                options = dict(kwargs)
+                if deadline is not None:
+                    options['time_limit'] = time_limit(file_name)
+                    if options['time_limit'] is None:
+                        record = error_record(file_name, "DeadlineExceeded: not "
+                                        "started before the batch deadline")
+                        record['estimated_cost'] = costs[file_name]
+                        record['attempts'] = attempts[file_name]
+                        progress.update(costs[file_name])
+                        records.append(record)
+                        continue
+                future = executor.submit(
+                    run_pcst_from_shapefiles,
+                    road_files[file_name],
+                    pop_files[file_name],
+                    output_folder,
+                    os.path.splitext(file_name)[0],
+                    strategy=strategy,
+                    engine=engine,
+                    stream=sink is not None,
+                    **options)
+                running[future] = file_name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = pressure = False
+            for future in done:
+                file_name = running.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # A worker was killed, most likely by the OOM killer, 
+                    # which takes every running job of the pool with it
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    if broken and retry(file_name):
+                        pressure = True
+                        continue
+                    record = error_record(file_name, '{}: {}'.format(
+                        type(e).__name__, e))
+                if (record['status'] == 'error' and 
+                        record['error'].startswith('MemoryError') and 
+                        retry(file_name)):
+                    pressure = True
+                    continue
+                record['estimated_cost'] = costs[file_name]
+                record['attempts'] = attempts[file_name] + 1
+                progress.update(costs[file_name])
+                records.append(record)
+
+                tables = record.pop('tables', None)
+                unwritten[record['file_id']] = {
+                    'status': record['status'], 'params': params, 
+                    'record': record}
+                written = [record['file_id']]
+                if tables is not None:
+                    written = sink.add(record['file_id'], 
+                                       record.get('level'), tables)
+                record_written(written)
+
+            if pressure and max_workers > 1:
+                max_workers = max(1, max_workers // 2)
+                max_in_flight = min(max_in_flight, max_workers 
+                                    if memory_budget is not None 
+                                    else 2 * max_workers)
+                print("⚠️ Workers ran out of memory, retrying with {} "
+                      "workers".format(max_workers))
+            if broken:
+                # Jobs still listed as running went down with the pool
+                for future, file_name in list(running.items()):
+                    running.pop(future)
+                    pending.appendleft(file_name)
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+
+        if sink:
+            record_written(sink.close())
+    executor.shutdown()
+
+    report_path = report_path or os.path.join(output_folder, 
+                                              'pcst_run_report.json')
+    write_run_report(records, report_path, iso3=iso3, engine=engine, 
+                     strategy=strategy, max_workers=max_workers, 
+                     wall_time=time.time() - started)
+
+    solved = [record for record in records if record['status'] == 'ok']
+    failed = [record for record in records if record['status'] == 'error']
+    print("{} of {} regions solved, {} skipped, run report written to {}"
+          .format(len(solved), len(records), 
+                  len(records) - len(solved) - len(failed), report_path))
+    for record in failed:
+        print("❌ {}: {}".format(record['file_id'], record['error']))
+    truncated = [record['file_id'] for record in solved 
+                 if record.get('truncated')]
+    if truncated:
+        print("{} regions ran out of time or iterations and kept the tree "
+              "found so far: {}".format(len(truncated), 
+                                        ', '.join(truncated[:10])))
+
+    if solved:
+        graph_bytes = [record['graph_bytes'] for record in solved]
+        print("Road graph memory per worker: {:.1f} MB peak, {:.1f} MB mean"
+              .format(max(graph_bytes) / 1e6, np.mean(graph_bytes) / 1e6))
+        print("Total {} objective (fiber m + missed prize): {:.6g}".format(
+            engine, sum(record['objective']['objective'] 
+                        for record in solved)))
+    warm = [record['warm_start'] for record in solved 
+            if 'warm_start' in record]
+    if warm:
+        print("Warm start reused {:.1f} of {:.1f} km of fiber in {} regions"
+              .format(sum(w.get('reused_km', 0) for w in warm), 
+                      sum(record['selected_km'] for record in solved 
+                          if 'warm_start' in record), 
+                      sum(w['previous_edges'] > 0 for w in warm)))
+    dropped = sum(record['snap']['dropped'] for record in records 
+                  if 'snap' in record)
+    if dropped:
+        print("{} settlements beyond the snap distance were dropped".format(
+            dropped))
+
+    return records
+
+
+def run_scenario_groups(groups, output_folder, max_workers=None, 
+                        resolution=0.01, graph_cache=None, desc=None, 
+                        **kwargs):
+    """
+    This function solves groups of scenarios sharing a road graph in one 
+    process pool.
+
+    Groups are dispatched in order. The graph of a group is loaded and 
+    published with `SharedGraph` when its first scenario is submitted and 
+    released once its last one finishes, so only the groups in flight 
+    hold a shared copy.
+
+    Parameters
+    ----------
+    groups : list
+        (road_shapefile, cost_model, scenarios) of each group, the 
+        scenarios being dicts with a `file_id`, a `population_shapefile` 
+        and the options of `run_pcst_from_shapefiles` they override.
+    output_folder : string
+        Folder receiving the solutions.
+    max_workers : int
+        Number of worker processes, defaults to the number of cores.
+    resolution, graph_cache
+        Graph options of `run_pcst_from_shapefiles`.
+    desc : string
+        Progress bar label.
+    **kwargs
+        Options of `run_pcst_from_shapefiles` common to all scenarios.
+
+    Returns
+    -------
+    records : list
+        Run record of every scenario, group by group in the order given, 
+        with the options it overrides under `scenario`.
+    shared_bytes : int
+        Size of the largest graph published.
+
+    """
+    fixed = {'road_shapefile', 'resolution', 'graph_cache', 'cost_model', 
+             'shared_graph', 'output_folder'}
+    file_ids = []
+    for _, _, scenarios in groups:
+        for scenario in scenarios:
+            if fixed & set(scenario):
+                raise ValueError("Scenarios share one road graph and cannot "
+                                 "set {}.".format(', '.join(sorted(
+                                     fixed & set(scenario)))))
+            file_ids.append(scenario['file_id'])
+    if len(set(file_ids)) < len(file_ids):
+        raise ValueError("Every scenario needs its own file_id.")
+
+    jobs = deque((g, i) for g, (_, _, scenarios) in enumerate(groups) 
+                 for i in range(len(scenarios)))
+    remaining = [len(scenarios) for _, _, scenarios in groups]
+    records = [[None] * len(scenarios) for _, _, scenarios in groups]
+    published, cost_models = {}, {}
+    shared_bytes = 0
+
+    max_workers = max_workers or os.cpu_count()
+    running = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, tqdm(
+            total=len(jobs), desc=desc) as progress:
+        while jobs or running:
+            while jobs and len(running) < 2 * max_workers:
+                g, i = jobs.popleft()
+                road_shapefile, cost_model, scenarios = groups[g]
+                if g not in published:
+                    try:
+                        cost_models[g] = load_cost_model(
+                            cost_model, os.path.basename(road_shapefile)[:3])
+                        published[g] = SharedGraph(load_road_graph(
+                            road_shapefile, resolution, graph_cache, 
+                            cost_model=cost_models[g]))
+                    except Exception as e:
+                        # Every scenario of the group fails the same way
+                        published[g] = e
+                    else:
+                        shared_bytes = max(shared_bytes, 
+                                           published[g].spec['nbytes'])
+                options = dict(kwargs, **scenarios[i])
+                if isinstance(published[g], Exception):
+                    future = executor.submit(raise_error, published[g])
+                else:
+                    future = executor.submit(
+                        run_pcst_from_shapefiles, road_shapefile, 
+                        options.pop('population_shapefile'), output_folder, 
+                        options.pop('file_id'), resolution=resolution, 
+                        cost_model=cost_models[g], 
+                        shared_graph=published[g].spec, **options)
+                running[future] = (g, i)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                g, i = running.pop(future)
+                road_shapefile, _, scenarios = groups[g]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {'file_id': scenarios[i]['file_id'], 
+                              'road_shapefile': road_shapefile, 
+                              'population_shapefile': 
+                                  scenarios[i]['population_shapefile'], 
+                              'status': 'error', 
+                              'error': '{}: {}'.format(type(e).__name__, e)}
+                record['scenario'] = {
+                    key: value for key, value in scenarios[i].items() 
+                    if key not in ('file_id', 'population_shapefile')}
+                records[g][i] = record
+                progress.update()
+
+                remaining[g] -= 1
+                if not remaining[g]:
+                    shared = published.pop(g)
+                    if isinstance(shared, SharedGraph):
+                        shared.unlink()
+
+    return [record for group in records for record in group], shared_bytes
+
+
+def raise_error(error):
+    """
+    This function raises an error in a worker, so a job failed before it 
+    started is reported like any other.
+
+    """
+    raise error
+
+
+def scenario_pcst_parallel(road_shapefile, scenarios, output_folder, 
+                           max_workers=None, resolution=0.01, 
+                           graph_cache=None, cost_model=None, 
+                           report_path=None, **kwargs):
+    """
+    This function solves many scenarios of one region, such as different 
+    population layers or prize settings, one process per scenario.
+
+    The road graph is loaded once in this process and published in shared 
+    memory with `SharedGraph`. The workers attach to it read-only, so no 
+    worker parses the street shapefile or holds its own copy of the base 
+    graph; each only keeps the snapped and contracted graph of its 
+    settlements, its prizes and its solution.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the regional street shapefile.
+    scenarios : list
+        One dict per scenario with a `file_id` naming its outputs, its 
+        `population_shapefile` and any options of 
+        `run_pcst_from_shapefiles` it overrides, e.g. `prize_weight`.
+    output_folder : string
+        Folder receiving the solutions.
+    max_workers : int
+        Number of worker processes, defaults to the number of cores.
+    resolution, graph_cache, cost_model
+        Graph options of `run_pcst_from_shapefiles`, shared by every 
+        scenario since they fix the graph.
+    report_path : string
+        Run report path, defaults to `pcst_scenario_report.json` in 
+        `output_folder`.
+    **kwargs
+        Options of `run_pcst_from_shapefiles` common to all scenarios.
+
+    Returns
+    -------
+    records : list
+        Run record of every scenario, in the order given.
+
+    """
+    started = time.time()
+    records, shared_bytes = run_scenario_groups(
+        [(road_shapefile, cost_model, scenarios)], output_folder, 
+        max_workers, resolution, graph_cache, 
+        desc=f"Solving {len(scenarios)} scenarios of "
+             f"{os.path.basename(road_shapefile)}", **kwargs)
+
+    report_path = report_path or os.path.join(output_folder, 
+                                              'pcst_scenario_report.json')
+    write_run_report([{key: value for key, value in record.items() 
+                       if key != 'tables'} for record in records], 
+                     report_path, road_shapefile=road_shapefile, 
+                     shared_graph_bytes=shared_bytes, 
+                     wall_time=time.time() - started)
+
+    solved = [record for record in records if record['status'] == 'ok']
+    print("{} of {} scenarios solved on one shared {:.1f} MB road graph, "
+          "run report written to {}".format(len(solved), len(records), 
+                                            shared_bytes / 1e6, report_path))
+    for record in records:
+        if record['status'] == 'error':
+            print("❌ {}: {}".format(record['file_id'], record['error']))
+
+    return records
+
+
+def scenario_label(value):
+    """
+    This function writes a threshold or prize weight as an exact and 
+    filename safe scenario id part: the integer when the value is whole, 
+    e.g. "1234567", its shortest round-trip form otherwise, with "p" for 
+    the decimal point and "m" for minus signs, e.g. "2p5" or "1em05".
+
+    Parameters
+    ----------
+    value : float
+        Scenario setting.
+
+    Returns
+    -------
+    label : string
+        Distinct for every distinct value.
+
+    """
+    value = float(value)
+    label = str(int(value)) if value.is_integer() else repr(value)
+
+    return label.replace('.', 'p').replace('-', 'm').replace('+', '')
+
+
+def scenario_matrix(roads_folder, population_folder, output_folder, 
+                    thresholds=(None,), prize_weights=(1000000,), 
+                    cost_models=None, max_workers=None, results_path=None, 
+                    resolution=0.01, graph_cache=None, **kwargs):
+    """
+    This function solves every combination of region, settlement 
+    threshold, prize weight and cost model, and collects the results in 
+    one tidy table.
+
+    Jobs are grouped by region and cost model, the two inputs of a road 
+    graph, so each graph is built once, shared by its scenarios through 
+    `run_scenario_groups` and released before the next group is loaded. 
+    Solutions are written per scenario id like the regions of 
+    `batch_pcst_parallel`.
+
+    Parameters
+    ----------
+    roads_folder : string
+        Folder holding the regional street shapefiles.
+    population_folder : string
+        Folder holding the regional population shapefiles.
+    output_folder : string
+        Folder receiving the solutions and the results table.
+    thresholds : list
+        Smallest settlement population solved for, None keeping every 
+        settlement, see `min_population` of `run_pcst_from_shapefiles`.
+    prize_weights : list
+        Multipliers converting population into metres of fiber.
+    cost_models : dict
+        Cost models keyed by the name used in the scenario ids, each a 
+        `gambit.costs.CostModel`, its arguments, an INI file or None for 
+        plain distance. Defaults to plain distance only.
+    max_workers : int
+        Number of worker processes, defaults to the number of cores.
+    results_path : string
+        Results table path, CSV or Parquet when it ends in `.parquet`. 
+        Defaults to `pcst_scenarios.csv` in `output_folder`.
+    resolution, graph_cache
+        Graph options of `run_pcst_from_shapefiles`.
+    **kwargs
+        Options of `run_pcst_from_shapefiles` common to all scenarios, such 
+        as `strategy` or `snap_to`.
+
+    Returns
+    -------
+    results : dataframe
+        One row per scenario keyed by `scenario_id`, with its region, 
+        threshold, prize weight and cost model, status, fiber km and cost, 
+        connected settlements and population, objective and wall time.
+
+    """
+    road_files = {os.path.basename(f): f for f in glob(os.path.join(roads_folder, '*.shp'))}
+    pop_files = {os.path.basename(f): f for f in glob(os.path.join(population_folder, '*.shp'))}
+    matching_files = sorted(set(road_files.keys()) & set(pop_files.keys()))
+    if not matching_files:
+        print("⚠️ No matching shapefiles found.")
+        return pd.DataFrame()
+
+    cost_models = cost_models or {'distance': None}
+    groups, keys = [], {}
+    for file_name in matching_files:
+        region = os.path.splitext(file_name)[0]
+        for cost_name, cost_model in cost_models.items():
+            scenarios = []
+            for threshold in thresholds:
+                for prize_weight in prize_weights:
+                    scenario_id = '{}_t{}_w{}_{}'.format(
+                        region, 'all' if threshold is None 
+                        else scenario_label(threshold), 
+                        scenario_label(prize_weight), cost_name)
+                    keys[scenario_id] = {
+                        'scenario_id': scenario_id, 'region': region, 
+                        'min_population': threshold, 
+                        'prize_weight': prize_weight, 
+                        'cost_model': cost_name}
+                    scenarios.append({
+                        'file_id': scenario_id, 
+                        'population_shapefile': pop_files[file_name], 
+                        'min_population': threshold, 
+                        'prize_weight': prize_weight})
+            groups.append((road_files[file_name], cost_model, scenarios))
+
+    records, _ = run_scenario_groups(
+        groups, output_folder, max_workers, resolution, graph_cache, 
+        desc=f"Solving {len(keys)} scenarios of {len(matching_files)} "
+             "regions", **kwargs)
+
+    rows = []
+    for record in records:
+        objective = record.get('objective', {})
+        rows.append(dict(
+            keys[record['file_id']], 
+            level=record.get('level'), status=record['status'], 
+            error=record['error'], truncated=record.get('truncated'), 
+            selected_km=record.get('selected_km'), 
+            selected_cost=record.get('selected_cost'), 
+            selected_settlements=record.get('selected_settlements'), 
+            connected_population=objective.get('prize_collected', np.nan) / 
+                keys[record['file_id']]['prize_weight'], 
+            objective=objective.get('objective'), 
+            wall_time=sum(record.get('timings', {}).values())))
+    results = pd.DataFrame(rows)
+
+    results_path = results_path or os.path.join(output_folder, 
+                                                'pcst_scenarios.csv')
+    folder = os.path.dirname(results_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if results_path.endswith('.parquet'):
+        results.to_parquet(results_path, index=False)
+    else:
+        results.to_csv(results_path, index=False)
+
+    failed = results[results['status'] == 'error']
+    print("{} of {} scenarios solved, results written to {}".format(
+        len(results) - len(failed), len(results), results_path))
+    for row in failed.itertuples():
+        print("❌ {}: {}".format(row.scenario_id, row.error))
+
+    return results
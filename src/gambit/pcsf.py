@@ -0,0 +1,394 @@
+import heapq
+import numpy as np
+
+
+def pcst_objective(graph, prizes, edges, nodes, trees=1, tree_cost=0.0):
+    """
+    This function evaluates a prize-collecting solution.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Weighted road graph.
+    prizes : array
+        Prize of every node.
+    edges : array
+        Ids of the selected edges.
+    nodes : array
+        Ids of the nodes covered by the solution.
+    trees : int
+        Number of trees in the solution.
+    tree_cost : float
+        Cost charged for each tree beyond the edge weights.
+
+    Returns
+    -------
+    objective : dict
+        Edge cost, collected and missed prize, the minimisation objective
+        (cost plus missed prize) and the net worth (prize minus cost).
+
+    """
+    prizes = np.asarray(prizes, dtype=np.float64)
+    cost = float(graph.edge_weights[np.asarray(edges, dtype=np.int64)].sum())
+    cost += trees * tree_cost if tree_cost else 0.0
+    collected = float(prizes[np.asarray(nodes, dtype=np.int64)].sum())
+    missed = float(prizes.sum()) - collected
+
+    return {'cost': cost, 'prize_collected': collected,
+            'prize_missed': missed, 'objective': cost + missed,
+            'net_worth': collected - cost, 'trees': int(trees)}
+
+
+def gw_pcsf(graph, prizes, root=None, tree_cost=None):
+    """
+    This function solves the prize-collecting Steiner tree or forest with
+    the Goemans-Williamson primal-dual scheme followed by strong pruning.
+
+    Growth follows the fast GW variant: every edge is split into two halves
+    whose events live in a mergeable heap per cluster, so a cluster that
+    stops growing only freezes its heap instead of rescheduling its edges.
+    Heaps are merged small-into-large, which keeps phase one near-linear in
+    the number of edges.
+
+    Parameters
+    ----------
+    graph : RoadGraph
+        Weighted road graph.
+    prizes : array
+        Non-negative prize of every node, in the units of the edge weights.
+    root : int
+        Node the tree must contain. Without a root the single most
+        profitable tree is returned.
+    tree_cost : float
+        When given (and no root), solve a forest in which every tree pays
+        this cost, through a virtual root linked to each prize node.
+
+    Returns
+    -------
+    edges : array
+        Ids of the selected edges.
+    nodes : array
+        Ids of the nodes covered by the solution.
+    trees : int
+        Number of trees in the solution.
+
+    """
+    prizes = np.asarray(prizes, dtype=np.float64)
+    n = graph.num_nodes
+    edge_u = graph.edges[:, 0].tolist()
+    edge_v = graph.edges[:, 1].tolist()
+    edge_cost = graph.edge_weights.tolist()
+    node_prize = prizes.tolist()
+
+    virtual = tree_cost is not None and root is None
+    if virtual:
+        root = n
+        terminals = np.flatnonzero(prizes > 0).tolist()
+        edge_u += [root] * len(terminals)
+        edge_v += terminals
+        edge_cost += [float(tree_cost)] * len(terminals)
+        node_prize.append(0.0)
+        n += 1
+
+    phase1 = _gw_growth(n, edge_u, edge_v, edge_cost, node_prize, root)
+    kept, anchor = strong_pruning(n, edge_u, edge_v, edge_cost, node_prize,
+                                  phase1, root)
+
+    real = graph.num_edges
+    covered = {edge_u[e] for e in kept} | {edge_v[e] for e in kept}
+    if anchor is not None:
+        covered.add(anchor)
+    if virtual:
+        covered.discard(root)
+        trees = sum(1 for e in kept if e >= real)
+    else:
+        trees = 1 if covered else 0
+
+    selected = np.array(sorted(e for e in kept if e < real), dtype=np.int64)
+    nodes = np.array(sorted(covered), dtype=np.int64)
+
+    return selected, nodes, trees
+
+
+def _gw_growth(n, edge_u, edge_v, edge_cost, node_prize, root):
+    """
+    Run the moat-growing phase and return the ids of the edges that merged
+    two clusters, in the order they became tight.
+
+    """
+    inf = float('inf')
+    m = len(edge_u)
+    max_clusters = 2 * n
+
+    active = [False] * max_clusters
+    start_time = [0.0] * max_clusters
+    end_time = [0.0] * max_clusters
+    moat = [0.0] * max_clusters
+    prize_sum = [0.0] * max_clusters
+    sub_moat = [0.0] * max_clusters
+    has_root = [False] * max_clusters
+    merged_into = [-1] * max_clusters
+    skip_up = [-1] * max_clusters
+    skip_sum = [0.0] * max_clusters
+    heaps = [None] * max_clusters
+    offsets = [0.0] * max_clusters
+    versions = [0] * max_clusters
+    part_version = [0] * (2 * m)
+
+    edge_events = []
+    deactivations = []
+
+    for v in range(n):
+        heaps[v] = []
+        prize_sum[v] = node_prize[v]
+        if v == root:
+            has_root[v] = True
+        elif node_prize[v] > 0:
+            active[v] = True
+            deactivations.append((node_prize[v], v))
+    heapq.heapify(deactivations)
+
+    for e in range(m):
+        half = 0.5 * edge_cost[e]
+        heaps[edge_u[e]].append((half, 0, 2 * e))
+        heaps[edge_v[e]].append((half, 0, 2 * e + 1))
+    for v in range(n):
+        heapq.heapify(heaps[v])
+        if active[v] and heaps[v]:
+            edge_events.append((heaps[v][0][0], v, 0))
+    heapq.heapify(edge_events)
+
+    num_clusters = n
+    phase1 = []
+    now = 0.0
+
+    def cluster_of(node):
+        # Walk the merge chain, summing the moats below the current cluster
+        if merged_into[node] < 0:
+            return node, 0.0
+        path = []
+        total = 0.0
+        c = node
+        while merged_into[c] >= 0:
+            if skip_up[c] < 0:
+                skip_up[c] = merged_into[c]
+                skip_sum[c] = moat[c]
+            path.append(c)
+            total += skip_sum[c]
+            c = skip_up[c]
+        remaining = total
+        for p in path:
+            step = skip_sum[p]
+            skip_up[p] = c
+            skip_sum[p] = remaining
+            remaining -= step
+        return c, total
+
+    def covered(node):
+        c, total = cluster_of(node)
+        if active[c]:
+            total += now - start_time[c]
+        else:
+            total += moat[c]
+        return c, total
+
+    def schedule(c):
+        # Drop stale entries and publish the cluster's next edge event
+        heap = heaps[c]
+        while heap and heap[0][1] != part_version[heap[0][2]]:
+            heapq.heappop(heap)
+        versions[c] += 1
+        if active[c] and heap:
+            heapq.heappush(edge_events, (heap[0][0] + offsets[c], c,
+                                         versions[c]))
+
+    def push_part(c, time, part):
+        part_version[part] += 1
+        heapq.heappush(heaps[c], (time - offsets[c], part_version[part],
+                                  part))
+
+    while True:
+        while edge_events and (not active[edge_events[0][1]] or
+                               edge_events[0][2] != versions[edge_events[0][1]]):
+            heapq.heappop(edge_events)
+        while deactivations and not active[deactivations[0][1]]:
+            heapq.heappop(deactivations)
+        if not edge_events and not deactivations:
+            break
+
+        next_edge = edge_events[0][0] if edge_events else inf
+        next_deactivation = deactivations[0][0] if deactivations else inf
+
+        if next_deactivation <= next_edge:
+            now, c = heapq.heappop(deactivations)
+            active[c] = False
+            end_time[c] = now
+            moat[c] = now - start_time[c]
+            versions[c] += 1
+            continue
+
+        now, c, _ = heapq.heappop(edge_events)
+        _, _, part = heapq.heappop(heaps[c])
+        e = part >> 1
+        this_node, other_node = ((edge_u[e], edge_v[e]) if part % 2 == 0
+                                 else (edge_v[e], edge_u[e]))
+        this_cluster, this_sum = covered(this_node)
+        other_cluster, other_sum = covered(other_node)
+
+        if this_cluster == other_cluster:
+            part_version[part ^ 1] += 1
+            schedule(c)
+            continue
+
+        remainder = edge_cost[e] - this_sum - other_sum
+        if remainder > 1e-9 * max(edge_cost[e], 1.0):
+            if active[other_cluster]:
+                event = now + remainder / 2
+                push_part(this_cluster, event, part)
+                push_part(other_cluster, event, part ^ 1)
+                schedule(other_cluster)
+            else:
+                push_part(this_cluster, now + remainder, part)
+                push_part(other_cluster, end_time[other_cluster], part ^ 1)
+            schedule(this_cluster)
+            continue
+
+        # The edge is tight: merge both clusters into a new one
+        phase1.append(e)
+        part_version[part ^ 1] += 1
+        new = num_clusters
+        num_clusters += 1
+        for old in (this_cluster, other_cluster):
+            if active[old]:
+                moat[old] = now - start_time[old]
+                active[old] = False
+            else:
+                offsets[old] += now - end_time[old]
+            merged_into[old] = new
+            versions[old] += 1
+
+        big, small = this_cluster, other_cluster
+        if len(heaps[small]) > len(heaps[big]):
+            big, small = small, big
+        heap, shift = heaps[big], offsets[small] - offsets[big]
+        for key, version, p in heaps[small]:
+            if version == part_version[p]:
+                heapq.heappush(heap, (key + shift, version, p))
+        heaps[new], offsets[new] = heap, offsets[big]
+        heaps[big] = heaps[small] = None
+
+        prize_sum[new] = prize_sum[this_cluster] + prize_sum[other_cluster]
+        sub_moat[new] = (sub_moat[this_cluster] + moat[this_cluster] +
+                         sub_moat[other_cluster] + moat[other_cluster])
+        has_root[new] = has_root[this_cluster] or has_root[other_cluster]
+        start_time[new] = now
+        potential = prize_sum[new] - sub_moat[new]
+
+        if has_root[new] or potential <= 0:
+            end_time[new] = now
+        else:
+            active[new] = True
+            heapq.heappush(deactivations, (now + potential, new))
+        schedule(new)
+
+    return phase1
+
+
+def strong_pruning(n, edge_u, edge_v, edge_cost, node_prize, phase1, root):
+    """
+    This function prunes a forest so that every subtree pays for the edge 
+    linking it: subtrees whose prize is below that edge's cost are cut. 
+    Without a root, each tree is rerooted at the node giving the most 
+    profitable subtree and only the best tree is kept.
+
+    Parameters
+    ----------
+    n : int
+        Number of nodes.
+    edge_u, edge_v, edge_cost : list
+        End nodes and cost of every edge.
+    node_prize : list
+        Prize of every node.
+    phase1 : list
+        Ids of the forest edges, such as the growth phase of `gw_pcsf` 
+        or a previous solution.
+    root : int
+        Node the solution must contain, None for the best tree.
+
+    Returns
+    -------
+    kept : list
+        Ids of the edges kept.
+    anchor : int
+        Node the solution hangs from, None when nothing is kept.
+
+    """
+    adjacency = {}
+    for e in phase1:
+        adjacency.setdefault(edge_u[e], []).append(e)
+        adjacency.setdefault(edge_v[e], []).append(e)
+
+    def walk(start):
+        # Depth-first order with the parent edge of every visited node
+        order, parent_edge = [start], {start: -1}
+        stack = [start]
+        while stack:
+            u = stack.pop()
+            for e in adjacency.get(u, ()):
+                v = edge_v[e] if edge_u[e] == u else edge_u[e]
+                if v not in parent_edge:
+                    parent_edge[v] = e
+                    order.append(v)
+                    stack.append(v)
+        return order, parent_edge
+
+    def net_value(order, parent_edge):
+        value = {v: node_prize[v] for v in order}
+        for v in reversed(order[1:]):
+            e = parent_edge[v]
+            gain = value[v] - edge_cost[e]
+            if gain > 0:
+                u = edge_v[e] if edge_u[e] == v else edge_u[e]
+                value[u] += gain
+        return value
+
+    def kept_edges(start):
+        order, parent_edge = walk(start)
+        value = net_value(order, parent_edge)
+        kept, reached = [], {start}
+        for v in order[1:]:
+            e = parent_edge[v]
+            u = edge_v[e] if edge_u[e] == v else edge_u[e]
+            if u in reached and value[v] - edge_cost[e] > 0:
+                reached.add(v)
+                kept.append(e)
+        return kept, value[start]
+
+    if root is not None:
+        return kept_edges(root)[0], root
+
+    best_value, best_root, seen = -float('inf'), None, set()
+    for start in adjacency:
+        if start in seen:
+            continue
+        order, parent_edge = walk(start)
+        seen.update(order)
+        down = net_value(order, parent_edge)
+        full = {start: down[start]}
+        for v in order[1:]:
+            e = parent_edge[v]
+            u = edge_v[e] if edge_u[e] == v else edge_u[e]
+            rest = full[u] - max(0.0, down[v] - edge_cost[e])
+            full[v] = down[v] + max(0.0, rest - edge_cost[e])
+        top = max(order, key=full.get)
+        if full[top] > best_value:
+            best_value, best_root = full[top], top
+
+    # A lone node can beat every tree, and may not touch any tight edge
+    top = max(range(n), key=node_prize.__getitem__, default=None)
+    if top is not None and node_prize[top] > best_value:
+        return [], top
+    if best_root is None:
+        return [], None
+
+    return kept_edges(best_root)[0], best_root
@@ -0,0 +1,1094 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import shapely
+from multiprocessing import shared_memory
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+LINE_TYPES = (shapely.GeometryType.LINESTRING, shapely.GeometryType.LINEARRING)
+GRAPH_ARRAYS = ('coords', 'edges', 'edge_weights', 'indptr', 'indices', 
+                'edge_ids', 'weights')
+GRAPH_FORMAT = 1
+CHAIN_ARRAYS = ('geom_ptr', 'geom_coords')
+SHAPEFILE_PARTS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+
+class NodeIndex:
+
+    """
+    This class maps coordinates to dense integer node ids. Coordinates are 
+    snapped to an integer grid of the given resolution, so vertices closer 
+    than the resolution share one id whatever float noise separates them, 
+    and keys compare as integers instead of hashing float tuples.
+    """
+
+
+    def __init__(self, resolution=0.01):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        resolution : float
+            Grid cell size in coordinate units, centimetres for EPSG:3857.
+        """
+        self.resolution = resolution
+        self.coords = np.zeros((0, 2), dtype=np.float64)
+        self._keys = np.zeros((0, 2), dtype=np.int64)
+        self._pack = None
+        self._sorted = None
+        self._order = None
+
+
+    def __len__(self):
+        return len(self.coords)
+
+
+    @classmethod
+    def from_coords(cls, coords, resolution=0.01):
+        """
+        Build an index holding the distinct grid cells of some coordinates.
+
+        """
+        index = cls(resolution)
+        index.add(coords)
+
+        return index
+
+
+    def keys(self, coords):
+        """
+        Return the (n, 2) int64 grid key of each coordinate.
+
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+        return np.rint(coords / self.resolution).astype(np.int64)
+
+
+    def unique(self, coords):
+        """
+        Group coordinates by grid cell without adding them to the index.
+
+        Returns
+        -------
+        first : array
+            Index of the first coordinate of each distinct cell.
+        inverse : array
+            Position of each coordinate's cell among the distinct cells.
+
+        """
+        keys = self.keys(coords)
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        packed, _ = _key_packer(keys)(keys)
+        _, first, inverse = np.unique(packed, return_index=True, 
+                                      return_inverse=True)
+
+        return first, inverse.reshape(-1)
+
+
+    def add(self, coords):
+        """
+        Return the id of each coordinate, giving new cells the next ids with 
+        the coordinate first seen in them.
+
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        ids = self.lookup(coords)
+        new = np.flatnonzero(ids < 0)
+        first, inverse = self.unique(coords[new])
+        ids[new] = len(self) + inverse
+
+        if len(first):
+            self.coords = np.concatenate([self.coords, coords[new[first]]])
+            self._keys = np.concatenate([self._keys, 
+                                         self.keys(coords[new[first]])])
+            self._sorted = None
+
+        return ids
+
+
+    def lookup(self, coords):
+        """
+        Return the id of each coordinate's cell, -1 when it is not indexed.
+
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        ids = np.full(len(coords), -1, dtype=np.int64)
+        if len(self) == 0 or len(coords) == 0:
+            return ids
+
+        if self._sorted is None:
+            # Sorted packed keys, rebuilt lazily after additions
+            self._pack = _key_packer(self._keys)
+            packed, _ = self._pack(self._keys)
+            self._order = np.argsort(packed, kind='stable')
+            self._sorted = packed[self._order]
+
+        packed, inside = self._pack(self.keys(coords))
+        position = np.minimum(np.searchsorted(self._sorted, packed), 
+                              len(self._sorted) - 1)
+        hit = inside & (self._sorted[position] == packed)
+        ids[hit] = self._order[position[hit]]
+
+        return ids
+
+
+def _key_packer(keys):
+    """
+    Return a function turning (n, 2) keys into one sortable value each.
+
+    Keys are packed into one int64 over the extent of the given keys when 
+    it allows, which sorts several times faster than rows; keys outside 
+    that extent are reported as such. Otherwise rows are viewed as 16-byte 
+    scalars.
+
+    """
+    low, high = keys.min(axis=0), keys.max(axis=0)
+    span = high - low + 1
+    if int(span[0]) * int(span[1]) < 2 ** 63:
+        def pack(query):
+            inside = np.all((query >= low) & (query <= high), axis=1)
+            offset = np.where(inside[:, None], query - low, 0)
+            return offset[:, 0] * span[1] + offset[:, 1], inside
+    else:
+        def pack(query):
+            packed = np.ascontiguousarray(query).view(
+                np.dtype((np.void, 16))).reshape(-1)
+            return packed, np.ones(len(query), dtype=bool)
+
+    return pack
+
+
+def line_segments(geometries):
+    """
+    This function extracts every straight segment of a set of geometries.
+
+    Multi-part geometries are exploded into their parts and polygons into 
+    their rings before the vertices are read, so no road is skipped.
+
+    Parameters
+    ----------
+    geometries : array
+        Shapely geometries, typically the geometry column of the roads.
+
+    Returns
+    -------
+    start : array
+        (k, 2) coordinates of the first vertex of each segment.
+    end : array
+        (k, 2) coordinates of the second vertex of each segment.
+    source : array
+        Index of the input geometry each segment comes from.
+
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    parts, part_source = shapely.get_parts(geometries, return_index=True)
+    types = shapely.get_type_id(parts)
+
+    polygons = types == shapely.GeometryType.POLYGON
+    rings, ring_part = shapely.get_rings(parts[polygons], return_index=True)
+    lines = np.isin(types, LINE_TYPES)
+    paths = np.concatenate([parts[lines], rings])
+    path_source = np.concatenate([part_source[lines], 
+                                  part_source[polygons][ring_part]])
+
+    coords, path_index = shapely.get_coordinates(paths, return_index=True)
+    within = np.flatnonzero(path_index[1:] == path_index[:-1])
+
+    return coords[within], coords[within + 1], path_source[path_index[within]]
+
+
+class RoadGraph:
+
+    """
+    This class holds an undirected road graph as integer node ids, a
+    coordinate array and a compressed sparse row (CSR) adjacency.
+
+    Edges are straight segments unless the graph was simplified by 
+    `contract_chains`, in which case the interior vertices of edge `i` are 
+    `geom_coords[geom_ptr[i]:geom_ptr[i + 1]]`, ordered from its first to 
+    its second end node.
+    """
+
+    geom_ptr = None
+    geom_coords = None
+
+
+    def __init__(self, coords, edges, edge_weights):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        coords : array
+            (n, 2) float64 node coordinates.
+        edges : array
+            (m, 2) node ids of each undirected edge, without duplicates.
+        edge_weights : array
+            (m,) float64 weight of each edge.
+        """
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64)
+        self.edges = np.ascontiguousarray(edges, dtype=np.int32)
+        self.edge_weights = np.ascontiguousarray(edge_weights,
+                                                 dtype=np.float64)
+
+        n = len(self.coords)
+        m = len(self.edges)
+        src = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        dst = np.concatenate([self.edges[:, 1], self.edges[:, 0]])
+        edge_ids = np.concatenate([np.arange(m, dtype=np.int32)] * 2)
+        order = np.argsort(src, kind='stable')
+
+        self.indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+        self.indices = dst[order].astype(np.int32)
+        self.edge_ids = edge_ids[order]
+        self.weights = self.edge_weights[self.edge_ids]
+
+
+    @classmethod
+    def from_edges(cls, coords, u, v, weights):
+        """
+        Build a graph from an unordered edge list, dropping self loops and
+        keeping the lightest of any parallel edges.
+
+        Arguments
+        ---------
+        coords : array
+            (n, 2) node coordinates.
+        u, v : array
+            End node ids of each edge.
+        weights : array
+            Weight of each edge.
+
+        Returns
+        -------
+        graph : RoadGraph
+            The compiled graph.
+
+        """
+        u = np.asarray(u, dtype=np.int64)
+        v = np.asarray(v, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        keep = u != v
+        lo = np.minimum(u, v)[keep]
+        hi = np.maximum(u, v)[keep]
+        weights = weights[keep]
+
+        order = np.lexsort((weights, hi, lo))
+        lo, hi, weights = lo[order], hi[order], weights[order]
+        first = np.ones(len(lo), dtype=bool)
+        first[1:] = (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+
+        return cls(coords, np.column_stack([lo[first], hi[first]]),
+                   weights[first])
+
+
+    @classmethod
+    def from_geometries(cls, geometries, resolution=0.01, multipliers=None):
+        """
+        Build a graph from line geometries in one vectorized pass.
+
+        Vertices are merged when they fall on the same cell of an integer 
+        grid of the given resolution, which also joins adjacent ways whose 
+        shared vertex differs only by float noise. Segment lengths are the 
+        edge weights, scaled by the multipliers when given.
+
+        Arguments
+        ---------
+        geometries : array
+            Shapely line, multi-line or polygon geometries.
+        resolution : float
+            Grid cell size in coordinate units, centimetres for EPSG:3857.
+        multipliers : array or callable
+            Cost per unit length of each geometry, or a function of the 
+            segment starts, ends and source geometries returning the cost 
+            per unit length of each segment.
+
+        Returns
+        -------
+        graph : RoadGraph
+            The compiled graph.
+
+        """
+        start, end, source = line_segments(geometries)
+        index = NodeIndex(resolution)
+        ids = index.add(np.concatenate([start, end]))
+        weights = np.hypot(*(end - start).T)
+        if callable(multipliers):
+            weights *= multipliers(start, end, source)
+        elif multipliers is not None:
+            weights *= np.asarray(multipliers, dtype=np.float64)[source]
+
+        return cls.from_edges(index.coords, ids[:len(start)], 
+                              ids[len(start):], weights)
+
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Rebuild a graph from its stored arrays without recompiling the CSR 
+        adjacency, so memory-mapped arrays stay memory-mapped.
+
+        """
+        graph = cls.__new__(cls)
+        for name in GRAPH_ARRAYS:
+            setattr(graph, name, arrays[name])
+
+        return graph
+
+
+    def save(self, folder):
+        """
+        Write each array of the graph as a .npy file in a folder, chain 
+        geometry included.
+
+        """
+        os.makedirs(folder, exist_ok=True)
+        for name in GRAPH_ARRAYS + CHAIN_ARRAYS:
+            if getattr(self, name) is not None:
+                np.save(os.path.join(folder, name + '.npy'), 
+                        getattr(self, name))
+
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """
+        Load a graph written by `save`, memory-mapping its arrays by default.
+
+        """
+        graph = cls.from_arrays({name: np.load(os.path.join(folder, name + 
+            '.npy'), mmap_mode=mmap_mode) for name in GRAPH_ARRAYS})
+        for name in CHAIN_ARRAYS:
+            path = os.path.join(folder, name + '.npy')
+            if os.path.exists(path):
+                setattr(graph, name, np.load(path, mmap_mode=mmap_mode))
+
+        return graph
+
+
+    @property
+    def num_nodes(self):
+        return len(self.coords)
+
+
+    @property
+    def num_edges(self):
+        return len(self.edges)
+
+
+    @property
+    def nbytes(self):
+        """
+        Total size of the graph arrays in bytes.
+
+        """
+        return sum(array.nbytes for array in (self.coords, self.edges,
+            self.edge_weights, self.indptr, self.indices, self.edge_ids,
+            self.weights, self.geom_ptr, self.geom_coords) 
+            if array is not None)
+
+
+    def memory_usage(self):
+        """
+        Summarise the graph size for run reports.
+
+        Returns
+        -------
+        usage : dict
+            Node and edge counts and the array footprint in bytes.
+
+        """
+        return {'graph_nodes': self.num_nodes, 'graph_edges': self.num_edges,
+                'graph_bytes': self.nbytes}
+
+
+    def add_edges(self, coords, u, v, weights):
+        """
+        Return a new graph with extra nodes appended after the existing ones
+        and extra edges added.
+
+        Arguments
+        ---------
+        coords : array
+            (k, 2) coordinates of the new nodes, numbered from `num_nodes`.
+        u, v : array
+            End node ids of each new edge.
+        weights : array
+            Weight of each new edge.
+
+        Returns
+        -------
+        graph : RoadGraph
+            The extended graph.
+
+        """
+        if self.geom_ptr is not None:
+            raise ValueError("Cannot add edges to a contracted graph.")
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+        return RoadGraph.from_edges(
+            np.concatenate([self.coords, coords]),
+            np.concatenate([self.edges[:, 0], np.asarray(u, dtype=np.int64)]),
+            np.concatenate([self.edges[:, 1], np.asarray(v, dtype=np.int64)]),
+            np.concatenate([self.edge_weights, weights]))
+
+
+    def snap_points(self, points, to='node', max_distance=None, 
+                    resolution=0.01):
+        """
+        Attach points to the graph with one spatial index query.
+
+        Each point is linked to its nearest vertex, or with `to='segment'` 
+        to its projection on the nearest edge, which is split at that 
+        location. Points closer than the resolution to their target become 
+        that node; points sharing a grid cell share one new node.
+
+        Arguments
+        ---------
+        points : array
+            (k, 2) point coordinates in the graph's coordinate system.
+        to : string
+            'node' or 'segment'.
+        max_distance : float
+            Points farther than this from the road network are not snapped.
+        resolution : float
+            Grid cell size used to merge coincident locations.
+
+        Returns
+        -------
+        graph : RoadGraph
+            Graph extended with the snapped points and their links.
+        nodes : array
+            Node id of each point, -1 when it was not snapped.
+        distances : array
+            Distance from each point to the road network.
+
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.num_edges == 0:
+            raise ValueError("Cannot snap points to a graph without edges.")
+
+        coords = [self.coords]
+        edges = [self.edges]
+        weights = [self.edge_weights]
+        n = self.num_nodes
+
+        if to == 'node':
+            distances, targets = cKDTree(self.coords).query(points)
+            distances = np.asarray(distances, dtype=np.float64)
+            targets = np.asarray(targets, dtype=np.int64)
+        elif to == 'segment':
+            (edges_list, weights_list, split_coords, targets, 
+             distances) = self._split_at_projections(points, max_distance, 
+                                                     resolution)
+            edges, weights = edges_list, weights_list
+            coords.append(split_coords)
+            n += len(split_coords)
+        else:
+            raise ValueError("Unknown snapping target '{}'.".format(to))
+
+        snapped = targets >= 0
+        if max_distance is not None:
+            snapped &= distances <= max_distance
+
+        target_coords = np.concatenate(coords)[np.maximum(targets, 0)]
+        index = NodeIndex(resolution)
+        on_road = snapped & np.all(index.keys(points) == 
+                                   index.keys(target_coords), axis=1)
+        off_road = np.flatnonzero(snapped & ~on_road)
+
+        nodes = np.full(len(points), -1, dtype=np.int64)
+        nodes[on_road] = targets[on_road]
+        first, inverse = index.unique(points[off_road])
+        new_ids = n + np.arange(len(first))
+        nodes[off_road] = new_ids[inverse]
+
+        links = off_road[first]
+        coords.append(points[links])
+        edges.append(np.column_stack([new_ids, targets[links]]))
+        weights.append(distances[links])
+
+        edges = np.concatenate(edges)
+        graph = RoadGraph.from_edges(np.concatenate(coords), edges[:, 0], 
+                                     edges[:, 1], np.concatenate(weights))
+
+        return graph, nodes, distances
+
+
+    def _split_at_projections(self, points, max_distance, resolution):
+        """
+        Project points onto their nearest edge and split the edges there.
+
+        Returns
+        -------
+        edges : list
+            Edge arrays of the split graph.
+        weights : list
+            Weight arrays matching the edges.
+        split_coords : array
+            Coordinates of the new split nodes, numbered from `num_nodes`.
+        targets : array
+            Node each point projects onto, -1 when none was found.
+        distances : array
+            Distance from each point to its projection.
+
+        """
+        n = self.num_nodes
+        segments = self.edge_geometries(np.arange(self.num_edges))
+        geoms = shapely.points(points)
+        (point_index, edge_index), found = shapely.STRtree(
+            segments).query_nearest(geoms, max_distance=max_distance, 
+                                    return_distance=True, all_matches=False)
+
+        nearest = np.full(len(points), -1, dtype=np.int64)
+        nearest[point_index] = edge_index
+        distances = np.full(len(points), np.inf)
+        distances[point_index] = found
+
+        hit = np.flatnonzero(nearest >= 0)
+        edge = nearest[hit]
+        fraction = shapely.line_locate_point(segments[edge], geoms[hit], 
+                                             normalized=True)
+        start = self.coords[self.edges[edge, 0]]
+        end = self.coords[self.edges[edge, 1]]
+        projected = start + fraction[:, None] * (end - start)
+
+        index = NodeIndex(resolution)
+        keys = index.keys(projected)
+        at_start = np.all(keys == index.keys(start), axis=1)
+        at_end = np.all(keys == index.keys(end), axis=1) & ~at_start
+        targets = np.full(len(points), -1, dtype=np.int64)
+        targets[hit[at_start]] = self.edges[edge[at_start], 0]
+        targets[hit[at_end]] = self.edges[edge[at_end], 1]
+
+        inner = np.flatnonzero(~at_start & ~at_end)
+        order = inner[np.lexsort((fraction[inner], edge[inner]))]
+        edge, fraction, keys = edge[order], fraction[order], keys[order]
+        new = np.ones(len(order), dtype=bool)
+        new[1:] = (edge[1:] != edge[:-1]) | np.any(keys[1:] != keys[:-1], 
+                                                   axis=1)
+        targets[hit[order]] = n + np.cumsum(new) - 1
+
+        split_edge, split_fraction = edge[new], fraction[new]
+        split_ids = n + np.arange(len(split_edge))
+        first = np.ones(len(split_edge), dtype=bool)
+        first[1:] = split_edge[1:] != split_edge[:-1]
+        last = np.ones(len(split_edge), dtype=bool)
+        last[:-1] = first[1:]
+
+        prev_ids = np.where(first, self.edges[split_edge, 0], split_ids - 1)
+        prev_fraction = np.where(first, 0.0, np.roll(split_fraction, 1))
+        edge_weights = self.edge_weights[split_edge]
+
+        kept = np.ones(self.num_edges, dtype=bool)
+        kept[split_edge] = False
+        edges = [self.edges[kept], 
+                 np.column_stack([prev_ids, split_ids]), 
+                 np.column_stack([split_ids[last], 
+                                  self.edges[split_edge[last], 1]])]
+        weights = [self.edge_weights[kept], 
+                   edge_weights * (split_fraction - prev_fraction), 
+                   edge_weights[last] * (1.0 - split_fraction[last])]
+
+        return edges, weights, projected[order][new], targets, distances
+
+
+    def contract_chains(self, protected=()):
+        """
+        Return a simplified graph in which every chain of degree-2 nodes is 
+        replaced by one edge carrying the chain's total weight and vertices.
+
+        Shortest paths between the remaining nodes are unchanged. Chains 
+        that close on themselves are dropped since a tree never uses them, 
+        and of two chains joining the same nodes only the lighter is kept.
+
+        Arguments
+        ---------
+        protected : array
+            Nodes kept whatever their degree, such as prize nodes and the 
+            root. Snap points before contracting, not after.
+
+        Returns
+        -------
+        graph : RoadGraph
+            The contracted graph, with the chain geometry of each edge.
+        node_map : array
+            Contracted id of each original node, -1 for removed nodes.
+
+        """
+        if self.geom_ptr is not None:
+            raise ValueError("The graph has already been contracted.")
+
+        n = self.num_nodes
+        degree = np.diff(self.indptr)
+        keep = degree != 2
+        keep[np.asarray(protected, dtype=np.int64)] = True
+        node_map = np.full(n, -1, dtype=np.int64)
+        node_map[keep] = np.arange(int(keep.sum()))
+
+        # Edges between kept nodes pass through as they are
+        direct = np.flatnonzero(keep[self.edges[:, 0]] & 
+                                keep[self.edges[:, 1]])
+
+        # Walk each chain from a kept node into a removed one
+        source = np.repeat(np.arange(n), degree)
+        starts = np.flatnonzero(keep[source] & ~keep[self.indices])
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        edge_ids = self.edge_ids.tolist()
+        weights = self.weights.tolist()
+        keep_list = keep.tolist()
+        used = bytearray(self.num_edges)
+
+        sources = source[starts].tolist()
+        chain_u, chain_v, chain_weights, interior = [], [], [], []
+        for start, slot in zip(sources, starts.tolist()):
+            edge = edge_ids[slot]
+            if used[edge]:
+                continue
+            used[edge] = 1
+            node, total, path = indices[slot], weights[slot], []
+            while not keep_list[node]:
+                path.append(node)
+                slot = indptr[node]
+                if edge_ids[slot] == edge:
+                    slot += 1
+                edge = edge_ids[slot]
+                used[edge] = 1
+                node, total = indices[slot], total + weights[slot]
+            if node != start:
+                chain_u.append(start)
+                chain_v.append(node)
+                chain_weights.append(total)
+                interior.append(path)
+
+        u = np.concatenate([self.edges[direct, 0], 
+                            np.array(chain_u, dtype=np.int64)])
+        v = np.concatenate([self.edges[direct, 1], 
+                            np.array(chain_v, dtype=np.int64)])
+        weights = np.concatenate([self.edge_weights[direct], chain_weights])
+        paths = [[]] * len(direct) + interior
+
+        # Orient every edge from its lower to its higher contracted id and 
+        # keep the lightest of parallel chains
+        u, v = node_map[u], node_map[v]
+        flip = u > v
+        lo, hi = np.where(flip, v, u), np.where(flip, u, v)
+        order = np.lexsort((weights, hi, lo))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = ((lo[order][1:] != lo[order][:-1]) | 
+                     (hi[order][1:] != hi[order][:-1]))
+        order = order[first]
+
+        flip = flip[order].tolist()
+        paths = [paths[i][::-1] if reverse else paths[i] 
+                 for i, reverse in zip(order.tolist(), flip)]
+        geom_ptr = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum([len(path) for path in paths], out=geom_ptr[1:])
+        vertices = np.fromiter((node for path in paths for node in path), 
+                               dtype=np.int64, count=int(geom_ptr[-1]))
+
+        graph = RoadGraph(self.coords[keep], 
+                          np.column_stack([lo[order], hi[order]]), 
+                          weights[order])
+        graph.geom_ptr = geom_ptr
+        graph.geom_coords = self.coords[vertices].reshape(-1, 2)
+
+        return graph, node_map
+
+
+    def components(self):
+        """
+        Label the connected components of the graph.
+
+        Returns
+        -------
+        count : int
+            Number of components, isolated nodes included.
+        labels : array
+            Component of each node.
+
+        """
+        return connected_components(self.to_csgraph(), directed=False)
+
+
+    def subgraph(self, nodes):
+        """
+        Return the graph induced by a subset of the nodes, keeping their 
+        order and the chain geometry of the kept edges.
+
+        Arguments
+        ---------
+        nodes : array
+            Boolean mask of the nodes to keep.
+
+        Returns
+        -------
+        graph : RoadGraph
+            The induced graph.
+        node_map : array
+            New id of each original node, -1 for removed nodes.
+        edge_ids : array
+            Original id of each edge of the induced graph.
+
+        """
+        keep = np.asarray(nodes, dtype=bool)
+        node_map = np.full(self.num_nodes, -1, dtype=np.int64)
+        node_map[keep] = np.arange(int(keep.sum()))
+        edge_ids = np.flatnonzero(keep[self.edges[:, 0]] & 
+                                  keep[self.edges[:, 1]])
+
+        graph = RoadGraph(self.coords[keep], node_map[self.edges[edge_ids]], 
+                          self.edge_weights[edge_ids])
+        if self.geom_ptr is not None:
+            counts = self.geom_ptr[edge_ids + 1] - self.geom_ptr[edge_ids]
+            graph.geom_ptr = np.zeros(len(edge_ids) + 1, dtype=np.int64)
+            np.cumsum(counts, out=graph.geom_ptr[1:])
+            source = np.repeat(self.geom_ptr[edge_ids] - graph.geom_ptr[:-1], 
+                               counts) + np.arange(int(graph.geom_ptr[-1]))
+            graph.geom_coords = self.geom_coords[source]
+
+        return graph, node_map, edge_ids
+
+
+    def nodes_at(self, coords, resolution=0.01):
+        """
+        Find the graph nodes lying on the grid cells of some coordinates.
+
+        Arguments
+        ---------
+        coords : array
+            (k, 2) coordinates in the graph's coordinate system.
+        resolution : float
+            Grid cell size the graph was built with.
+
+        Returns
+        -------
+        nodes : array
+            Node id at each coordinate, -1 where there is none.
+
+        """
+        index = NodeIndex(resolution)
+        ids = index.add(self.coords)
+        # Of nodes sharing a cell, the lowest id answers for it
+        first = np.full(len(index), -1, dtype=np.int64)
+        first[ids[::-1]] = np.arange(self.num_nodes)[::-1]
+        found = index.lookup(coords)
+
+        return np.where(found >= 0, first[np.maximum(found, 0)], -1)
+
+
+    def neighbors(self, node):
+        """
+        Return the neighbour ids, edge weights and edge ids of a node.
+
+        """
+        start, end = self.indptr[node], self.indptr[node + 1]
+
+        return (self.indices[start:end], self.weights[start:end],
+                self.edge_ids[start:end])
+
+
+    def edge_id(self, u, v):
+        """
+        Return the id of the edge joining two nodes.
+
+        """
+        nodes, _, edge_ids = self.neighbors(u)
+
+        return int(edge_ids[np.flatnonzero(nodes == v)[0]])
+
+
+    def to_csgraph(self):
+        """
+        Wrap the adjacency as a scipy sparse matrix without copying it.
+
+        """
+        return csr_matrix((self.weights, self.indices, self.indptr),
+                          shape=(self.num_nodes, self.num_nodes))
+
+
+    def edge_geometries(self, edge_ids):
+        """
+        Rebuild the linestring of each requested edge.
+
+        Arguments
+        ---------
+        edge_ids : array
+            Ids of the edges to export.
+
+        Returns
+        -------
+        geometries : array
+            Shapely linestrings in the graph's coordinate system.
+
+        """
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        if self.geom_ptr is None:
+            return shapely.linestrings(self.coords[self.edges[edge_ids]])
+
+        # End nodes framing the stored interior vertices of each edge
+        counts = self.geom_ptr[edge_ids + 1] - self.geom_ptr[edge_ids]
+        lengths = counts + 2
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        line = np.repeat(np.arange(len(edge_ids)), lengths)
+
+        coords = np.empty((int(lengths.sum()), 2))
+        coords[starts] = self.coords[self.edges[edge_ids, 0]]
+        coords[ends - 1] = self.coords[self.edges[edge_ids, 1]]
+        inner = np.ones(len(coords), dtype=bool)
+        inner[starts] = inner[ends - 1] = False
+        inner = np.flatnonzero(inner)
+        owner = line[inner]
+        coords[inner] = self.geom_coords[self.geom_ptr[edge_ids][owner] + 
+                                         inner - starts[owner] - 1]
+
+        return shapely.linestrings(coords, indices=line)
+
+
+def file_digest(path):
+    """
+    This function hashes the content of a file, together with the sidecar 
+    files when it is a shapefile.
+
+    Parameters
+    ----------
+    path : string
+        Path to the file.
+
+    Returns
+    -------
+    digest : string
+        Hex digest of the file contents.
+
+    """
+    stem, extension = os.path.splitext(path)
+    parts = SHAPEFILE_PARTS if extension.lower() == '.shp' else (extension,)
+    digest = hashlib.sha1()
+    for part in parts:
+        part_path = stem + part
+        if not os.path.exists(part_path):
+            continue
+        digest.update(part.encode())
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def file_mtime(path):
+    """
+    This function returns when a file was last modified, taking the newest 
+    of the sidecar files when it is a shapefile.
+
+    Parameters
+    ----------
+    path : string
+        Path to the file.
+
+    Returns
+    -------
+    mtime : float
+        Modification time in seconds since the epoch, None when missing.
+
+    """
+    stem, extension = os.path.splitext(path)
+    parts = SHAPEFILE_PARTS if extension.lower() == '.shp' else (extension,)
+    mtimes = [os.path.getmtime(stem + part) for part in parts 
+              if os.path.exists(stem + part)]
+
+    return max(mtimes) if mtimes else None
+
+
+class GraphCache:
+
+    """
+    This class keeps compiled road graphs on disk as folders of .npy 
+    arrays, `<road file>/<content digest>/<parameter key>`. A road file 
+    keeps one graph per set of build parameters, such as resolutions or 
+    cost models, and they are only dropped once its content changes.
+    """
+
+
+    def __init__(self, folder):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        folder : string
+            Root folder of the cache.
+        """
+        self.folder = folder
+
+
+    def key(self, **params):
+        """
+        Key of a set of build parameters.
+
+        """
+        params = dict(params, graph_format=GRAPH_FORMAT)
+
+        return hashlib.sha1(json.dumps(params, sort_keys=True, 
+                                       default=str).encode()).hexdigest()
+
+
+    def _entry(self, road_file):
+        return os.path.join(self.folder, 
+                            os.path.splitext(os.path.basename(road_file))[0])
+
+
+    def path(self, road_file, **params):
+        """
+        Folder of the graph of a road file built with the given parameters, 
+        which may also hold indexes derived from it.
+
+        """
+        return os.path.join(self._entry(road_file), file_digest(road_file), 
+                            self.key(**params))
+
+
+    def load(self, road_file, **params):
+        """
+        Return the cached graph of a road file, memory-mapped, or None when 
+        the file changed or was never built with these parameters.
+
+        """
+        path = self.path(road_file, **params)
+        if not os.path.isdir(path):
+            return None
+
+        return RoadGraph.load(path)
+
+
+    def store(self, road_file, graph, **params):
+        """
+        Store a graph, dropping the graphs of earlier contents of the same 
+        road file.
+
+        """
+        path = self.path(road_file, **params)
+        content = os.path.dirname(path)
+        os.makedirs(content, exist_ok=True)
+
+        staging = tempfile.mkdtemp(dir=content, prefix='.tmp-')
+        graph.save(staging)
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Another worker stored the same graph first
+            shutil.rmtree(staging, ignore_errors=True)
+
+        entry = os.path.dirname(content)
+        for name in os.listdir(entry):
+            if name != os.path.basename(content):
+                shutil.rmtree(os.path.join(entry, name), ignore_errors=True)
+
+
+# Shared memory blocks this process attached to, kept open for as long as 
+# graphs may view them
+_ATTACHED = {}
+
+
+class SharedGraph:
+
+    """
+    This class publishes the arrays of a road graph in one shared memory 
+    block, so that worker processes solving scenarios on the same region 
+    attach to a single read-only copy instead of each loading their own. 
+    Only the picklable `spec` is sent to the workers.
+    """
+
+
+    def __init__(self, graph):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        graph : RoadGraph
+            The graph to publish. Its arrays are copied once into the block.
+        """
+        names = [name for name in GRAPH_ARRAYS + CHAIN_ARRAYS 
+                 if getattr(graph, name) is not None]
+        layout, offset = {}, 0
+        for name in names:
+            array = getattr(graph, name)
+            layout[name] = (offset, array.dtype.str, array.shape)
+            # Keep every array 8-byte aligned
+            offset += -(-array.nbytes // 8) * 8
+
+        self.block = shared_memory.SharedMemory(create=True, 
+                                                size=max(offset, 1))
+        for name, (start, dtype, shape) in layout.items():
+            view = np.ndarray(shape, dtype=dtype, buffer=self.block.buf, 
+                              offset=start)
+            view[...] = getattr(graph, name)
+            del view
+        self.spec = {'name': self.block.name, 'arrays': layout, 
+                     'nbytes': offset}
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+
+    @staticmethod
+    def attach(spec):
+        """
+        Return a read-only graph viewing a block published by another 
+        process. The block stays mapped in this process until a graph of 
+        another block is attached and nothing views it any more.
+
+        """
+        for name in [name for name in _ATTACHED if name != spec['name']]:
+            try:
+                _ATTACHED[name].close()
+            except BufferError:
+                # Graphs of this block are still alive
+                continue
+            del _ATTACHED[name]
+        if spec['name'] not in _ATTACHED:
+            _ATTACHED[spec['name']] = shared_memory.SharedMemory(
+                name=spec['name'])
+        block = _ATTACHED[spec['name']]
+
+        arrays = {}
+        for name, (start, dtype, shape) in spec['arrays'].items():
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf, 
+                                      offset=start)
+            arrays[name].flags.writeable = False
+        graph = RoadGraph.from_arrays(arrays)
+        for name in CHAIN_ARRAYS:
+            if name in arrays:
+                setattr(graph, name, arrays[name])
+
+        return graph
+
+
+    def unlink(self):
+        """
+        Release the block. Workers still attached keep their mapping until 
+        they let go of it.
+
+        """
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
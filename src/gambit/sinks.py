@@ -0,0 +1,365 @@
+import os
+import shutil
+import sqlite3
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+SINK_TYPES = ('shapefile', 'gpkg', 'parquet')
+
+
+def region_level(road_shapefile):
+    """
+    This function returns the administrative level of a region from the
+    number of levels in its GID code, e.g. "SLE.1.1.11_1" is a sub-region.
+
+    Parameters
+    ----------
+    road_shapefile : string
+        Path to the regional street shapefile.
+
+    Returns
+    -------
+    level : string
+        'sub_regions', 'regions' or 'other'.
+
+    """
+    basename = os.path.splitext(os.path.basename(road_shapefile))[0]  # e.g. "SLE.1.1.11_1"
+    region_code = basename.split('_')[0]  # "SLE.1.1.11"
+    dot_count = region_code.count('.')  # Count dots
+
+    if dot_count == 3:
+        return 'sub_regions'
+    elif dot_count == 2:
+        return 'regions'
+
+    return 'other'
+
+
+def to_table(gdf):
+    """
+    This function splits a geodataframe into plain attributes and WKB
+    geometries, which pickle compactly between processes.
+
+    Parameters
+    ----------
+    gdf : geodataframe
+        Features to send.
+
+    Returns
+    -------
+    table : dict
+        Attribute dataframe, WKB array and CRS.
+
+    """
+    return {'attributes': pd.DataFrame(gdf.drop(columns=gdf.geometry.name)),
+            'wkb': shapely.to_wkb(gdf.geometry.values), 'crs': gdf.crs}
+
+
+def from_table(table):
+    """
+    This function rebuilds the geodataframe sent with `to_table`.
+
+    """
+    return gpd.GeoDataFrame(table['attributes'].reset_index(drop=True),
+                            geometry=shapely.from_wkb(table['wkb']),
+                            crs=table['crs'])
+
+
+class ResultSink(ABC):
+
+    """
+    This class collects the solution tables of many regions in the parent
+    process and writes them in batches. Subclasses implement `write` and
+    `discard`.
+    """
+
+
+    def __init__(self, path, batch_size=50, append=False):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        path : string
+            Output file or folder.
+        batch_size : int
+            Regions buffered before the tables are written.
+        append : bool
+            Add to the existing output instead of replacing every table
+            the first time it is written.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.append = append
+        self.pending = {}
+        self.pending_ids = []
+        self.started = set()
+        self.stale = set()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def add(self, file_id, level, tables):
+        """
+        Buffer the tables of one region, writing the buffer when full.
+
+        Arguments
+        ---------
+        file_id : string
+            Region identifier, stored in a `file_id` column.
+        level : string
+            Administrative level of the region, see `region_level`.
+        tables : dict
+            `to_table` output keyed by layer, 'edges' and 'nodes'.
+
+        Returns
+        -------
+        written : list
+            File ids of the regions written by this call.
+
+        """
+        for layer, table in tables.items():
+            gdf = from_table(table)
+            gdf.insert(0, 'file_id', file_id)
+            self.pending.setdefault((layer, file_id[:3], level), []).append(gdf)
+        self.pending_ids.append(file_id)
+
+        if len(self.pending_ids) >= self.batch_size:
+            return self.flush()
+
+        return []
+
+
+    def mark_stale(self, file_ids):
+        """
+        Discard the output of regions being solved again only when their 
+        new output is written, or when the sink closes, so it can still be 
+        read in the meantime, as warm starts do.
+
+        """
+        self.stale.update(file_ids)
+
+
+    def flush(self, final=False):
+        """
+        Write every buffered table.
+
+        Arguments
+        ---------
+        final : bool
+            Also discard the stale regions that got no new output.
+
+        Returns
+        -------
+        written : list
+            File ids of the regions written.
+
+        """
+        stale = self.stale if final else self.stale & set(self.pending_ids)
+        if stale:
+            self.discard(stale)
+            self.stale = self.stale - stale
+
+        for key, frames in self.pending.items():
+            gdf = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True),
+                                   crs=frames[0].crs)
+            self.write(key, gdf, replace=not self.append and
+                       key not in self.started)
+            self.started.add(key)
+
+        written, self.pending, self.pending_ids = self.pending_ids, {}, []
+
+        return written
+
+
+    def close(self):
+        """
+        Write what is left in the buffer.
+
+        """
+        return self.flush(final=True)
+
+
+    def outputs(self):
+        """
+        Paths whose modification time shows when the sink last wrote.
+
+        """
+        return [self.path]
+
+
+    @abstractmethod
+    def write(self, key, gdf, replace):
+        """
+        Write the buffered features of one output, country and level.
+
+        Arguments
+        ---------
+        key : tuple
+            Output layer, 'edges' or 'nodes', country code and level, e.g. 
+            ('edges', 'SLE', 'regions').
+        gdf : geodataframe
+            Features of every buffered region of the key, with their 
+            `file_id`.
+        replace : bool
+            Replace what an earlier run wrote for the key, otherwise add 
+            to it. Only the first write of a key in a fresh sink replaces.
+
+        """
+
+
+    @abstractmethod
+    def discard(self, file_ids):
+        """
+        Delete the features of regions solved again, before their new 
+        output is written.
+
+        Arguments
+        ---------
+        file_ids : set
+            Ids of the regions, some of which may have no output yet.
+
+        """
+
+
+class GeoPackageSink(ResultSink):
+
+    """
+    This class writes all solutions to one GeoPackage, with a layer per
+    output and level such as `edges_regions` or `nodes_sub_regions`.
+    """
+
+
+    def write(self, key, gdf, replace):
+        layer, _, level = key
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        mode = 'w' if replace or not os.path.exists(self.path) else 'a'
+        gdf.to_file(self.path, layer='{}_{}'.format(layer, level),
+                    driver='GPKG', mode=mode)
+
+
+    def discard(self, file_ids):
+        """
+        Delete the features of regions about to be written again.
+
+        """
+        if not file_ids or not os.path.exists(self.path):
+            return
+        file_ids = list(file_ids)
+        marks = ','.join('?' * len(file_ids))
+        with sqlite3.connect(self.path) as connection:
+            layers = [row[0] for row in connection.execute(
+                "SELECT table_name FROM gpkg_contents "
+                "WHERE data_type = 'features'")]
+            for layer in layers:
+                connection.execute('DELETE FROM "{}" WHERE file_id IN ({})'
+                                   .format(layer, marks), file_ids)
+
+
+class GeoParquetSink(ResultSink):
+
+    """
+    This class writes the solutions as a GeoParquet dataset partitioned by
+    output, country and level, e.g. `edges/iso3=SLE/level=regions/`, with
+    one part file per batch.
+    """
+
+
+    def partition(self, key):
+        layer, iso3, level = key
+
+        return os.path.join(self.path, layer, 'iso3={}'.format(iso3),
+                            'level={}'.format(level))
+
+
+    def write(self, key, gdf, replace):
+        folder = self.partition(key)
+        if replace and os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.makedirs(folder, exist_ok=True)
+
+        part = 1 + max((int(name.split('-')[1]) for name in os.listdir(folder)
+                        if name.startswith('part-')), default=-1)
+        self.write_part(gdf, os.path.join(folder, 'part-{:05d}-{}.parquet'
+                                          .format(part, gdf['file_id'].iloc[0])))
+
+
+    def write_part(self, gdf, part_path):
+        # Readers skip hidden files, so they never see a half-written part
+        folder, name = os.path.split(part_path)
+        temporary = os.path.join(folder, '.' + name)
+        gdf.to_parquet(temporary, index=False)
+        os.replace(temporary, part_path)
+
+
+    def discard(self, file_ids):
+        """
+        Rewrite the part files holding regions about to be written again.
+
+        """
+        file_ids = set(file_ids)
+        if not file_ids or not os.path.exists(self.path):
+            return
+        for folder, _, names in os.walk(self.path):
+            for name in names:
+                if name.startswith('.') or not name.endswith('.parquet'):
+                    continue
+                part_path = os.path.join(folder, name)
+                # Only the ids are read from parts left as they are
+                if not pd.read_parquet(part_path, columns=['file_id'])[
+                        'file_id'].isin(file_ids).any():
+                    continue
+                gdf = gpd.read_parquet(part_path)
+                stale = np.isin(gdf['file_id'], list(file_ids))
+                if stale.all():
+                    os.remove(part_path)
+                else:
+                    self.write_part(gdf[~stale], part_path)
+
+
+def make_sink(sink, output_folder, iso3, batch_size=50, append=False):
+    """
+    This function resolves the `sink` option of `batch_pcst_parallel`.
+
+    Parameters
+    ----------
+    sink : string or ResultSink
+        'shapefile' for one pair of shapefiles per region written by the
+        workers, 'gpkg' for `{iso3}_pcst_solutions.gpkg` or 'parquet' for
+        a `pcst_solutions` dataset in `output_folder`, or a sink instance.
+    output_folder : string
+        Folder receiving the solutions.
+    iso3 : string
+        Country code naming the GeoPackage.
+    batch_size : int
+        Regions buffered before each write.
+    append : bool
+        Keep the existing output, as when resuming a batch.
+
+    Returns
+    -------
+    sink : ResultSink
+        The sink, None when the workers write shapefiles.
+
+    """
+    if isinstance(sink, ResultSink) or sink is None or sink == 'shapefile':
+        return None if sink == 'shapefile' else sink
+    elif sink == 'gpkg':
+        return GeoPackageSink(os.path.join(output_folder,
+            '{}_pcst_solutions.gpkg'.format(iso3)), batch_size, append)
+    elif sink == 'parquet':
+        return GeoParquetSink(os.path.join(output_folder, 'pcst_solutions'),
+                              batch_size, append)
+
+    raise ValueError("Unknown result sink '{}'.".format(sink))
@@ -0,0 +1,538 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from glob import glob
+from gambit.optimizer import (run_pcst_from_shapefiles, estimate_job_cost,
+                              solver_parameters, write_run_report)
+from gambit.sinks import make_sink, GeoPackageSink
+
+JOB_STATES = ('pending', 'running', 'ok', 'error')
+QUEUE_SINKS = ('shapefile', 'parquet')
+
+
+class WorkQueue:
+
+    """
+    This class keeps PCST region jobs in an SQLite file on a filesystem
+    shared by every host. Workers claim jobs in an exclusive transaction,
+    so no two workers get the same region, refresh a heartbeat while they
+    hold them and hand back the run record. Jobs of workers whose heartbeat
+    went silent are put back in the queue by `requeue_stalled`.
+
+    SQLite locking over network filesystems relies on working POSIX locks,
+    hence the rollback journal rather than WAL, which needs shared memory
+    on a single host. Heartbeats compare wall clocks, so hosts should be
+    kept in sync well within the stall timeout.
+    """
+
+
+    def __init__(self, path, timeout=60):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        path : string
+            Queue database, created on first use.
+        timeout : float
+            Seconds to wait for another host holding the lock.
+        """
+        self.path = path
+        self.timeout = timeout
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with closing(self.connect()) as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    file_id TEXT PRIMARY KEY,
+                    road_shapefile TEXT NOT NULL,
+                    population_shapefile TEXT NOT NULL,
+                    output_folder TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    cost REAL DEFAULT 0,
+                    status TEXT DEFAULT 'pending',
+                    worker TEXT,
+                    claimed REAL,
+                    heartbeat REAL,
+                    attempts INTEGER DEFAULT 0,
+                    record TEXT)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status "
+                               "ON jobs (status, cost)")
+
+
+    def connect(self):
+        """
+        Open a connection in autocommit mode, transactions being explicit.
+
+        """
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None)
+        connection.row_factory = sqlite3.Row
+
+        return connection
+
+
+    def submit(self, jobs, replace=False):
+        """
+        Add region jobs to the queue.
+
+        Arguments
+        ---------
+        jobs : list
+            Dicts with file_id, road_shapefile, population_shapefile,
+            output_folder, options (JSON-serialisable solver keyword
+            arguments) and optionally cost, the claim priority.
+        replace : bool
+            Reset jobs already in the queue, finished ones included.
+
+        Returns
+        -------
+        added : int
+            Number of jobs added or reset.
+
+        """
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            added = 0
+            for job in jobs:
+                added += connection.execute(
+                    "{} INTO jobs (file_id, road_shapefile, "
+                    "population_shapefile, output_folder, options, cost) "
+                    "VALUES (?, ?, ?, ?, ?, ?)".format(verb),
+                    (job['file_id'], job['road_shapefile'],
+                     job['population_shapefile'], job['output_folder'],
+                     json.dumps(job.get('options', {}), sort_keys=True),
+                     job.get('cost', 0))).rowcount
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+        return added
+
+
+    def claim(self, worker):
+        """
+        Take the largest pending job for a worker.
+
+        Arguments
+        ---------
+        worker : string
+            Worker identifier.
+
+        Returns
+        -------
+        job : dict
+            The claimed job with its options decoded, None when no job is
+            pending.
+
+        """
+        now = time.time()
+        connection = self.connect()
+        try:
+            # The write lock is taken before reading, so the job read is
+            # still pending when it is marked as running
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' "
+                "ORDER BY cost DESC, file_id LIMIT 1").fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, "
+                    "claimed = ?, heartbeat = ?, attempts = attempts + 1 "
+                    "WHERE file_id = ?", (worker, now, now, row['file_id']))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+        if row is None:
+            return None
+        job = dict(row, status='running', worker=worker,
+                   attempts=row['attempts'] + 1)
+        job['options'] = json.loads(job['options'])
+
+        return job
+
+
+    def heartbeat(self, worker):
+        """
+        Mark every job held by a worker as alive.
+
+        Returns
+        -------
+        held : int
+            Number of jobs the worker still holds.
+
+        """
+        with closing(self.connect()) as connection:
+            return connection.execute(
+                "UPDATE jobs SET heartbeat = ? "
+                "WHERE worker = ? AND status = 'running'",
+                (time.time(), worker)).rowcount
+
+
+    def complete(self, file_id, worker, record):
+        """
+        Store the run record of a finished job.
+
+        A job requeued while its worker was silent and claimed by another
+        worker is left alone.
+
+        Returns
+        -------
+        stored : bool
+            Whether the worker still held the job.
+
+        """
+        status = 'error' if record.get('status') == 'error' else 'ok'
+        with closing(self.connect()) as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = ?, record = ?, heartbeat = ? "
+                "WHERE file_id = ? AND worker = ? AND status = 'running'",
+                (status, json.dumps(record, default=str), time.time(),
+                 file_id, worker)).rowcount == 1
+
+
+    def requeue_stalled(self, timeout, max_attempts=3):
+        """
+        Put back the jobs whose worker stopped sending heartbeats.
+
+        Arguments
+        ---------
+        timeout : float
+            Seconds of silence after which a worker is presumed dead.
+        max_attempts : int
+            Claims after which a job is failed instead, as it most likely
+            kills its worker.
+
+        Returns
+        -------
+        requeued : int
+            Number of jobs back in the queue.
+
+        """
+        limit = time.time() - timeout
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            stalled = connection.execute(
+                "SELECT file_id, worker, attempts FROM jobs "
+                "WHERE status = 'running' AND heartbeat < ?",
+                (limit,)).fetchall()
+            requeued = 0
+            for row in stalled:
+                if row['attempts'] >= max_attempts:
+                    record = {'file_id': row['file_id'], 'status': 'error',
+                              'error': 'WorkerLost: no heartbeat from {} '
+                              'after {} attempts'.format(row['worker'],
+                                                         row['attempts'])}
+                    connection.execute(
+                        "UPDATE jobs SET status = 'error', record = ? "
+                        "WHERE file_id = ?",
+                        (json.dumps(record), row['file_id']))
+                else:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'pending', worker = NULL "
+                        "WHERE file_id = ?", (row['file_id'],))
+                    requeued += 1
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+        return requeued
+
+
+    def counts(self):
+        """
+        Number of jobs in every state.
+
+        """
+        with closing(self.connect()) as connection:
+            counts = dict(connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+                ).fetchall())
+
+        return {status: counts.get(status, 0) for status in JOB_STATES}
+
+
+    def records(self):
+        """
+        Run records of the finished jobs, with the worker and attempts.
+
+        """
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT file_id, worker, attempts, record FROM jobs "
+                "WHERE record IS NOT NULL ORDER BY file_id").fetchall()
+
+        return [dict(json.loads(row['record']), worker=row['worker'],
+                     attempts=row['attempts']) for row in rows]
+
+
+    @contextmanager
+    def lock(self):
+        """
+        Hold the queue's write lock, so that workers rewriting shared
+        output do not interleave. Nothing may write to the queue from this
+        process meanwhile.
+
+        """
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            yield
+        finally:
+            connection.execute('ROLLBACK')
+            connection.close()
+
+
+class Heartbeat:
+
+    """
+    This class refreshes the heartbeat of a worker from a background thread
+    while the main thread is busy solving.
+    """
+
+
+    def __init__(self, queue, worker, interval=30):
+        """
+        A class constructor
+
+        Arguments
+        ---------
+        queue : WorkQueue
+            Queue holding the jobs.
+        worker : string
+            Worker identifier.
+        interval : float
+            Seconds between heartbeats.
+        """
+        self.queue = queue
+        self.worker = worker
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.thread.join()
+
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.queue.heartbeat(self.worker)
+            except sqlite3.OperationalError:
+                # Lock held too long by another host, try at the next beat
+                pass
+
+
+def enqueue_regions(queue_path, roads_folder, population_folder,
+                    output_folder, strategy='root', engine='greedy',
+                    sink='shapefile', replace=False, **kwargs):
+    """
+    This function queues a PCST job for every region with both a road and
+    a population shapefile, the distributed counterpart of
+    `batch_pcst_parallel`.
+
+    Parameters
+    ----------
+    queue_path : string
+        Queue database on the shared filesystem.
+    roads_folder : string
+        Folder of the regional road shapefiles.
+    population_folder : string
+        Folder of the regional population shapefiles.
+    output_folder : string
+        Folder receiving the solutions.
+    strategy, engine : string
+        Solver options, see `run_pcst_from_shapefiles`.
+    sink : string
+        'shapefile' or 'parquet'. A GeoPackage cannot take writes from
+        several hosts, so 'gpkg' is refused.
+    replace : bool
+        Queue regions already in the queue again.
+    **kwargs
+        Further JSON-serialisable options of `run_pcst_from_shapefiles`.
+
+    Returns
+    -------
+    added : int
+        Number of jobs queued.
+
+    """
+    if isinstance(sink, GeoPackageSink) or sink == 'gpkg':
+        raise ValueError("A GeoPackage has a single writer, use the "
+                         "'parquet' or 'shapefile' sink with the work queue.")
+    if sink not in QUEUE_SINKS:
+        raise ValueError("Unknown result sink '{}'.".format(sink))
+
+    road_files = {os.path.basename(f): f for f in glob(os.path.join(roads_folder, '*.shp'))}
+    pop_files = {os.path.basename(f): f for f in glob(os.path.join(population_folder, '*.shp'))}
+    matching_files = sorted(set(road_files.keys()) & set(pop_files.keys()))
+
+    options = solver_parameters(strategy=strategy, engine=engine, **kwargs)
+    options['sink'] = sink
+    jobs = [{'file_id': os.path.splitext(file_name)[0],
+             'road_shapefile': os.path.abspath(road_files[file_name]),
+             'population_shapefile': os.path.abspath(pop_files[file_name]),
+             'output_folder': os.path.abspath(output_folder),
+             'options': options,
+             'cost': estimate_job_cost(road_files[file_name],
+                                       pop_files[file_name])}
+            for file_name in matching_files]
+
+    return WorkQueue(queue_path).submit(jobs, replace=replace)
+
+
+def run_worker(queue_path, worker=None, graph_cache=None, batch_size=10,
+               heartbeat_interval=30, stall_timeout=300, poll_interval=10,
+               max_attempts=3):
+    """
+    This function pulls region jobs from a queue until none is left,
+    solving each with `run_pcst_from_shapefiles`. Start one per core on
+    every host sharing the queue.
+
+    Shapefiles are written per region as in the local batch. Parquet parts
+    are buffered per worker and named after their first region, so workers
+    never write the same file; a job is only completed once its part is on
+    disk, and held jobs keep their heartbeat until then. A worker finding
+    nothing to claim writes its buffer before waiting on other workers.
+    The rows a region got in an earlier run or attempt are discarded when
+    its new part is written, under the queue lock as it rewrites parts of
+    other workers.
+
+    Parameters
+    ----------
+    queue_path : string
+        Queue database on the shared filesystem.
+    worker : string
+        Worker identifier, defaults to host name and process id.
+    graph_cache : string
+        Road graph cache folder, best on the shared filesystem too.
+    batch_size : int
+        Regions buffered before a parquet part is written.
+    heartbeat_interval : float
+        Seconds between heartbeats.
+    stall_timeout : float
+        Seconds of silence after which jobs of another worker are requeued.
+    poll_interval : float
+        Seconds to wait when the only jobs left are running elsewhere.
+    max_attempts : int
+        Claims of a job before it is failed.
+
+    Returns
+    -------
+    records : list
+        Run records of the jobs this worker completed.
+
+    """
+    worker = worker or '{}:{}'.format(socket.gethostname(), os.getpid())
+    queue = WorkQueue(queue_path)
+    sinks = {}
+    held = {}
+    records = []
+
+    def complete(file_ids):
+        for file_id in file_ids:
+            record = held.pop(file_id)
+            if queue.complete(file_id, worker, record):
+                records.append(record)
+
+    def flush(final=False):
+        # Write every buffered region so its job can be completed
+        written = []
+        for sink in sinks.values():
+            if sink is not None:
+                with queue.lock():
+                    written += sink.close() if final else sink.flush()
+        complete(written)
+
+    with Heartbeat(queue, worker, heartbeat_interval):
+        while True:
+            queue.requeue_stalled(stall_timeout, max_attempts)
+            job = queue.claim(worker)
+            if job is None:
+                flush()
+                if not queue.counts()['running']:
+                    break
+                # Others may still die and leave their jobs to us
+                time.sleep(poll_interval)
+                continue
+
+            options = dict(job['options'])
+            sink_kind = options.pop('sink', 'shapefile')
+            key = (sink_kind, job['output_folder'])
+            if key not in sinks:
+                sinks[key] = make_sink(sink_kind, job['output_folder'],
+                                       job['file_id'][:3], batch_size,
+                                       append=True)
+            sink = sinks[key]
+            if sink and options.get('warm_start') is True:
+                options['warm_start'] = sink.path
+
+            try:
+                record = run_pcst_from_shapefiles(
+                    job['road_shapefile'], job['population_shapefile'],
+                    job['output_folder'], job['file_id'],
+                    graph_cache=graph_cache, stream=sink is not None,
+                    **options)
+            except Exception as e:
+                record = {'file_id': job['file_id'], 'status': 'error',
+                          'error': '{}: {}'.format(type(e).__name__, e)}
+            record['estimated_cost'] = job['cost']
+
+            tables = record.pop('tables', None)
+            held[job['file_id']] = record
+            written = [job['file_id']]
+            if tables is not None:
+                # Rows of an earlier run or attempt must not stay next to
+                # the new ones
+                sink.mark_stale([job['file_id']])
+                with queue.lock():
+                    written = sink.add(job['file_id'], record.get('level'),
+                                       tables)
+            complete(written)
+
+        flush(final=True)
+
+    return records
+
+
+def queue_report(queue_path, report_path, **metadata):
+    """
+    This function writes the run report of every finished job in a queue,
+    see `write_run_report`.
+
+    Returns
+    -------
+    counts : dict
+        Number of jobs in every state.
+
+    """
+    queue = WorkQueue(queue_path)
+    counts = queue.counts()
+    write_run_report(queue.records(), report_path, queue=counts, **metadata)
+
+    return counts